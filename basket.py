@@ -0,0 +1,316 @@
+from datetime import datetime
+from decimal import Decimal
+from typing import Any, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from catalog import CatalogItem
+from money import Money
+from promotions import PromotionRules, PromotionState
+from receipt_ids import ReceiptIdAllocator
+from receipt_record import make_receipt_record
+from receipt_store import ReceiptStore
+from tax import STANDARD, TaxTable
+
+
+class RunningTotals:
+    """Subtotal, VAT and total of a basket, kept up to date line by line.
+
+    ``add``, ``remove`` and ``change`` adjust the running total in pence
+    by the line total involved, so updating the totals costs the same for
+    a three-line basket as for a catering order of several hundred. The
+    total is the running sum of the lines, ``lines_pence``, less
+    ``discount_pence``, which the basket sets from its promotions.
+
+    The lines are also summed per tax class in ``by_class``, and the
+    discounts are split across the classes with ``set_discounts``. Each
+    VAT rate keeps its own running amount after discounts and the VAT in
+    it, taken out as ``make_receipt_record`` records it (see
+    ``TaxTable.analysis``); a change re-works the VAT of its own rate
+    only, so the screen agrees with the receipt at a step per change.
+
+    When ``line_totals`` is given it must return the tax class and pence
+    total of every line; every ``check_every`` changes, or once per line
+    in the basket if there are more, the running sums are compared with a
+    full sum of it and corrected (counting a mismatch) if they differ.
+    Spacing the checks by basket size keeps their cost constant per change.
+    """
+
+    def __init__(self, taxes: Optional[TaxTable] = None,
+                 line_totals: Optional[Callable[[], Iterable[Tuple[str, int]]]] = None,
+                 check_every: int = 100):
+        self.taxes = taxes or TaxTable()
+        self.line_totals = line_totals
+        self.check_every = check_every
+        self.lines = 0
+        self.mismatches = 0
+        self.clear()
+
+    @property
+    def total_pence(self) -> int:
+        return self.lines_pence - self.discount_pence
+
+    @property
+    def subtotal_pence(self) -> int:
+        return self.total_pence - self.vat_pence
+
+    def analysis(self) -> List[Tuple[Decimal, int, int]]:
+        """Return (rate, net, VAT) pence for each VAT rate in the basket, after discounts"""
+        present = sorted({self.taxes.rate_index(code) for code in self.by_class})
+        return [(self.taxes.rates_in_order[index], self._gross[index] - self._vat[index],
+                 self._vat[index]) for index in present]
+
+    @property
+    def rates(self) -> List[Decimal]:
+        return [rate for rate, _, _ in self.analysis()]
+
+    @property
+    def total(self) -> Money:
+        return Money(self.total_pence)
+
+    @property
+    def discount(self) -> Money:
+        return Money(self.discount_pence)
+
+    @property
+    def vat(self) -> Money:
+        return Money(self.vat_pence)
+
+    @property
+    def subtotal(self) -> Money:
+        return Money(self.subtotal_pence)
+
+    def add(self, line_pence: int, tax_class: str = STANDARD):
+        self.lines_pence += line_pence
+        self._add_class(tax_class, line_pence)
+        self.lines += 1
+        self._changed()
+
+    def remove(self, line_pence: int, tax_class: str = STANDARD):
+        self.lines_pence -= line_pence
+        self._add_class(tax_class, -line_pence)
+        self.lines -= 1
+        self._changed()
+
+    def change(self, old_pence: int, new_pence: int, tax_class: str = STANDARD):
+        self.lines_pence += new_pence - old_pence
+        self._add_class(tax_class, new_pence - old_pence)
+        self._changed()
+
+    def set_discounts(self, by_class: Dict[str, int]):
+        """Set the basket's discounts, split by tax class"""
+        if by_class == self.discount_by_class:
+            return
+        for code in set(by_class) | set(self.discount_by_class):
+            change = by_class.get(code, 0) - self.discount_by_class.get(code, 0)
+            if change:
+                self._add_gross(self.taxes.rate_index(code), -change)
+        self.discount_by_class = by_class
+        self.discount_pence = sum(by_class.values())
+
+    def clear(self):
+        self.lines_pence = 0
+        self.by_class: Dict[str, int] = {}
+        self.discount_pence = 0
+        self.discount_by_class: Dict[str, int] = {}
+        self.vat_pence = 0
+        self.lines = 0
+        self._changes = 0
+        # Per rate (see TaxTable.rate_index): amount after discounts, and its VAT
+        self._gross = [0] * len(self.taxes.rates_in_order)
+        self._vat = [0] * len(self.taxes.rates_in_order)
+
+    def _add_class(self, tax_class: str, pence: int):
+        gross = self.by_class.get(tax_class, 0) + pence
+        if gross:
+            self.by_class[tax_class] = gross
+        else:
+            self.by_class.pop(tax_class, None)
+        self._add_gross(self.taxes.rate_index(tax_class), pence)
+
+    def _add_gross(self, index: int, pence: int):
+        self._gross[index] += pence
+        vat = self.taxes.vat_at(index, self._gross[index])
+        self.vat_pence += vat - self._vat[index]
+        self._vat[index] = vat
+
+    def _changed(self):
+        self._changes += 1
+        if self.line_totals is not None and self._changes >= max(self.check_every, self.lines):
+            self.recompute()
+
+    def recompute(self) -> bool:
+        """Check the running sums against a full sum; return whether they matched"""
+        self._changes = 0
+        if self.line_totals is None:
+            return True
+        by_class: Dict[str, int] = {}
+        for tax_class, pence in self.line_totals():
+            by_class[tax_class] = by_class.get(tax_class, 0) + pence
+        by_class = {code: gross for code, gross in by_class.items() if gross}
+        if by_class == self.by_class and sum(by_class.values()) == self.lines_pence:
+            return True
+        print(f"Basket total drifted: running {self.lines_pence}, lines {sum(by_class.values())}")
+        self.mismatches += 1
+        lines, discounts = self.lines, self.discount_by_class
+        self.clear()
+        self.lines = lines
+        for tax_class, pence in by_class.items():
+            self.lines_pence += pence
+            self._add_class(tax_class, pence)
+        self.set_discounts(discounts)
+        return False
+
+
+class BasketLine(NamedTuple):
+    """One line of a sale, priced when it was added"""
+    name: str
+    price: Money
+    qty: int
+    total: Money
+    sku: str = ""
+    category: str = ""
+    # The VAT class it is charged at (see TaxTable.tax_class)
+    tax_class: str = STANDARD
+
+    @property
+    def key(self) -> str:
+        """Identifies the line in its basket; more of the SKU at this price joins it"""
+        return f"{self.sku}@{self.price.pence}"
+
+
+class Basket:
+    """The sale in progress: its lines and their running totals.
+
+    Holds no widgets, so the till window, the headless sale driver and
+    benchmarks share it. Lines are kept in a dict by ``BasketLine.key``
+    in the order first added: scanning an item again raises the quantity
+    of its line, and removing or re-counting a line is a dict lookup.
+    Lines keep the price they were added at, so an item whose price
+    changed mid-sale gets a second line at the new price.
+
+    Every change passes the units added or removed to ``promotions``,
+    which re-prices just the promotion covering that item, and the
+    resulting discount is taken off the running total.
+    """
+
+    def __init__(self, taxes: Optional[TaxTable] = None,
+                 promotions: Optional[PromotionRules] = None):
+        self.taxes = taxes or TaxTable()
+        self._lines: Dict[str, BasketLine] = {}
+        self.totals = RunningTotals(self.taxes, lambda: ((line.tax_class, line.total.pence)
+                                                         for line in self._lines.values()))
+        self.promotions = PromotionState(promotions or PromotionRules())
+
+    def __len__(self) -> int:
+        return len(self._lines)
+
+    def __iter__(self) -> Iterator[BasketLine]:
+        return iter(self._lines.values())
+
+    @property
+    def lines(self) -> List[BasketLine]:
+        return list(self._lines.values())
+
+    @property
+    def total(self) -> Money:
+        return self.totals.total
+
+    @property
+    def discounts(self) -> List[Tuple[str, Money]]:
+        """The (promotion name, amount off) lines the basket qualifies for"""
+        return self.promotions.discounts(self.totals.lines_pence)
+
+    def get(self, key: str) -> Optional[BasketLine]:
+        return self._lines.get(key)
+
+    def add(self, item: CatalogItem, qty: int) -> BasketLine:
+        """Add ``qty`` of a catalog item at its current price and return its line"""
+        if qty < 1:
+            raise ValueError("Quantity must be at least 1")
+        line = self._lines.get(f"{item.sku}@{item.price_pence}")
+        if line is not None:
+            return self._set_qty(line, line.qty + qty)
+        price = Money(item.price_pence)
+        line = BasketLine(item.name, price, qty, price * qty, item.sku, item.category,
+                          self.taxes.tax_class(item.tax_class))
+        self._lines[line.key] = line
+        self.totals.add(line.total.pence, line.tax_class)
+        self._promote(line, qty)
+        return line
+
+    def add_lines(self, lines: Iterable[Tuple[CatalogItem, int]]) -> List[BasketLine]:
+        return [self.add(item, qty) for item, qty in lines]
+
+    def set_qty(self, key: str, qty: int) -> BasketLine:
+        """Change the quantity of a line and return the updated line"""
+        if qty < 1:
+            raise ValueError("Quantity must be at least 1")
+        return self._set_qty(self._lines[key], qty)
+
+    def _set_qty(self, line: BasketLine, qty: int) -> BasketLine:
+        updated = line._replace(qty=qty, total=line.price * qty)
+        self._lines[line.key] = updated
+        self.totals.change(line.total.pence, updated.total.pence, line.tax_class)
+        self._promote(line, qty - line.qty)
+        return updated
+
+    def _promote(self, line: BasketLine, units: int):
+        promoted = self.promotions.change(line.sku, line.category, line.price.pence, units,
+                                          line.tax_class)
+        # Spend thresholds depend on every line; other discounts only on promoted ones
+        if promoted or self.promotions.rules.thresholds:
+            self.totals.set_discounts(self.promotions.discount_by_class(self.totals.by_class))
+
+    def remove(self, keys: Iterable[str]) -> List[BasketLine]:
+        """Remove the lines with the given keys and return them"""
+        removed = []
+        for key in keys:
+            line = self._lines.pop(key, None)
+            if line is not None:
+                self.totals.remove(line.total.pence, line.tax_class)
+                self._promote(line, -line.qty)
+                removed.append(line)
+        return removed
+
+    def clear(self):
+        self._lines = {}
+        self.totals.clear()
+        self.promotions.clear()
+
+
+class Checkout:
+    """Completes sales: numbers, records and saves each basket.
+
+    ``complete`` runs the whole save path the till uses (receipt id,
+    record, receipt store, search index) and raises instead of showing
+    dialogs. It leaves the basket as it is for the caller to clear.
+    Receipts, PDF and printed ones included, are rendered later from the
+    returned record (as stored), e.g. with ``receipt_pdf.render_receipt_pdf``.
+    """
+
+    def __init__(self, store: ReceiptStore, receipt_ids: ReceiptIdAllocator,
+                 search_index=None):
+        self.store = store
+        self.receipt_ids = receipt_ids
+        self.search_index = search_index
+
+    def build_record(self, basket: Basket, cashier: str,
+                     receipt_id: str = "", timestamp: Optional[datetime] = None,
+                     cashier_id: str = "") -> Dict[str, Any]:
+        return make_receipt_record(receipt_id, timestamp or datetime.now(), cashier,
+                                   basket.lines, basket.totals.analysis(), basket.discounts,
+                                   cashier_id)
+
+    def complete(self, basket: Basket, cashier: str,
+                 timestamp: Optional[datetime] = None, cashier_id: str = "") -> Dict[str, Any]:
+        """Save the basket as a sale and return its receipt record
+
+        ``cashier`` is the name printed on the receipt, ``cashier_id`` the login.
+        """
+        if not basket:
+            raise ValueError("No items to complete sale")
+        record = self.build_record(basket, cashier, self.receipt_ids.next_id(), timestamp,
+                                   cashier_id)
+        self.store.save(record)
+        if self.search_index is not None:
+            self.search_index.add(record)
+        return record
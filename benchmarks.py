@@ -0,0 +1,1485 @@
+import argparse
+import heapq
+import json
+import os
+import random
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from basket import Basket, Checkout, RunningTotals
+from catalog import ALL_CATEGORIES, Catalog, CatalogItem, check_digit_ok
+from catalog_binary import BinaryCatalog, compile_catalog
+from catalog_fuzzy import FuzzyIndex
+from catalog_watch import CatalogWatcher
+from checkout_pipeline import CheckoutPipeline
+from durability import DURABILITY_MODES, DurabilityPolicy
+from receipt_ids import ReceiptIdAllocator
+from receipt_journal import JournalReceiptStore
+from receipt_partitions import PartitionedReceiptStore
+from receipt_search import ReceiptSearchIndex
+from money import Money, apportion, vat_pence_of
+from print_spooler import DirectoryBackend, PrintSpooler
+from promotions import BuyGetFree, MealDeal, Multibuy, Units, read_rules
+from receipt_pdf import (ReceiptPdfRenderer, finish_receipt_pdf, receipt_table, render_receipt_pdf,
+                         start_receipt_pdf)
+from receipt_record import make_receipt_record, record_from_text, render_receipt_text
+from receipt_store import SQLiteReceiptStore, TextFileReceiptStore
+from scanner import ScanBuffer
+from tax import STANDARD, TaxTable
+from ui_updates import BasketDisplay
+
+# Benchmarks and stress checks for the till's storage and checkout code.
+# Run "python benchmarks.py --help" for the list; none of them need a display.
+
+
+def synthetic_receipt(receipt_id, cashier="bench", timestamp=None):
+    """Build a small receipt record like the one SupermarketTill saves"""
+    items = [("🍎 Apple", Money(250), 2, Money(500)),
+             ("🥝 Kiwi", Money(150), 1, Money(150))]
+    return make_receipt_record(receipt_id, timestamp or datetime.now(), cashier, items,
+                               TaxTable().analysis({STANDARD: 650}))
+
+
+def open_store(backend, workdir, durability=None):
+    if backend == "sqlite":
+        return SQLiteReceiptStore(os.path.join(workdir, "receipts.db"), durability=durability)
+    if backend == "journal":
+        return JournalReceiptStore(os.path.join(workdir, "journal"), durability=durability)
+    return PartitionedReceiptStore(workdir, durability=durability)
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def stress_receipt_ids(args):
+    """Complete many checkouts concurrently and check none are lost"""
+    workdir = tempfile.mkdtemp(prefix="till_ids_")
+    try:
+        state_path = os.path.join(workdir, "sequence.json")
+        store = open_store(args.backend, workdir)
+        allocator = ReceiptIdAllocator(state_path, till_id="T01", block_size=100)
+        per_thread = args.count // args.threads
+        issued = [[] for _ in range(args.threads)]
+
+        def lane(n):
+            for _ in range(per_thread):
+                receipt_id = allocator.next_id()
+                store.save(synthetic_receipt(receipt_id))
+                issued[n].append(receipt_id)
+
+        start = time.perf_counter()
+        workers = [threading.Thread(target=lane, args=(n,)) for n in range(args.threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - start
+        store.flush()
+
+        all_ids = [receipt_id for ids in issued for receipt_id in ids]
+        stored = {entry["id"] for entry in store.list_receipts()}
+        total = per_thread * args.threads
+        assert len(set(all_ids)) == total, "duplicate receipt ids issued"
+        assert stored == set(all_ids), f"{total - len(stored)} receipts lost"
+
+        # A restarted till (or one that crashed mid-block) must not reuse ids
+        restarted = ReceiptIdAllocator(state_path, till_id="T01", block_size=100)
+        assert restarted.next_id() > max(all_ids), "restart reissued an id"
+
+        print(f"{args.backend}: {total} checkouts on {args.threads} threads in "
+              f"{elapsed:.2f}s ({total / elapsed:,.0f}/s), none lost")
+        store.close()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def bench_durability(args):
+    """Compare receipt save throughput and latency per durability mode"""
+    print(f"{args.backend}, {args.count} sales on {args.threads} thread(s)")
+    print(f"{'mode':<6} {'sales/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8} "
+          f"{'syncs':>6}  power cut loses")
+    for mode in args.modes:
+        workdir = tempfile.mkdtemp(prefix="till_durability_")
+        try:
+            durability = DurabilityPolicy(mode, group_size=args.group_size,
+                                          group_delay_ms=args.group_ms)
+            store = open_store(args.backend, workdir, durability)
+            per_thread = args.count // args.threads
+            latencies = [[] for _ in range(args.threads)]
+
+            def lane(n):
+                for i in range(per_thread):
+                    record = synthetic_receipt(f"T{n:02d}-{i:010d}")
+                    start = time.perf_counter()
+                    store.save(record)
+                    latencies[n].append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            workers = [threading.Thread(target=lane, args=(n,)) for n in range(args.threads)]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+            # Throughput counts the time until the last sale is on disk
+            store.close()
+            elapsed = time.perf_counter() - start
+
+            samples = [latency * 1000 for lane_latencies in latencies
+                       for latency in lane_latencies]
+            total = len(samples)
+            print(f"{mode:<6} {total / elapsed:>9,.0f} {percentile(samples, 0.5):>8.3f} "
+                  f"{percentile(samples, 0.99):>8.3f} {max(samples):>8.3f} "
+                  f"{durability.syncs:>6}  {durability.describe_loss()}")
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+def bench_checkout(args):
+    """Time how long each sale holds up the lane: receipt, PDF and print in turn, or in the background"""
+    items = synthetic_catalog(2000)
+    print(f"{args.sales} sales of up to {args.lines} lines, {args.gap_ms} ms apart, {args.backend} "
+          f"store, {args.durability} durability; receipt text, a PDF to keep and one to print per sale")
+    for mode in ("in turn", "pipelined"):
+        workdir = tempfile.mkdtemp(prefix="till_checkout_")
+        try:
+            store = open_store(args.backend, workdir, DurabilityPolicy(args.durability))
+            checkout = Checkout(store, ReceiptIdAllocator(os.path.join(workdir, "sequence.json")))
+            printer = os.path.join(workdir, "printer")
+            os.makedirs(printer)
+            ready = {}
+
+            def printed(record):
+                # Stands in for printing: the till built a second PDF to send to the printer
+                render_receipt_pdf(record, os.path.join(printer, f"{record['id']}.pdf"))
+                ready[record["id"]] = time.perf_counter()
+
+            stages = [("save", lambda record: store.flush()),
+                      ("receipt", render_receipt_text),
+                      ("pdf", lambda record: render_receipt_pdf(
+                          record, os.path.join(workdir, f"{record['id']}.pdf"))),
+                      ("print", printed)]
+            pipeline = CheckoutPipeline()
+            rng = random.Random(12)
+            basket = Basket()
+            lane, submitted = [], {}
+            start = time.perf_counter()
+            for _ in range(args.sales):
+                for _ in range(rng.randint(1, args.lines)):
+                    basket.add(rng.choice(items), rng.randint(1, 3))
+                sale_start = time.perf_counter()
+                record = checkout.complete(basket, "bench")
+                if mode == "in turn":
+                    for _, stage in stages:
+                        stage(record)
+                else:
+                    pipeline.submit(record, stages)
+                basket.clear()
+                lane.append((time.perf_counter() - sale_start) * 1000)
+                submitted[record["id"]] = sale_start
+                # The next customer's items being scanned
+                time.sleep(args.gap_ms / 1000)
+            pipeline.close()
+            elapsed = time.perf_counter() - start
+            failed = [result for result in pipeline.check() if result.error]
+            assert not failed and len(os.listdir(printer)) == args.sales, failed
+
+            printed_after = [(ready[receipt_id] - when) * 1000 for receipt_id, when in submitted.items()]
+            print(f"{mode:<9}: lane held p50 {percentile(lane, 0.5):7.2f} ms, p99 "
+                  f"{percentile(lane, 0.99):7.2f} ms; receipt printed p50 "
+                  f"{percentile(printed_after, 0.5):7.1f} ms after the sale, p99 "
+                  f"{percentile(printed_after, 0.99):7.1f} ms; {args.sales / elapsed:5.1f} sales/s")
+            store.close()
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+class FlakyPrinter(DirectoryBackend):
+    """A directory printer that refuses a share of the jobs it is given, to exercise retries"""
+
+    def __init__(self, directory, failure, seed=13):
+        super().__init__(directory)
+        self.failure = failure
+        self.rng = random.Random(seed)
+
+    def print_file(self, path):
+        if self.rng.random() < self.failure:
+            raise OSError("printer offline")
+        super().print_file(path)
+
+
+def bench_print(args):
+    """Queue bursts of receipts on the print spooler against a flaky stand-in printer"""
+    workdir = tempfile.mkdtemp(prefix="till_print_")
+    try:
+        printer = FlakyPrinter(os.path.join(workdir, "printer"), args.failure)
+        spooler = PrintSpooler(printer, os.path.join(workdir, "spool"), max_jobs=args.queue,
+                               retries=args.retries, backoff_ms=args.backoff_ms)
+        items = synthetic_catalog(500)
+        rng = random.Random(14)
+        basket = Basket()
+        records = []
+        for n in range(args.jobs // 2):
+            basket.clear()
+            for _ in range(rng.randint(1, 20)):
+                basket.add(rng.choice(items), rng.randint(1, 3))
+            records.append(Checkout(None, None).build_record(basket, "bench", f"T01-{n:010d}"))
+        submits, accepted, refused = [], 0, 0
+        start = time.perf_counter()
+        # Each receipt is printed twice in quick succession, as a reprint would be
+        for n, record in enumerate(records + records):
+            before = time.perf_counter()
+            job = spooler.submit(record)
+            submits.append((time.perf_counter() - before) * 1e6)
+            if job is None:
+                refused += 1
+            else:
+                accepted += 1
+            if n % args.burst == args.burst - 1:
+                time.sleep(args.pause_ms / 1000)
+        spooler.wait()
+        elapsed = time.perf_counter() - start
+        results = spooler.check()
+        stats = spooler.stats()
+
+        printed = [name for name in os.listdir(printer.directory) if name.endswith(".pdf")]
+        assert len(printed) == stats["printed"] == accepted - stats["failed"], (len(printed), stats)
+        assert len(results) == accepted and not os.listdir(spooler.spool_dir)
+        print(f"{accepted} jobs queued in bursts of {args.burst} ({refused} refused, queue of "
+              f"{args.queue}); printer refuses {args.failure:.0%} of attempts")
+        print(f"submit (UI thread) p50 {percentile(submits, 0.5):.1f} us, p99 "
+              f"{percentile(submits, 0.99):.1f} us; deepest queue {stats['max_depth']}")
+        print(f"printed {stats['printed']} ({len(set(printed))} separate files), "
+              f"{stats['retried']} retries, {stats['failed']} given up; submit to printed "
+              f"p50 {stats['p50_ms']:.0f} ms, p99 {stats['p99_ms']:.0f} ms; "
+              f"{stats['printed'] / elapsed:.1f} receipts/s")
+        spooler.close()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def bench_pdf(args):
+    """Render receipt PDFs from scratch each time vs. with the cached font and template"""
+    items = synthetic_catalog(500)
+    rng = random.Random(15)
+    basket = Basket()
+    records = []
+    for n in range(args.receipts):
+        basket.clear()
+        for _ in range(rng.randint(1, args.lines)):
+            basket.add(rng.choice(items), rng.randint(1, 3))
+        records.append(Checkout(None, None).build_record(basket, "bench", f"T01-{n:010d}"))
+
+    renderer = ReceiptPdfRenderer()
+
+    def uncached(record, path):
+        finish_receipt_pdf(start_receipt_pdf(), record, path)
+
+    workdir = tempfile.mkdtemp(prefix="till_pdf_")
+    try:
+        print(f"{args.receipts} receipts of 1-{args.lines} lines, {args.threads} thread(s)")
+        pages = {}
+        for mode, render in (("uncached", uncached), ("cached", renderer.render)):
+            times, sizes = [], []
+            first = None
+
+            def run(share):
+                for n, record in share:
+                    path = os.path.join(workdir, f"{mode}-{n}.pdf")
+                    before = time.perf_counter()
+                    render(record, path)
+                    times.append((time.perf_counter() - before) * 1000)
+                    sizes.append(os.path.getsize(path))
+
+            if mode == "cached":
+                # The first receipt reads the font and builds the template
+                before = time.perf_counter()
+                renderer.render(records[0], os.path.join(workdir, "first.pdf"))
+                first = (time.perf_counter() - before) * 1000
+            numbered = list(enumerate(records))
+            threads = [threading.Thread(target=run, args=(numbered[i::args.threads],))
+                       for i in range(args.threads)]
+            start = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - start
+            pages[mode] = [open(os.path.join(workdir, f"{mode}-{n}.pdf"), 'rb').read().count(b"/Type /Page\n")
+                           for n in range(len(records))]
+            print(f"{mode:<9}: {len(records) / elapsed:6.1f} receipts/s; per receipt p50 "
+                  f"{percentile(times, 0.5):6.1f} ms, p99 {percentile(times, 0.99):6.1f} ms; "
+                  f"{sum(sizes) / len(sizes) / 1024:5.1f} KB"
+                  + (f"; first receipt {first:.0f} ms" if first is not None else ""))
+        assert pages["cached"] == pages["uncached"], "page counts differ"
+        print(f"font cut {renderer.subsets} time(s)")
+    finally:
+        renderer.close()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def bench_partitions(args):
+    """Time opening today's receipts as the history grows, flat vs. partitioned
+
+    Also times fetching the oldest receipt by id from the opened partitioned store.
+    """
+    today = datetime.now().replace(microsecond=0)
+    print(f"{args.per_day} receipts a day; time to open the store and list today's receipts")
+    print(f"{'days':>6} {'flat ms':>9} {'partitioned ms':>15} {'oldest by id ms':>16}")
+    for days in args.days:
+        workdir = tempfile.mkdtemp(prefix="till_partitions_")
+        try:
+            flat_dir = os.path.join(workdir, "flat")
+            flat = TextFileReceiptStore(flat_dir)
+            partitioned = PartitionedReceiptStore(os.path.join(workdir, "partitioned"))
+            for day in range(days):
+                stamp = today - timedelta(days=days - 1 - day)
+                for n in range(args.per_day):
+                    record = synthetic_receipt(f"T01-{day * args.per_day + n:010d}",
+                                               timestamp=stamp - timedelta(seconds=n))
+                    flat.save(record)
+                    partitioned.save(record)
+            partitioned.close()
+
+            timings = []
+            for open_store_at in (lambda: TextFileReceiptStore(flat_dir),
+                                  lambda: PartitionedReceiptStore(partitioned.receipts_dir)):
+                start = time.perf_counter()
+                store = open_store_at()
+                receipts = store.list_receipts(start=today.strftime("%Y-%m-%d"))
+                store.list_page(0, 50)
+                timings.append((time.perf_counter() - start) * 1000)
+                assert len(receipts) == args.per_day, "wrong receipts listed for today"
+            start = time.perf_counter()
+            oldest = store.get_record(f"T01-{0:010d}")
+            lookup = (time.perf_counter() - start) * 1000
+            assert oldest is not None, "oldest receipt not found by id"
+            print(f"{days:>6} {timings[0]:>9.2f} {timings[1]:>15.2f} {lookup:>16.2f}")
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+def ean13(n):
+    """Return a valid EAN-13 barcode for item number ``n``"""
+    base = f"50{n:010d}"
+    return next(base + str(d) for d in range(10) if check_digit_ok(base + str(d)))
+
+
+def synthetic_catalog(skus, categories=40):
+    """Build a price book of made-up, scannable items spread over ``categories``"""
+    rng = random.Random(42)
+    syllables = ["ba", "co", "di", "fe", "gu", "ha", "ki", "lo", "me", "nu", "pa", "ri",
+                 "so", "ta", "ve", "zo"]
+    items = []
+    for n in range(skus):
+        words = ["".join(rng.choice(syllables) for _ in range(rng.randint(2, 4))).title()
+                 for _ in range(rng.randint(1, 3))]
+        # A quarter of the categories zero rated, one in eight at the reduced rate
+        category = n % categories
+        tax_class = "Z" if category < categories // 4 else "R" if category < categories * 3 // 8 else ""
+        items.append(CatalogItem(f"{n:06d}", f"{' '.join(words)} {n}",
+                                 f"Category {category:02d}", rng.randint(10, 5000),
+                                 (ean13(n),), str(3000 + n) if n < 1000 else "", tax_class))
+    return items
+
+
+def bench_catalog(args):
+    """Time catalog loading, category switches and type-ahead lookups"""
+    items = synthetic_catalog(args.skus)
+    start = time.perf_counter()
+    catalog = Catalog(items)
+    print(f"{len(catalog)} SKUs indexed in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    rng = random.Random(7)
+    categories = [ALL_CATEGORIES] + catalog.categories
+    switches, keystrokes = [], []
+    for _ in range(args.repeat):
+        category = rng.choice(categories)
+        start = time.perf_counter()
+        catalog.search("", category)
+        switches.append((time.perf_counter() - start) * 1000)
+
+        # Type a real item name one character at a time
+        name = rng.choice(items).name
+        for length in range(1, min(len(name), 8) + 1):
+            start = time.perf_counter()
+            catalog.search(name[:length], category)
+            keystrokes.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    fuzzy = FuzzyIndex(catalog.names())
+    print(f"trigram index built in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    # Misspell one word of a real name by dropping or doubling a letter
+    lookups, found = [], 0
+    for _ in range(args.repeat):
+        name = rng.choice(items).name
+        word = rng.choice(name.split()[:-1]).lower()
+        i = rng.randrange(len(word))
+        typo = word[:i] + word[i + 1:] if rng.random() < 0.5 else word[:i] + word[i] + word[i:]
+        start = time.perf_counter()
+        suggestions = fuzzy.suggest(typo)
+        lookups.append((time.perf_counter() - start) * 1000)
+        found += any(word in suggestion.lower().split() for suggestion in suggestions)
+
+    for label, samples in (("category switch", switches), ("keystroke", keystrokes),
+                           ("fuzzy lookup", lookups)):
+        print(f"{label:<16} p50 {percentile(samples, 0.5):.3f} ms  "
+              f"p99 {percentile(samples, 0.99):.3f} ms  max {max(samples):.3f} ms")
+    print(f"misspelt word found in the top 10 suggestions for {found * 100 / len(lookups):.0f}% of lookups")
+
+
+# Run in a fresh interpreter so nothing is cached; prints load ms and peak RSS
+COLD_START = """
+import resource, sys, time
+start = time.perf_counter()
+if sys.argv[1] == "csv":
+    from catalog import Catalog
+    catalog = Catalog.load(sys.argv[2])
+else:
+    from catalog_binary import BinaryCatalog
+    catalog = BinaryCatalog(sys.argv[2])
+catalog.get_sku(sys.argv[3])
+catalog.search("ba")
+elapsed = (time.perf_counter() - start) * 1000
+try:
+    # ru_maxrss survives exec on Linux, so it would include this benchmark's own peak
+    with open("/proc/self/status") as f:
+        rss = next(int(line.split()[1]) * 1024 for line in f if line.startswith("VmHWM"))
+except OSError:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(elapsed, rss)
+"""
+
+
+def write_catalog_csv(path, items):
+    import csv
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(["sku", "name", "category", "price", "barcode", "plu", "tax_class"])
+        for item in items:
+            writer.writerow([item.sku, item.name, item.category, f"{item.price_pence / 100:.2f}",
+                             "|".join(item.barcodes), item.plu, item.tax_class])
+
+
+def bench_catalog_load(args):
+    """Compare cold start and memory of the CSV and compiled catalogs"""
+    workdir = tempfile.mkdtemp(prefix="till_catalog_")
+    try:
+        items = synthetic_catalog(args.skus)
+        csv_path = os.path.join(workdir, "catalog.csv")
+        write_catalog_csv(csv_path, items)
+        start = time.perf_counter()
+        size = compile_catalog(Catalog.load(csv_path), os.path.join(workdir, "catalog.bin"))
+        print(f"{args.skus} SKUs: CSV {os.path.getsize(csv_path):,} bytes, compiled "
+              f"{size:,} bytes in {time.perf_counter() - start:.1f}s")
+
+        here = os.path.dirname(os.path.abspath(__file__))
+        for label, path in (("csv", csv_path), ("binary", os.path.join(workdir, "catalog.bin"))):
+            runs = []
+            for _ in range(args.repeat):
+                output = subprocess.run([sys.executable, "-c", COLD_START, label, path, items[-1].sku],
+                                        cwd=here, capture_output=True, text=True, check=True).stdout
+                elapsed, rss = output.split()
+                runs.append((float(elapsed), int(rss)))
+            elapsed = sorted(run[0] for run in runs)[len(runs) // 2]
+            rss = max(run[1] for run in runs)
+            print(f"{label:<7} load + first lookup {elapsed:8.1f} ms   peak RSS {rss / 2 ** 20:6.1f} MiB")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def bench_catalog_reload(args):
+    """Time applying a price book update in place against rebuilding the catalog"""
+    workdir = tempfile.mkdtemp(prefix="till_catalog_")
+    try:
+        items = synthetic_catalog(args.skus)
+        csv_path = os.path.join(workdir, "catalog.csv")
+        write_catalog_csv(csv_path, items)
+        compile_catalog(Catalog(items), os.path.join(workdir, "catalog.bin"))
+
+        # A typical push: some price changes, a few new lines and a few delisted ones
+        rng = random.Random(4)
+        updated = list(items)
+        for i in rng.sample(range(len(updated)), args.changes):
+            updated[i] = updated[i]._replace(price_pence=updated[i].price_pence + 10)
+        delisted = {item.sku for item in rng.sample(updated, args.changes // 10)}
+        updated = [item for item in updated if item.sku not in delisted]
+        updated += [item._replace(sku=f"NEW{item.sku}", name=f"New {item.name}",
+                                  barcodes=(), plu="") for item in rng.sample(items, args.changes // 10)]
+
+        start = time.perf_counter()
+        Catalog(updated)
+        print(f"{args.skus} SKUs, rebuild from scratch: {(time.perf_counter() - start) * 1000:8.1f} ms")
+
+        for label, catalog in (("csv", Catalog(items)),
+                               ("binary", BinaryCatalog(os.path.join(workdir, "catalog.bin")))):
+            write_catalog_csv(csv_path, items)
+            watcher = CatalogWatcher(csv_path, catalog)
+            write_catalog_csv(csv_path, updated)
+            os.utime(csv_path, ns=(time.time_ns(), time.time_ns() + 10 ** 9))
+            start = time.perf_counter()
+            watcher.check()
+            while watcher._reading:
+                time.sleep(0.001)
+            read = time.perf_counter() - start
+            start = time.perf_counter()
+            diff = watcher.check()
+            applied = time.perf_counter() - start
+            sample = rng.choice(diff.changed)[1]
+            assert catalog.get_sku(sample.sku) == sample and len(catalog) == len(updated)
+            print(f"{label:<7} read + diff (background) {read * 1000:8.1f} ms   "
+                  f"apply {len(diff.changed)} changed, {len(diff.added)} added, "
+                  f"{len(diff.removed)} removed (UI thread) {applied * 1000:6.1f} ms")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def bench_scanner(args):
+    """Feed a simulated scanner stream through the scan buffer"""
+    items = synthetic_catalog(args.skus)
+    catalog = Catalog(items)
+    rng = random.Random(3)
+    basket = []
+    buffer = ScanBuffer(catalog, basket.extend, max_errors=args.count)
+
+    # Bursts as a scanner delivers them: mostly barcodes, some PLUs typed
+    # in, and a few misreads or unknown items
+    bursts = []
+    for _ in range(args.count // args.burst):
+        burst = []
+        for _ in range(args.burst):
+            roll = rng.random()
+            item = rng.choice(items)
+            if roll < args.unknown:
+                burst.append(ean13(args.skus + rng.randint(0, 10 ** 6)))
+            elif item.plu and roll < 0.2:
+                burst.append(item.plu)
+            else:
+                burst.append(item.barcodes[0])
+        bursts.append(burst)
+
+    flushes = []
+    start = time.perf_counter()
+    for burst in bursts:
+        burst_start = time.perf_counter()
+        for code in burst:
+            buffer.push(code)
+        # What the flush timer would do once the burst goes quiet
+        buffer.flush()
+        flushes.append((time.perf_counter() - burst_start) * 1000)
+    elapsed = time.perf_counter() - start
+
+    print(f"{buffer.scans} scans in bursts of {args.burst} against {len(catalog)} SKUs: "
+          f"{buffer.scans / elapsed:,.0f} scans/s sustained")
+    print(f"burst to basket p50 {percentile(flushes, 0.5):.3f} ms, p99 {percentile(flushes, 0.99):.3f} ms; "
+          f"{len(basket)} basket lines, {len(buffer.errors)} codes sent to the error queue")
+
+
+class SimulatedLoop:
+    """Tk's ``after`` and ``after_idle`` on a simulated clock, so display timings need no Tk"""
+
+    def __init__(self):
+        self.now = 0.0
+        self._queue = []
+        self._order = 0
+
+    def clock(self):
+        return self.now
+
+    def after(self, delay_ms, callback):
+        self._order += 1
+        heapq.heappush(self._queue, (self.now + delay_ms / 1000, self._order, callback))
+
+    def after_idle(self, callback):
+        self.after(0, callback)
+
+    def run_until(self, when):
+        while self._queue and self._queue[0][0] <= when:
+            due, _, callback = heapq.heappop(self._queue)
+            self.now = max(self.now, due)
+            callback()
+        self.now = max(self.now, when)
+
+
+class CountingWidgets:
+    """Stands in for the till's Treeview and summary labels, counting the calls that redraw"""
+
+    def __init__(self):
+        self.rows = []
+        self.values = {}
+        self.texts = {}
+        self.calls = 0
+        self._next = 0
+
+    def insert(self, parent, index, iid=None, values=(), tags=()):
+        self.calls += 1
+        if iid is None:
+            self._next += 1
+            iid = f"I{self._next:03d}"
+        self.rows.insert(len(self.rows) if index == "end" else index, iid)
+        self.values[iid] = values
+        return iid
+
+    def item(self, iid, values=()):
+        self.calls += 1
+        self.values[iid] = values
+
+    def delete(self, *iids):
+        self.calls += 1
+        for iid in iids:
+            self.rows.remove(iid)
+            del self.values[iid]
+
+    def index(self, iid):
+        return self.rows.index(iid)
+
+    def label(self, name):
+        widgets = self
+
+        class Label:
+            def config(self, text):
+                widgets.calls += 1
+                widgets.texts[name] = text
+        return Label()
+
+
+def bench_display(args):
+    """Time scan-to-screen and count redraws for a scan stream, drawing per batch or per frame"""
+    items = synthetic_catalog(args.skus)
+    catalog = Catalog(items)
+    rules = read_rules(synthetic_promotions(items))
+    names = ("savings", "subtotal", "vat", "total")
+    for rate in args.rates:
+        rng = random.Random(11)
+        stock = rng.sample(items, args.distinct)
+        scans, when = [], 0.0
+        while when < args.seconds:
+            scans.append((when, rng.choice(stock).barcodes[0]))
+            when += rng.uniform(0.5, 1.5) / rate
+
+        for flush_ms in args.scan_flush_ms:
+            for mode in ("per batch", "per frame"):
+                loop = SimulatedLoop()
+                widgets = CountingWidgets()
+                labels = {name: widgets.label(name) for name in names}
+                basket = Basket(promotions=rules)
+                display = BasketDisplay(basket, widgets, labels, idle=loop.after_idle,
+                                        schedule=loop.after, frame_ms=args.frame_ms,
+                                        clock=loop.clock)
+                drawn = {"redraws": 0, "promotions": [], "latencies": []}
+
+                def draw_batch(lines):
+                    # As the till drew before: the batch's rows, then every promotion and label
+                    for line in basket.add_lines(lines):
+                        values = (line.name, f"£{line.price}", line.qty, f"£{line.total}")
+                        if line.key in widgets.values:
+                            widgets.item(line.key, values=values)
+                        else:
+                            widgets.insert("", "end", iid=line.key, values=values)
+                    widgets.delete(*drawn["promotions"])
+                    drawn["promotions"] = [widgets.insert("", "end", values=(name, "", "", f"-£{amount}"))
+                                           for name, amount in basket.discounts]
+                    for name, text in display.summary_values().items():
+                        if name in labels:
+                            labels[name].config(text=text)
+                    drawn["redraws"] += 1
+                    drawn["latencies"] += [(loop.now - since) * 1000 for since in buffer.pushed_at]
+
+                def draw_per_frame(lines):
+                    for line in basket.add_lines(lines):
+                        display.show(line)
+                    display.refresh(buffer.pushed_at)
+
+                buffer = ScanBuffer(catalog, draw_batch if mode == "per batch" else draw_per_frame,
+                                    loop.after, flush_ms=flush_ms, clock=loop.clock)
+                start = time.perf_counter()
+                for when, code in scans:
+                    loop.run_until(when)
+                    buffer.push(code)
+                loop.run_until(args.seconds + 1)
+                elapsed = time.perf_counter() - start
+
+                shown = [iid for iid in widgets.rows if basket.get(iid)]
+                assert shown == [line.key for line in basket]
+                assert widgets.values[shown[-1]][2] == basket.lines[-1].qty
+                assert widgets.texts["total"] == f"Total: £{basket.total}"
+                assert len(widgets.rows) - len(shown) == len(basket.discounts)
+                if mode == "per batch":
+                    redraws, latencies = drawn["redraws"], drawn["latencies"]
+                else:
+                    redraws, latencies = display.flushes, list(display.latencies)
+                print(f"{rate:>4} scans/s, scan buffer {flush_ms:>2} ms, drawn {mode:<9}: "
+                      f"{redraws / args.seconds:5.1f} redraws/s, {widgets.calls / len(scans):4.1f} "
+                      f"widget calls/scan; scan to screen p50 {percentile(latencies, 0.5):5.1f} ms, "
+                      f"p99 {percentile(latencies, 0.99):5.1f} ms; {elapsed / len(scans) * 1e6:5.1f} us/scan")
+
+
+def bench_totals(args):
+    """Compare the running totals and VAT analysis with re-scanning the basket after every change"""
+    taxes = TaxTable()
+    classes = list(taxes.rates)
+    rng = random.Random(5)
+    for size in args.lines:
+        lines = []
+        for _ in range(size):
+            price_pence, qty = rng.randint(10, 5000), rng.randint(1, 12)
+            lines.append((rng.choice(classes), price_pence * qty))
+        removals = [rng.randrange(size - n) for n in range(size // 2)]
+
+        # Re-scan: sum every line by tax class again after each add and remove
+        def rescan(items):
+            by_class = {}
+            for tax_class, pence in items:
+                by_class[tax_class] = by_class.get(tax_class, 0) + pence
+            analysis = taxes.analysis(by_class)
+            return sum(vat for _, _, vat in analysis)
+
+        items = []
+        start = time.perf_counter()
+        for line in lines:
+            items.append(line)
+            rescanned_vat = rescan(items)
+        for index in removals:
+            items.pop(index)
+            rescanned_vat = rescan(items)
+        full = (time.perf_counter() - start) / (size + len(removals))
+
+        items = []
+        totals = RunningTotals(taxes, lambda: items)
+        start = time.perf_counter()
+        for tax_class, pence in lines:
+            items.append((tax_class, pence))
+            totals.add(pence, tax_class)
+            vat, subtotal = totals.vat_pence, totals.subtotal_pence
+        for index in removals:
+            tax_class, pence = items.pop(index)
+            totals.remove(pence, tax_class)
+            vat, subtotal = totals.vat_pence, totals.subtotal_pence
+        running = (time.perf_counter() - start) / (size + len(removals))
+        # The amounts last shown must be the re-scan's, and add up
+        assert totals.recompute() and vat == rescanned_vat == rescan(items)
+        assert subtotal + vat == sum(pence for _, pence in items)
+
+        print(f"{size:>5} lines: full recompute {full * 1e6:8.1f} us/change, "
+              f"running totals {running * 1e6:6.1f} us/change ({full / running:.1f}x)")
+
+
+def bench_basket(args):
+    """Compare a SKU-keyed basket with one line per scan on bulk purchases"""
+    items = synthetic_catalog(args.skus)
+    rng = random.Random(6)
+    stock = rng.sample(items, args.distinct)
+    scans = [rng.choice(stock) for _ in range(args.scans)]
+    removals = [item.sku for item in rng.sample(stock, args.distinct // 5)]
+
+    # One tuple per scan, found again by scanning the list, as before
+    lines = []
+    start = time.perf_counter()
+    for item in scans:
+        price = Decimal(item.price_pence) / 100
+        lines.append((item.name, price, 1, price, item.sku))
+    added = time.perf_counter() - start
+    start = time.perf_counter()
+    for sku in removals:
+        lines = [line for line in lines if line[4] != sku]
+    removed = time.perf_counter() - start
+    print(f"line per scan: {len(lines):>6} lines, add {added / len(scans) * 1e6:6.2f} us/scan, "
+          f"remove {removed / len(removals) * 1e6:9.2f} us/item")
+
+    basket = Basket()
+    start = time.perf_counter()
+    for item in scans:
+        basket.add(item, 1)
+    added = time.perf_counter() - start
+    keys = {line.sku: line.key for line in basket}
+    start = time.perf_counter()
+    for sku in removals:
+        basket.remove([keys[sku]])
+    removed = time.perf_counter() - start
+    assert basket.totals.recompute()
+    print(f"keyed by SKU:  {len(basket):>6} lines, add {added / len(scans) * 1e6:6.2f} us/scan, "
+          f"remove {removed / len(removals) * 1e6:9.2f} us/item")
+
+
+def awkward_catalog(rng):
+    """Build a price book and promotions meant to catch rounding slips
+
+    Awkward prices on purpose: single pence, odd pence, and round pounds;
+    categories at each VAT rate, and promotions mixing them.
+    """
+    prices = [rng.choice([1, 5, 99, 100, 333, 1999, rng.randint(1, 20000)]) for _ in range(500)]
+    catalog = [CatalogItem(f"{n:06d}", f"Item {n}", f"Bench {n % 4}", price, (), "", "SZRS"[n % 4])
+               for n, price in enumerate(prices)]
+    promotions = read_rules([
+        {"id": "mix", "name": "Any 3 for £10", "type": "multibuy",
+         "categories": ["Bench 0", "Bench 1"], "qty": 3, "price": "10.00"},
+        {"id": "bogof", "name": "Buy one get one free", "type": "bogof",
+         "skus": [item.sku for item in catalog[2::40]]},
+        {"id": "spend", "name": "£5 off £100", "type": "threshold", "spend": "100", "off": "5"}])
+    return catalog, promotions
+
+
+def receipt_disagreements(basket, record):
+    """Return the names of the checks a sale's record fails against its basket
+
+    Every renderer must show the amounts the running totals showed on
+    screen: the text receipt (read back), the PDF tables and the VAT rule.
+    """
+    amounts = (record["subtotal_pence"], record["vat_pence"], record["total_pence"])
+    analysis = [(Decimal(row["rate"]), row["net_pence"], row["vat_pence"]) for row in record["vat"]]
+    parsed = record_from_text(record["id"], render_receipt_text(record))
+    item_rows, summary_rows, vat_rows = receipt_table(record)
+    checks = {
+        "lines add up": sum(line["total_pence"] for line in record["items"])
+                        - sum(saving["pence"] for saving in record["discounts"]) == record["total_pence"],
+        "subtotal + VAT": record["subtotal_pence"] + record["vat_pence"] == record["total_pence"],
+        "VAT rule": all(vat == vat_pence_of(net + vat, rate) for rate, net, vat in analysis)
+                    and sum(net + vat for _, net, vat in analysis) == record["total_pence"],
+        "screen": (basket.totals.subtotal_pence, basket.totals.vat_pence,
+                   basket.totals.total_pence) == amounts,
+        "text": (parsed["subtotal_pence"], parsed["vat_pence"], parsed["total_pence"]) == amounts
+                and parsed["items"] == record["items"]
+                and parsed["discounts"] == record["discounts"]
+                and [(Decimal(row["rate"]), row["net_pence"], row["vat_pence"])
+                     for row in parsed["vat"]] == analysis,
+        "pdf": [row[1] for row in summary_rows[-3:]] == [f"£{Money(pence)}" for pence in amounts]
+               and [row[3] for row in item_rows]
+               == [f"£{Money(line['total_pence'])}" for line in record["items"]]
+               and [row[2] for row in vat_rows] == [f"£{Money(vat)}" for _, _, vat in analysis],
+    }
+    return [name for name, ok in checks.items() if not ok]
+
+
+def bench_money(args):
+    """Time basket pricing in pence against Decimal, and check every receipt renderer agrees"""
+    rng = random.Random(8)
+    taxes = TaxTable()
+    catalog, promotions = awkward_catalog(rng)
+    baskets = [[(rng.choice(catalog), rng.randint(1, 12)) for _ in range(rng.randint(1, args.lines))]
+               for _ in range(args.baskets)]
+    line_count = sum(len(basket) for basket in baskets)
+
+    # The old pricing path: float prices through Decimal(str(...)) on every add,
+    # then the Decimal sum on every total
+    floats = {item.sku: item.price_pence / 100 for item in catalog}
+    decimal_totals = []
+    start = time.perf_counter()
+    for basket in baskets:
+        items = []
+        for item, qty in basket:
+            price = Decimal(str(floats[item.sku]))
+            items.append((item.name, price, qty, price * qty))
+            total = sum(line[3] for line in items)
+        decimal_totals.append(total)
+    decimal_time = time.perf_counter() - start
+
+    # The same steps in Money, with the running totals
+    money_totals = []
+    start = time.perf_counter()
+    for basket in baskets:
+        items = []
+        totals = RunningTotals(taxes)
+        for item, qty in basket:
+            price = item.price
+            items.append((item.name, price, qty, price * qty))
+            totals.add(items[-1][3].pence, taxes.tax_class(item.tax_class))
+            total, vat, subtotal = totals.total, totals.vat, totals.subtotal
+        money_totals.append((total.pence, vat.pence, subtotal.pence))
+    money_time = time.perf_counter() - start
+
+    # And through Basket.add, which also merges repeat items into one line
+    basket_totals = []
+    start = time.perf_counter()
+    for lines in baskets:
+        basket = Basket(taxes)
+        for item, qty in lines:
+            basket.add(item, qty)
+            total, vat, subtotal = basket.totals.total, basket.totals.vat, basket.totals.subtotal
+        basket_totals.append((total.pence, vat.pence, subtotal.pence))
+    basket_time = time.perf_counter() - start
+    assert basket_totals == money_totals, "Basket.add and the running totals disagree"
+    assert [int(total * 100) for total in decimal_totals] == [total for total, _, _ in money_totals], \
+        "pence and Decimal totals disagree"
+    print(f"{line_count} lines in {len(baskets)} baskets, per line priced and totalled:")
+    for label, elapsed in (("float -> Decimal", decimal_time), ("integer pence", money_time),
+                           ("Basket.add", basket_time)):
+        print(f"  {label:<17} {elapsed / line_count * 1e6:5.2f} us")
+
+    # Every renderer must show the amounts the running totals showed on screen
+    problems = 0
+    pdf_times = []
+    workdir = tempfile.mkdtemp(prefix="till_money_")
+    try:
+        for n, lines in enumerate(baskets):
+            basket = Basket(taxes, promotions)
+            basket.add_lines(lines)
+            record = make_receipt_record(f"B-{n}", datetime.now(), "bench", basket.lines,
+                                         basket.totals.analysis(), basket.discounts)
+            for name in receipt_disagreements(basket, record):
+                problems += 1
+                print(f"Receipt {record['id']}: {name} disagrees")
+            if n < args.pdfs:
+                start = time.perf_counter()
+                render_receipt_pdf(record, os.path.join(workdir, "receipt.pdf"))
+                pdf_times.append((time.perf_counter() - start) * 1000)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"{len(baskets)} receipts checked on screen, text and PDF: {problems} disagreements")
+    if pdf_times:
+        print(f"{len(pdf_times)} PDFs rendered, p50 {percentile(pdf_times, 0.5):.1f} ms")
+    if problems:
+        sys.exit(1)
+
+
+def synthetic_promotions(items, categories=40):
+    """Build a promotions list over a synthetic catalog: every kind of rule, many of each"""
+    rng = random.Random(43)
+    rules = [{"id": f"mix-{c}", "type": "multibuy", "categories": [f"Category {c:02d}"],
+              "qty": 3, "price": "10.00"} for c in range(0, categories, 4)]
+    rules += [{"id": f"bogof-{n}", "type": "bogof",
+               "skus": [item.sku for item in rng.sample(items, 5)]} for n in range(300)]
+    rules += [{"id": f"multi-{n}", "type": "multibuy", "qty": rng.randint(2, 4),
+               "price": str(rng.randint(1, 60)), "skus": [item.sku for item in rng.sample(items, 8)]}
+              for n in range(300)]
+    rules += [{"id": f"meal-{n}", "type": "meal_deal", "price": "5.00",
+               "components": [{"skus": [item.sku for item in rng.sample(items, 6)]}
+                              for _ in range(3)]} for n in range(100)]
+    rules += [{"id": f"spend-{pounds}", "type": "threshold", "spend": str(pounds),
+               "off": str(pounds // 10)} for pounds in (20, 50, 100, 500)]
+    return rules
+
+
+def bench_promotions(args):
+    """Compare re-pricing only the promotion a change touches with re-pricing the whole basket"""
+    items = synthetic_catalog(args.skus)
+    rules = read_rules(synthetic_promotions(items))
+    rng = random.Random(9)
+    # Promoted items turn up more often than their share of the catalog
+    promoted = [item for item in items if rules.match(item.sku, item.category)]
+    print(f"{len(rules)} rules covering {len(promoted)} of {len(items)} SKUs; per change:")
+
+    def kind(line):
+        match = rules.match(line.sku, line.category)
+        if match is None:
+            return "none"
+        return "sku" if rules.by_sku.get(line.sku) == match else "category"
+
+    for size in args.lines:
+        basket = Basket(promotions=rules)
+        while len(basket) < size:
+            basket.add(rng.choice(promoted if rng.random() < 0.5 else items), rng.randint(1, 3))
+        changes = {"none": [], "sku": [], "category": []}
+        for line in basket.lines:
+            changes[kind(line)].append(line.key)
+        # A small basket may have no line of some kind; those are left out
+        changes = {name: [(rng.choice(keys), rng.randint(1, 6)) for _ in range(args.changes)]
+                   for name, keys in changes.items() if keys}
+        timings = {}
+        for name, keyed in changes.items():
+            start = time.perf_counter()
+            for key, qty in keyed:
+                basket.set_qty(key, qty)
+            timings[name] = (time.perf_counter() - start) / len(keyed)
+
+        # What pricing the whole basket after every change costs
+        sample = [change for keyed in changes.values() for change in keyed[:args.changes // 10]]
+        start = time.perf_counter()
+        for key, qty in sample:
+            basket.set_qty(key, qty)
+            discount = rules.evaluate((line.sku, line.category, line.price.pence, line.qty)
+                                      for line in basket)
+        full = (time.perf_counter() - start) / len(sample)
+        assert discount == basket.totals.discount_pence, (discount, basket.totals.discount_pence)
+
+        # A category rule is re-priced from every different price it covers in the basket
+        category_rules = {promotion for promotion, _ in rules.by_category.values()}
+        prices = [len(units.prices) for promotion, covered in basket.promotions._units.items()
+                  if promotion in category_rules for units in covered]
+
+        def cost(name):
+            return f"{timings[name] * 1e6:6.1f} us" if name in timings else "     - "
+        print(f"{size:>5} lines, {len(basket.discounts):>3} promotions applied: "
+              f"unpromoted item {cost('none')}, SKU rule {cost('sku')}, category rule "
+              f"{cost('category')} ({max(prices, default=0)} prices in the largest); "
+              f"whole basket {full * 1e6:8.1f} us")
+    print("SKU rules cost the same at any basket size; a category rule costs in proportion to the "
+          "different prices it covers in the basket, not to the number of lines")
+
+
+# Assertion checks, for "python benchmarks.py check": small, fixed-seed
+# versions of the stress tests above that fail loudly instead of timing.
+
+def check_receipt_ids(workdir):
+    """Concurrent checkouts on every backend get distinct ids, all saved, none reissued"""
+    for backend in ("text", "sqlite", "journal"):
+        backend_dir = os.path.join(workdir, backend)
+        os.makedirs(backend_dir)
+        state_path = os.path.join(backend_dir, "sequence.json")
+        store = open_store(backend, backend_dir)
+        allocator = ReceiptIdAllocator(state_path, till_id="T01", block_size=7)
+        issued = [[] for _ in range(4)]
+
+        def lane(n):
+            for _ in range(150):
+                receipt_id = allocator.next_id()
+                store.save(synthetic_receipt(receipt_id))
+                issued[n].append(receipt_id)
+
+        workers = [threading.Thread(target=lane, args=(n,)) for n in range(len(issued))]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        store.flush()
+        all_ids = [receipt_id for ids in issued for receipt_id in ids]
+        assert len(set(all_ids)) == len(all_ids), f"{backend}: duplicate receipt ids issued"
+        assert {entry["id"] for entry in store.list_receipts()} == set(all_ids), \
+            f"{backend}: receipts lost"
+        assert sorted(all_ids) == sorted(all_ids, key=lambda receipt_id: int(receipt_id[4:])), \
+            f"{backend}: id order is not allocation order"
+        store.close()
+        restarted = ReceiptIdAllocator(state_path, till_id="T01", block_size=7)
+        assert restarted.next_id() > max(all_ids), f"{backend}: restart reissued an id"
+
+    # Tills sharing a store reserve blocks in turn without losing each
+    # other's bounds, and carry on from the shared file older versions wrote
+    state_path = os.path.join(workdir, "sequence.json")
+    with open(state_path, 'w', encoding='utf-8') as f:
+        json.dump({"T02": 500}, f)
+    tills = [ReceiptIdAllocator(state_path, till_id=till_id, block_size=3) for till_id in ("T01", "T02")]
+    issued = {allocator.till_id: [allocator.next_id() for _ in range(10)] for allocator in tills}
+    assert issued["T02"][0] == "T02-0000000500", "shared sequence file ignored"
+    with open(state_path, 'r', encoding='utf-8') as f:
+        assert json.load(f) == {"T02": 500}, "a till rewrote the shared sequence file"
+    for allocator in tills:
+        restarted = ReceiptIdAllocator(state_path, till_id=allocator.till_id, block_size=3)
+        assert restarted.next_id() > issued[allocator.till_id][-1], \
+            f"{allocator.till_id}: restart reissued an id"
+
+
+def check_journal(workdir):
+    """Deleted receipts stay gone, and the rest intact, through compaction and reopening"""
+    journal_dir = os.path.join(workdir, "journal")
+    store = JournalReceiptStore(journal_dir, segment_bytes=4096)
+    start = datetime(2025, 1, 1, 9)
+    records = {}
+    for n in range(300):
+        record = synthetic_receipt(f"T01-{n:010d}", timestamp=start + timedelta(hours=n))
+        records[record["id"]] = record
+        store.save(record)
+    assert len(store.index.segments()) > 3, "journal did not rotate segments"
+    rng = random.Random(21)
+    deleted = set(rng.sample(sorted(records), 120))
+    # Every record of the first segment goes, so compaction removes a whole file
+    deleted.update(entry["id"] for entry in store.index.entries.values()
+                   if entry["path"] == store.index.segments()[0])
+    for receipt_id in deleted:
+        assert store.delete(receipt_id), f"could not delete {receipt_id}"
+    assert not store.delete(next(iter(deleted))), "deleted a receipt twice"
+
+    for reopen in (False, True):
+        if reopen:
+            store.close()
+            store = JournalReceiptStore(journal_dir, segment_bytes=4096)
+        else:
+            report = store.compact()
+            assert report["dropped"] == len(deleted) and report["bytes_freed"] > 0, report
+        assert store.count() == len(records) - len(deleted), "wrong count after compaction"
+        for receipt_id, record in records.items():
+            stored = store.get_record(receipt_id)
+            assert stored == (None if receipt_id in deleted else record), \
+                f"{receipt_id} {'came back' if receipt_id in deleted else 'changed'}"
+    assert not store.index.tombstones, "tombstones left after compaction"
+    store.close()
+
+
+def check_archives(workdir):
+    """Archived days read back exactly, by id and by date, and keep their deletions"""
+    receipts_dir = os.path.join(workdir, "partitioned")
+    store = PartitionedReceiptStore(receipts_dir)
+    start = datetime(2025, 1, 1, 9)
+    records = {}
+    for n in range(200):
+        record = synthetic_receipt(f"T01-{n:010d}", timestamp=start + timedelta(hours=5 * n))
+        records[record["id"]] = record
+        store.save(record)
+    deleted = {"T01-0000000003", "T01-0000000150"}
+    for receipt_id in deleted:
+        assert store.delete(receipt_id), f"could not delete {receipt_id}"
+    for codec in ("zlib", "lzma"):
+        before = "2025-01-15" if codec == "zlib" else "2025-02-01"
+        report = store.archive(before, codec=codec)
+        assert report["days"] and report["bytes_after"] < report["bytes_before"], report
+    # Deleting from an archived day is kept in its .deleted list
+    deleted.add("T01-0000000010")
+    assert store.delete("T01-0000000010"), "could not delete from an archived day"
+
+    store.close()
+    store = PartitionedReceiptStore(receipts_dir, cached_partitions=2)
+    assert store.count() == len(records) - len(deleted), "wrong count after archiving"
+    for receipt_id, record in records.items():
+        stored = store.get_record(receipt_id)
+        assert stored == (None if receipt_id in deleted else record), \
+            f"{receipt_id} {'came back' if receipt_id in deleted else 'changed'}"
+    january = store.list_receipts(start="2025-01-01", end="2025-01-31")
+    expected = {receipt_id for receipt_id, record in records.items()
+                if record["timestamp"] < "2025-02" and receipt_id not in deleted}
+    assert {entry["id"] for entry in january} == expected, "date range wrong across archives"
+    try:
+        store.save(synthetic_receipt("T01-9999999999", timestamp=start))
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("saved a receipt into an archived day")
+    store.close()
+
+
+def brute_force_discount(promotion, prices):
+    """Price a promotion from its covered units listed one by one, the slow obvious way"""
+    prices = [sorted(units, reverse=True) for units in prices]
+    if isinstance(promotion, MealDeal):
+        deals = [sum(deal) - promotion.price_pence for deal in zip(*prices)]
+    else:
+        size = promotion.qty if isinstance(promotion, Multibuy) else promotion.buy + promotion.free
+        units = prices[0]
+        groups = [units[n:n + size] for n in range(0, len(units) // size * size, size)]
+        if isinstance(promotion, BuyGetFree):
+            return sum(sum(group[promotion.buy:]) for group in groups)
+        deals = [sum(group) - promotion.price_pence for group in groups]
+    discount = 0
+    for saving in deals:
+        if saving <= 0:
+            break
+        discount += saving
+    return discount
+
+
+def check_promotions(workdir):
+    """Grouped promotion pricing matches brute force; running discounts match a full re-price"""
+    rng = random.Random(31)
+    promotions = [Multibuy("m3", "3 for", 0, 3, 1000), Multibuy("m2", "2 for", 1, 2, 150),
+                  BuyGetFree("b1", "bogof", 2), BuyGetFree("b32", "3 for 2 and 1", 3, 3, 2),
+                  MealDeal("meal", "meal", 4, 3, 500)]
+    for _ in range(3000):
+        promotion = rng.choice(promotions)
+        prices = [[rng.choice((5, 99, 100, 250, 333, 999, 1200)) for _ in range(rng.randint(0, 14))]
+                  for _ in range(promotion.components)]
+        units = []
+        for listed in prices:
+            counted = Units()
+            for price in listed:
+                counted.add(price, 1)
+            units.append(counted)
+        # Take some units away again, as removing lines does
+        for listed, counted in zip(prices, units):
+            for price in rng.sample(listed, len(listed) // 3):
+                listed.remove(price)
+                counted.add(price, -1)
+        expected = brute_force_discount(promotion, prices)
+        assert promotion.discount(units) == expected, (promotion, prices, expected)
+
+    items = synthetic_catalog(2000)
+    rules = read_rules(synthetic_promotions(items))
+    promoted = [item for item in items if rules.match(item.sku, item.category)]
+    for _ in range(30):
+        basket = Basket(promotions=rules)
+        for _ in range(80):
+            action = rng.random()
+            if action < 0.6 or not basket:
+                basket.add(rng.choice(promoted if rng.random() < 0.7 else items), rng.randint(1, 4))
+            elif action < 0.85:
+                basket.set_qty(rng.choice(basket.lines).key, rng.randint(1, 6))
+            else:
+                basket.remove([rng.choice(basket.lines).key])
+            # Re-price the whole basket unit by unit, sharing no code with the basket
+            covered = {}
+            for line in basket:
+                match = rules.match(line.sku, line.category)
+                if match is not None:
+                    promotion, component = match
+                    prices = covered.setdefault(promotion, [[] for _ in range(promotion.components)])
+                    prices[component].extend([line.price.pence] * line.qty)
+            expected = sum(brute_force_discount(promotion, prices)
+                           for promotion, prices in covered.items())
+            spend = sum(line.total.pence for line in basket) - expected
+            expected += max((rule.off_pence for rule in rules.thresholds if spend >= rule.spend_pence),
+                            default=0)
+            assert basket.totals.discount_pence == expected, (basket.totals.discount_pence, expected)
+            assert sum(amount.pence for _, amount in basket.discounts) == expected, \
+                "discount lines do not add up to the discount"
+
+
+def check_vat(workdir):
+    """Discounts split across tax classes exactly, and each rate's VAT is taken from its share"""
+    rng = random.Random(32)
+    for _ in range(2000):
+        weights = {f"k{n}": rng.choice((0, 1, 7, 100, rng.randint(1, 10 ** 6)))
+                   for n in range(rng.randint(1, 5))}
+        pence = rng.randint(0, 10 ** 5)
+        shares = apportion(pence, weights)
+        assert sum(shares.values()) == pence and set(shares) <= set(weights), (pence, weights)
+        total = sum(weights.values())
+        if total and len(weights) > 1:
+            assert all(abs(shares[key] * total - pence * weight) < total
+                       for key, weight in weights.items()), (pence, weights, shares)
+
+    items = synthetic_catalog(2000)
+    rules = read_rules(synthetic_promotions(items))
+    taxes = TaxTable()
+    for _ in range(30):
+        basket = Basket(taxes, rules)
+        for _ in range(60):
+            if rng.random() < 0.75 or not basket:
+                basket.add(rng.choice(items), rng.randint(1, 5))
+            else:
+                basket.remove([rng.choice(basket.lines).key])
+            totals = basket.totals
+            discounts = totals.discount_by_class
+            assert sum(discounts.values()) == totals.discount_pence, "discount split does not add up"
+            assert all(0 <= pence <= totals.by_class.get(code, 0) for code, pence in discounts.items()), \
+                f"a class is discounted below nothing: {discounts} of {totals.by_class}"
+            gross_by_rate = {}
+            for code, gross in totals.by_class.items():
+                rate = taxes.rate(code)
+                gross_by_rate[rate] = gross_by_rate.get(rate, 0) + gross - discounts.get(code, 0)
+            analysis = totals.analysis()
+            assert [rate for rate, _, _ in analysis] == sorted(gross_by_rate), "rates missing"
+            for rate, net, vat in analysis:
+                assert net + vat == gross_by_rate[rate], f"{rate}: net + VAT is not its gross"
+                assert vat == vat_pence_of(net + vat, rate), f"{rate}: VAT taken wrongly"
+            assert sum(vat for _, _, vat in analysis) == totals.vat_pence, "VAT does not add up"
+        assert totals.recompute(), "running totals drifted"
+
+
+def pdf_layout(path):
+    """Return a PDF's page content with every text string replaced by its length
+
+    Good enough to compare two renderings of one receipt, which may number
+    their glyphs differently, without a PDF text extractor.
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    pages = []
+    for stream in re.findall(rb"stream\r?\n(.*?)\r?\nendstream", data, re.S):
+        try:
+            content = zlib.decompress(stream)
+        except zlib.error:
+            continue
+        if b" Tj " in content:
+            pages.append(re.sub(rb"\(((?:\\.|[^\\])*?)\) Tj",
+                                lambda m: b"<%d> Tj" % len(m.group(1)), content, flags=re.S))
+    return pages
+
+
+def check_renderers(workdir):
+    """Screen, text receipt and PDF agree on every amount, and cached PDFs lay out as uncached"""
+    rng = random.Random(33)
+    catalog, promotions = awkward_catalog(rng)
+    renderer = ReceiptPdfRenderer()
+    try:
+        for n in range(300):
+            basket = Basket(TaxTable(), promotions)
+            basket.add_lines((rng.choice(catalog), rng.randint(1, 12))
+                             for _ in range(rng.randint(1, 40)))
+            record = Checkout(None, None).build_record(basket, "Zoë Check", f"C-{n}",
+                                                       cashier_id="check")
+            problems = receipt_disagreements(basket, record)
+            assert not problems, f"receipt {record['id']}: {', '.join(problems)} disagree"
+            if n % 30 == 0:
+                cached, uncached = (os.path.join(workdir, f"{name}.pdf") for name in ("cached", "new"))
+                renderer.render(record, cached, "E1")
+                finish_receipt_pdf(start_receipt_pdf(), record, uncached, "E1")
+                layout = pdf_layout(cached)
+                assert layout and layout == pdf_layout(uncached), \
+                    f"receipt {record['id']}: cached PDF differs from a fresh one"
+    finally:
+        renderer.close()
+
+
+def check_search(workdir):
+    """Searches find what reading every receipt would, before and after reloading the index"""
+    rng = random.Random(34)
+    index_path = os.path.join(workdir, "search_index.jsonl")
+    index = ReceiptSearchIndex(index_path)
+    start = datetime(2020, 1, 1, 9)
+    records = {}
+    for n in range(400):
+        pence = rng.choice((5, 99, 180, 200, 2000, 2025, 2050, 20000))
+        timestamp = start + timedelta(days=rng.randint(0, 2000))
+        items = [("🍎 Apple", Money(pence), 1, Money(pence))]
+        record = make_receipt_record(f"T01-{n:010d}", timestamp, rng.choice(("Ann", "Bob")), items,
+                                     TaxTable().analysis({STANDARD: pence}))
+        records[record["id"]] = record
+        index.add(record)
+    for receipt_id in rng.sample(sorted(records), 40):
+        index.remove(receipt_id)
+        del records[receipt_id]
+
+    def total_starts(prefix):
+        return lambda record: f"{record['total_pence'] / 100:.2f}".startswith(prefix)
+
+    queries = {
+        # Bare amounts match totals only, never a date or year
+        "20": total_starts("20"),
+        "2025": total_starts("2025"),
+        "£1.8": total_starts("1.8"),
+        "date:2025": lambda record: record["timestamp"].startswith("2025"),
+        "total>20": lambda record: record["total_pence"] > 2000,
+        "ann 20": lambda record: record["cashier"] == "Ann" and total_starts("20")(record),
+        "apple": lambda record: True,
+    }
+    for reopen in (False, True):
+        if reopen:
+            index = ReceiptSearchIndex(index_path)
+        for query, matches in queries.items():
+            expected = {receipt_id for receipt_id, record in records.items() if matches(record)}
+            assert set(index.search(query)) == expected, f"{query!r} matched the wrong receipts"
+
+
+CHECKS = [check_receipt_ids, check_journal, check_archives, check_promotions, check_vat,
+          check_renderers, check_search]
+
+
+def run_checks(args):
+    """Run assertion checks of storage, pricing, receipts and search (no display needed); exit 1 if any fail"""
+    failed = 0
+    for check in CHECKS:
+        if args.only and not any(name in check.__name__ for name in args.only):
+            continue
+        workdir = tempfile.mkdtemp(prefix="till_check_")
+        start = time.perf_counter()
+        try:
+            check(workdir)
+            outcome = "ok"
+        except Exception as e:
+            failed += 1
+            outcome = f"FAILED: {type(e).__name__}: {e}"
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+        print(f"{check.__name__[len('check_'):]:<14} {time.perf_counter() - start:6.2f}s  {outcome}")
+    if failed:
+        sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Till benchmarks and stress checks")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    check = commands.add_parser("check", help=run_checks.__doc__)
+    check.add_argument("--only", nargs="+", default=[], help="run the checks with these names")
+    check.set_defaults(func=run_checks)
+
+    ids = commands.add_parser("receipt-ids", help=stress_receipt_ids.__doc__)
+    ids.add_argument("--backend", choices=["text", "sqlite"], default="text")
+    ids.add_argument("--count", type=int, default=20000)
+    ids.add_argument("--threads", type=int, default=4)
+    ids.set_defaults(func=stress_receipt_ids)
+
+    durable = commands.add_parser("durability", help=bench_durability.__doc__)
+    durable.add_argument("--backend", choices=["text", "sqlite", "journal"], default="journal")
+    durable.add_argument("--modes", nargs="+", choices=DURABILITY_MODES, default=list(DURABILITY_MODES))
+    durable.add_argument("--count", type=int, default=2000)
+    durable.add_argument("--threads", type=int, default=1)
+    durable.add_argument("--group-size", type=int, default=32)
+    durable.add_argument("--group-ms", type=int, default=20)
+    durable.set_defaults(func=bench_durability)
+
+    checkout = commands.add_parser("checkout", help=bench_checkout.__doc__)
+    checkout.add_argument("--backend", choices=("text", "sqlite", "journal"), default="journal")
+    checkout.add_argument("--durability", choices=DURABILITY_MODES, default="group")
+    checkout.add_argument("--sales", type=int, default=50)
+    checkout.add_argument("--lines", type=int, default=20)
+    checkout.add_argument("--gap-ms", type=int, default=250)
+    checkout.set_defaults(func=bench_checkout)
+
+    printing = commands.add_parser("print", help=bench_print.__doc__)
+    printing.add_argument("--jobs", type=int, default=60)
+    printing.add_argument("--burst", type=int, default=12)
+    printing.add_argument("--pause-ms", type=int, default=1000)
+    printing.add_argument("--queue", type=int, default=32)
+    printing.add_argument("--failure", type=float, default=0.2)
+    printing.add_argument("--retries", type=int, default=3)
+    printing.add_argument("--backoff-ms", type=int, default=20)
+    printing.set_defaults(func=bench_print)
+
+    pdf = commands.add_parser("pdf", help=bench_pdf.__doc__)
+    pdf.add_argument("--receipts", type=int, default=100)
+    pdf.add_argument("--lines", type=int, default=30)
+    pdf.add_argument("--threads", type=int, default=1)
+    pdf.set_defaults(func=bench_pdf)
+
+    partitions = commands.add_parser("partitions", help=bench_partitions.__doc__)
+    partitions.add_argument("--days", type=int, nargs="+", default=[1, 30, 365])
+    partitions.add_argument("--per-day", type=int, default=20)
+    partitions.set_defaults(func=bench_partitions)
+
+    catalog = commands.add_parser("catalog", help=bench_catalog.__doc__)
+    catalog.add_argument("--skus", type=int, default=100000)
+    catalog.add_argument("--repeat", type=int, default=500)
+    catalog.set_defaults(func=bench_catalog)
+
+    catalog_load = commands.add_parser("catalog-load", help=bench_catalog_load.__doc__)
+    catalog_load.add_argument("--skus", type=int, default=100000)
+    catalog_load.add_argument("--repeat", type=int, default=3)
+    catalog_load.set_defaults(func=bench_catalog_load)
+
+    catalog_reload = commands.add_parser("catalog-reload", help=bench_catalog_reload.__doc__)
+    catalog_reload.add_argument("--skus", type=int, default=100000)
+    catalog_reload.add_argument("--changes", type=int, default=500)
+    catalog_reload.set_defaults(func=bench_catalog_reload)
+
+    totals = commands.add_parser("totals", help=bench_totals.__doc__)
+    totals.add_argument("--lines", type=int, nargs="+", default=[10, 100, 500, 2000])
+    totals.set_defaults(func=bench_totals)
+
+    basket = commands.add_parser("basket", help=bench_basket.__doc__)
+    basket.add_argument("--skus", type=int, default=1000)
+    basket.add_argument("--scans", type=int, default=5000)
+    basket.add_argument("--distinct", type=int, default=60)
+    basket.set_defaults(func=bench_basket)
+
+    money = commands.add_parser("money", help=bench_money.__doc__)
+    money.add_argument("--baskets", type=int, default=2000)
+    money.add_argument("--lines", type=int, default=40)
+    money.add_argument("--pdfs", type=int, default=50)
+    money.set_defaults(func=bench_money)
+
+    promotions = commands.add_parser("promotions", help=bench_promotions.__doc__)
+    promotions.add_argument("--skus", type=int, default=10000)
+    promotions.add_argument("--lines", type=int, nargs="+", default=[10, 100, 1000, 5000])
+    promotions.add_argument("--changes", type=int, default=500)
+    promotions.set_defaults(func=bench_promotions)
+
+    display = commands.add_parser("display", help=bench_display.__doc__)
+    display.add_argument("--skus", type=int, default=10000)
+    display.add_argument("--distinct", type=int, default=150)
+    display.add_argument("--rates", type=int, nargs="+", default=[20, 100])
+    display.add_argument("--seconds", type=int, default=30)
+    display.add_argument("--scan-flush-ms", type=int, nargs="+", default=[60, 0])
+    display.add_argument("--frame-ms", type=int, default=16)
+    display.set_defaults(func=bench_display)
+
+    scanner = commands.add_parser("scanner", help=bench_scanner.__doc__)
+    scanner.add_argument("--skus", type=int, default=100000)
+    scanner.add_argument("--count", type=int, default=100000)
+    scanner.add_argument("--burst", type=int, default=12)
+    scanner.add_argument("--unknown", type=float, default=0.02)
+    scanner.set_defaults(func=bench_scanner)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
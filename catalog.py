@@ -0,0 +1,249 @@
+import bisect
+import csv
+import re
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from money import Money, to_pence
+
+ALL_CATEGORIES = "All"
+# Sorts after any real key, to turn a prefix into a range upper bound
+HIGH = "\uffff"
+WORD = re.compile(r"[^\W_]+")
+# Most names handed to a picker at once; typing narrows the list further
+CHOICES_LIMIT = 200
+
+
+class CatalogItem(NamedTuple):
+    sku: str
+    name: str
+    category: str
+    price_pence: int
+    # EAN/UPC barcodes printed on the item, and its produce PLU if it has one
+    barcodes: Tuple[str, ...] = ()
+    plu: str = ""
+    # VAT class code (see tax.py); empty for standard rated
+    tax_class: str = ""
+
+    @property
+    def price(self) -> Money:
+        return Money(self.price_pence)
+
+
+def normalize_code(code: str) -> str:
+    """Return a scanned code in the form used as the catalog key
+
+    Whitespace is dropped and 12-digit UPC-A codes are widened to EAN-13,
+    so either form of the same barcode finds the item.
+    """
+    code = "".join(code.split())
+    if len(code) == 12 and code.isdigit():
+        return "0" + code
+    return code
+
+
+def check_digit_ok(code: str) -> bool:
+    """Validate the GS1 check digit of an EAN-8, UPC-A, EAN-13 or GTIN-14"""
+    if not code.isdigit() or len(code) not in (8, 12, 13, 14):
+        return False
+    digits = [int(c) for c in reversed(code[:-1])]
+    total = sum(d * (3 if i % 2 == 0 else 1) for i, d in enumerate(digits))
+    return (10 - total % 10) % 10 == int(code[-1])
+
+
+def name_keys(name: str) -> List[str]:
+    """Return the lowercase name starting from each of its words
+
+    "🍊 Blood Orange" gives ["blood orange", "orange"], so type-ahead
+    matches an item by the start of any word in its name.
+    """
+    words = WORD.findall(name.lower())
+    return [" ".join(words[i:]) for i in range(len(words))]
+
+
+def read_items(lines: Iterable[str]) -> List[CatalogItem]:
+    """Parse the lines of a CSV price book into items, skipping bad rows
+
+    Needs ``sku``, ``name``, ``category`` and ``price`` columns; optional
+    ``barcode`` (several separated by "|") and ``plu`` columns make items
+    scannable, and an optional ``tax_class`` column sets their VAT rate.
+    """
+    items = []
+    for line_no, row in enumerate(csv.DictReader(lines), start=2):
+        try:
+            barcodes = tuple(code.strip() for code in (row.get("barcode") or "").split("|")
+                             if code.strip())
+            items.append(CatalogItem(row["sku"].strip(), row["name"].strip(),
+                                     row["category"].strip(), to_pence(row["price"]),
+                                     barcodes, (row.get("plu") or "").strip(),
+                                     (row.get("tax_class") or "").strip()))
+        except Exception as e:
+            print(f"Skipping catalog line {line_no}: {e}")
+    return items
+
+
+class CatalogDiff(NamedTuple):
+    """Items added, removed and changed between two versions of a price book"""
+    added: List[CatalogItem]
+    removed: List[CatalogItem]
+    # (old, new) pairs with the same SKU
+    changed: List[Tuple[CatalogItem, CatalogItem]]
+
+    def __bool__(self) -> bool:
+        return bool(self.added or self.removed or self.changed)
+
+
+def diff_items(old: Dict[str, CatalogItem], new: Dict[str, CatalogItem]) -> CatalogDiff:
+    """Compare two price books keyed by SKU"""
+    added = [item for sku, item in new.items() if sku not in old]
+    removed = [item for sku, item in old.items() if sku not in new]
+    changed = [(old[sku], item) for sku, item in new.items()
+               if sku in old and old[sku] != item]
+    return CatalogDiff(added, removed, changed)
+
+
+class Catalog:
+    """The price book, indexed for the till's item pickers.
+
+    Item names are kept sorted once per category, so switching category
+    only hands over a prepared list. Type-ahead uses a sorted array of
+    name keys (see ``name_keys``) per category, searched with bisect in
+    the same way as the receipt search vocabulary. Barcodes and PLUs are
+    keys of one dict, for scanning. ``apply`` patches all of these in place
+    for the items a price book update touches.
+    """
+
+    def __init__(self, items: Iterable[CatalogItem]):
+        self.by_sku: Dict[str, CatalogItem] = {}
+        self.by_name: Dict[str, CatalogItem] = {}
+        self.by_code: Dict[str, CatalogItem] = {}
+        for item in items:
+            self.by_sku[item.sku] = item
+            self.by_name[item.name] = item
+            for code in item.barcodes:
+                self.by_code[normalize_code(code)] = item
+            if item.plu:
+                self.by_code[item.plu] = item
+
+        by_category: Dict[str, List[str]] = {}
+        for item in self.by_name.values():
+            by_category.setdefault(item.category, []).append(item.name)
+        self.categories = sorted(by_category)
+        self._names = {category: sorted(names) for category, names in by_category.items()}
+        self._names[ALL_CATEGORIES] = sorted(self.by_name)
+
+        self._keys: Dict[str, List[Tuple[str, str]]] = {}
+        all_keys = []
+        for category in self.categories:
+            keys = [(key, name) for name in self._names[category] for key in name_keys(name)]
+            keys.sort()
+            self._keys[category] = keys
+            all_keys.extend(keys)
+        # Timsort merges the already sorted runs cheaply
+        all_keys.sort()
+        self._keys[ALL_CATEGORIES] = all_keys
+
+    @classmethod
+    def load(cls, path: str) -> "Catalog":
+        """Read a CSV price book (see ``read_items``)"""
+        with open(path, 'r', encoding='utf-8', newline='') as f:
+            return cls(read_items(f))
+
+    def __len__(self) -> int:
+        return len(self.by_sku)
+
+    def items(self) -> List[CatalogItem]:
+        return list(self.by_sku.values())
+
+    def apply(self, diff: CatalogDiff):
+        """Update the catalog in place with a price book diff
+
+        Items that keep their name and category, such as price changes,
+        only replace their dict entries; the sorted arrays are left alone.
+        """
+        moved = [(old, new) for old, new in diff.changed
+                 if (old.name, old.category) != (new.name, new.category)]
+        for old, new in diff.changed:
+            if (old.name, old.category) == (new.name, new.category) and self._remove(old, False):
+                self._add(new, False)
+        for item in diff.removed + [old for old, new in moved]:
+            self._remove(item)
+        for item in diff.added + [new for old, new in moved]:
+            self._add(item)
+
+    def _remove(self, item: CatalogItem, index: bool = True) -> bool:
+        if self.by_sku.get(item.sku) != item:
+            return False
+        del self.by_sku[item.sku]
+        del self.by_name[item.name]
+        for code in item.barcodes + ((item.plu,) if item.plu else ()):
+            if self.by_code.get(normalize_code(code)) == item:
+                del self.by_code[normalize_code(code)]
+        if not index:
+            return True
+
+        for category in (item.category, ALL_CATEGORIES):
+            names = self._names[category]
+            del names[bisect.bisect_left(names, item.name)]
+            keys = self._keys[category]
+            for key in name_keys(item.name):
+                del keys[bisect.bisect_left(keys, (key, item.name))]
+        if not self._names[item.category]:
+            del self._names[item.category], self._keys[item.category]
+            self.categories.remove(item.category)
+        return True
+
+    def _add(self, item: CatalogItem, index: bool = True):
+        self.by_sku[item.sku] = item
+        self.by_name[item.name] = item
+        for code in item.barcodes:
+            self.by_code[normalize_code(code)] = item
+        if item.plu:
+            self.by_code[item.plu] = item
+        if not index:
+            return
+
+        if item.category not in self._names:
+            self._names[item.category], self._keys[item.category] = [], []
+            bisect.insort(self.categories, item.category)
+        for category in (item.category, ALL_CATEGORIES):
+            bisect.insort(self._names[category], item.name)
+            for key in name_keys(item.name):
+                bisect.insort(self._keys[category], (key, item.name))
+
+    def get(self, name: str) -> Optional[CatalogItem]:
+        return self.by_name.get(name)
+
+    def get_sku(self, sku: str) -> Optional[CatalogItem]:
+        return self.by_sku.get(sku)
+
+    def lookup_code(self, code: str) -> Optional[CatalogItem]:
+        """Return the item with a scanned barcode or PLU"""
+        return self.by_code.get(normalize_code(code))
+
+    def names(self, category: str = ALL_CATEGORIES, limit: Optional[int] = None) -> List[str]:
+        """Return the sorted item names of a category, or the first ``limit``
+
+        Without a limit this is the catalog's own list; do not modify it.
+        """
+        names = self._names.get(category, [])
+        return names if limit is None else names[:limit]
+
+    def keys(self, category: str = ALL_CATEGORIES) -> List[Tuple[str, str]]:
+        """Return the sorted (name key, name) pairs of a category"""
+        return self._keys.get(category, [])
+
+    def search(self, prefix: str, category: str = ALL_CATEGORIES,
+               limit: int = CHOICES_LIMIT) -> List[str]:
+        """Return up to ``limit`` names with a word starting with ``prefix``"""
+        prefix = " ".join(WORD.findall(prefix.lower()))
+        if not prefix:
+            return self.names(category, limit)
+
+        keys = self._keys.get(category, [])
+        pos = bisect.bisect_left(keys, (prefix,))
+        stop = bisect.bisect_left(keys, (prefix + HIGH,))
+        matches: Dict[str, None] = {}
+        while pos < stop and len(matches) < limit:
+            matches[keys[pos][1]] = None
+            pos += 1
+        return list(matches)
@@ -0,0 +1,355 @@
+import heapq
+import itertools
+import mmap
+import os
+import struct
+import sys
+import zlib
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+from catalog import (ALL_CATEGORIES, CHOICES_LIMIT, WORD, Catalog, CatalogDiff, CatalogItem,
+                     name_keys, normalize_code)
+
+MAGIC = b"TCAT"
+VERSION = 2
+# Magic, version, item count, category count, then the byte offset of
+# each section and the slot counts of the three hash tables
+HEADER = struct.Struct("<4sHxxII9I3I")
+SECTIONS = ("records", "categories", "order", "keys", "sku_table", "name_table",
+            "code_table", "strings", "end")
+# sku, name, category number, price in pence, barcodes joined by "|", plu,
+# tax class; strings are (offset, length) pairs into the string table
+RECORD = struct.Struct("<IHIHHiIHIHIH")
+# name, first position and count in the order array, then in the key array
+CATEGORY = struct.Struct("<IHIIII")
+ORDER = struct.Struct("<I")
+# a name key (see catalog.name_keys) and the record it belongs to; keys
+# share their bytes in the string table with the name's longest key
+KEY = struct.Struct("<IHI")
+# record number + 1, 0 for an empty slot
+SLOT = struct.Struct("<I")
+CODE_SLOT = struct.Struct("<IHI")
+
+
+def key_hash(key: str) -> int:
+    # Python's str hash changes between runs, so use a stable one
+    return zlib.crc32(key.encode('utf-8'))
+
+
+def table_size(count: int) -> int:
+    """Slots for ``count`` entries: the next power of two at least twice the count"""
+    # At most half full, so linear probing stays short
+    size = 8
+    while size < count * 2:
+        size *= 2
+    return size
+
+
+class StringTable:
+    def __init__(self):
+        self.data = bytearray()
+        self.offsets: Dict[str, Tuple[int, int]] = {}
+
+    def add(self, text: str) -> Tuple[int, int]:
+        ref = self.offsets.get(text)
+        if ref is None:
+            raw = text.encode('utf-8')
+            if len(raw) > 0xFFFF:
+                raise ValueError(f"Catalog string too long: {text[:40]}...")
+            ref = self.offsets[text] = (len(self.data), len(raw))
+            self.data += raw
+        return ref
+
+
+def compile_catalog(catalog: Catalog, path: str) -> int:
+    """Write ``catalog`` as a binary file for BinaryCatalog and return its size
+
+    Sections, in order: fixed-width item records (sorted by name), one
+    entry per category plus "All", the sorted record order of each
+    category, the sorted name keys of each category, open-addressing hash
+    tables for SKUs, names and barcodes/PLUs, and the UTF-8 string table.
+    """
+    strings = StringTable()
+    names = catalog.names()
+    number = {name: i for i, name in enumerate(names)}
+    categories = catalog.categories + [ALL_CATEGORIES]
+    category_number = {category: i for i, category in enumerate(categories)}
+
+    records = bytearray()
+    for name in names:
+        item = catalog.get(name)
+        records += RECORD.pack(*strings.add(item.sku), *strings.add(item.name),
+                               category_number[item.category], item.price_pence,
+                               *strings.add("|".join(item.barcodes)), *strings.add(item.plu),
+                               *strings.add(item.tax_class))
+
+    category_table, order, keys = bytearray(), bytearray(), bytearray()
+    order_count = key_count = 0
+    for category in categories:
+        category_names = catalog.names(category)
+        category_keys = catalog.keys(category)
+        category_table += CATEGORY.pack(*strings.add(category), order_count,
+                                        len(category_names), key_count, len(category_keys))
+        for name in category_names:
+            order += ORDER.pack(number[name])
+        for key, name in category_keys:
+            # Every key is a suffix of the name's first key, so point into that
+            full = name_keys(name)[0]
+            offset, length = strings.add(full)
+            skip = len(full.encode('utf-8')) - len(key.encode('utf-8'))
+            keys += KEY.pack(offset + skip, length - skip, number[name])
+        order_count += len(category_names)
+        key_count += len(category_keys)
+
+    def hash_table(entries):
+        size = table_size(len(entries))
+        slots = [None] * size
+        for key, record in entries:
+            pos = key_hash(key) & (size - 1)
+            while slots[pos] is not None:
+                pos = (pos + 1) & (size - 1)
+            slots[pos] = (key, record)
+        return size, slots
+
+    sku_size, sku_slots = hash_table([(catalog.get(name).sku, i) for i, name in enumerate(names)])
+    name_size, name_slots = hash_table([(name, i) for i, name in enumerate(names)])
+    code_size, code_slots = hash_table([(code, number[item.name])
+                                        for code, item in catalog.by_code.items()])
+    sku_table = b"".join(SLOT.pack(slot[1] + 1 if slot else 0) for slot in sku_slots)
+    name_table = b"".join(SLOT.pack(slot[1] + 1 if slot else 0) for slot in name_slots)
+    code_table = b"".join(CODE_SLOT.pack(*strings.add(slot[0]), slot[1] + 1) if slot
+                          else CODE_SLOT.pack(0, 0, 0) for slot in code_slots)
+
+    offsets = []
+    position = HEADER.size
+    for section in (records, category_table, order, keys, sku_table, name_table,
+                    code_table, strings.data):
+        offsets.append(position)
+        position += len(section)
+    offsets.append(position)
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(names), len(catalog.categories),
+                            *offsets, sku_size, name_size, code_size))
+        for section in (records, category_table, order, keys, sku_table, name_table,
+                        code_table, strings.data):
+            f.write(section)
+    os.replace(tmp_path, path)
+    return position
+
+
+class BinaryCatalog:
+    """A catalog read in place from a file written by ``compile_catalog``.
+
+    The file is memory-mapped and nothing is decoded up front except the
+    category names: lookups hash into the on-disk tables, and type-ahead
+    bisects the on-disk key array, decoding only the records they return.
+    Offers the same lookups as Catalog.
+
+    The file itself is never modified: ``apply`` hides the records a price
+    book update replaces and keeps the new versions in a small in-memory
+    Catalog that every lookup consults first.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        fields = HEADER.unpack_from(self._mm, 0)
+        magic, version, self._count, category_count = fields[:4]
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"Not a compiled catalog: {path}")
+        self._offsets = dict(zip(SECTIONS, fields[4:4 + len(SECTIONS)]))
+        self._sku_slots, self._name_slots, self._code_slots = fields[4 + len(SECTIONS):]
+        self._strings = self._offsets["strings"]
+
+        self._categories = {}
+        for i in range(category_count + 1):
+            entry = CATEGORY.unpack_from(self._mm, self._offsets["categories"] + i * CATEGORY.size)
+            self._categories[self._str(entry[0], entry[1])] = entry[2:]
+        self.categories = list(self._categories)[:category_count]
+        self._file_categories = self.categories
+        # Items added or changed since the file was compiled, and the
+        # numbers of the records they replace or remove
+        self._overlay = Catalog([])
+        self._hidden: Set[int] = set()
+
+    def close(self):
+        self._mm.close()
+
+    def _str(self, offset: int, length: int) -> str:
+        start = self._strings + offset
+        return self._mm[start:start + length].decode('utf-8')
+
+    def _raw(self, offset: int, length: int) -> bytes:
+        start = self._strings + offset
+        return self._mm[start:start + length]
+
+    def _record(self, number: int) -> Tuple:
+        return RECORD.unpack_from(self._mm, self._offsets["records"] + number * RECORD.size)
+
+    def _item(self, number: int) -> CatalogItem:
+        (sku, sku_len, name, name_len, category, price,
+         barcodes, barcodes_len, plu, plu_len, tax_class, tax_class_len) = self._record(number)
+        barcodes = self._str(barcodes, barcodes_len)
+        return CatalogItem(self._str(sku, sku_len), self._str(name, name_len),
+                           self._file_categories[category], price,
+                           tuple(barcodes.split("|")) if barcodes else (),
+                           self._str(plu, plu_len), self._str(tax_class, tax_class_len))
+
+    def _name(self, number: int) -> str:
+        record = self._record(number)
+        return self._str(record[2], record[3])
+
+    def _find(self, table: str, slots: int, key: str, field: int) -> Optional[int]:
+        """Probe a hash table whose slots point at records, comparing ``field``"""
+        raw = key.encode('utf-8')
+        base = self._offsets[table]
+        pos = key_hash(key) & (slots - 1)
+        while True:
+            value = SLOT.unpack_from(self._mm, base + pos * SLOT.size)[0]
+            if value == 0:
+                return None
+            record = self._record(value - 1)
+            if self._raw(record[field], record[field + 1]) == raw:
+                return value - 1
+            pos = (pos + 1) & (slots - 1)
+
+    def _visible(self, number: Optional[int]) -> Optional[CatalogItem]:
+        if number is None or number in self._hidden:
+            return None
+        return self._item(number)
+
+    def __len__(self) -> int:
+        return self._count - len(self._hidden) + len(self._overlay)
+
+    def items(self) -> List[CatalogItem]:
+        return ([self._item(n) for n in range(self._count) if n not in self._hidden]
+                + self._overlay.items())
+
+    def apply(self, diff: CatalogDiff):
+        """Update the catalog in place with a price book diff"""
+        replaced = diff.removed + [old for old, new in diff.changed]
+        for item in replaced:
+            number = self._find("sku_table", self._sku_slots, item.sku, 0)
+            if number is not None:
+                self._hidden.add(number)
+        self._overlay.apply(CatalogDiff(diff.added + [new for old, new in diff.changed],
+                                        replaced, []))
+        self.categories = sorted(set(self._file_categories) | set(self._overlay.categories))
+
+    def get(self, name: str) -> Optional[CatalogItem]:
+        return (self._overlay.get(name)
+                or self._visible(self._find("name_table", self._name_slots, name, 2)))
+
+    def get_sku(self, sku: str) -> Optional[CatalogItem]:
+        return (self._overlay.get_sku(sku)
+                or self._visible(self._find("sku_table", self._sku_slots, sku, 0)))
+
+    def lookup_code(self, code: str) -> Optional[CatalogItem]:
+        """Return the item with a scanned barcode or PLU"""
+        item = self._overlay.lookup_code(code)
+        if item is not None:
+            return item
+        code = normalize_code(code)
+        raw = code.encode('utf-8')
+        base = self._offsets["code_table"]
+        pos = key_hash(code) & (self._code_slots - 1)
+        while True:
+            offset, length, value = CODE_SLOT.unpack_from(self._mm, base + pos * CODE_SLOT.size)
+            if value == 0:
+                return None
+            if self._raw(offset, length) == raw:
+                return self._visible(value - 1)
+            pos = (pos + 1) & (self._code_slots - 1)
+
+    def _file_names(self, category: str) -> Iterator[str]:
+        entry = self._categories.get(category)
+        if entry is None:
+            return
+        base = self._offsets["order"] + entry[0] * ORDER.size
+        for i in range(entry[1]):
+            number = ORDER.unpack_from(self._mm, base + i * ORDER.size)[0]
+            if number not in self._hidden:
+                yield self._name(number)
+
+    def names(self, category: str = ALL_CATEGORIES, limit: Optional[int] = None) -> List[str]:
+        """Return the sorted item names of a category, or the first ``limit``"""
+        names = heapq.merge(self._file_names(category), self._overlay.names(category))
+        return list(itertools.islice(names, limit))
+
+    def _key(self, position: int) -> Tuple[bytes, int]:
+        offset, length, number = KEY.unpack_from(self._mm, self._offsets["keys"] + position * KEY.size)
+        return self._raw(offset, length), number
+
+    def search(self, prefix: str, category: str = ALL_CATEGORIES,
+               limit: int = CHOICES_LIMIT) -> List[str]:
+        """Return up to ``limit`` names with a word starting with ``prefix``"""
+        prefix = " ".join(WORD.findall(prefix.lower()))
+        if not prefix:
+            return self.names(category, limit)
+        # A category added since compiling has no keys in the file
+        entry = self._categories.get(category, (0, 0, 0, 0))
+
+        # Keys are UTF-8, whose byte order matches the str order they were sorted in
+        raw = prefix.encode('utf-8')
+        lo, hi = entry[2], entry[2] + entry[3]
+        stop = hi
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(mid)[0] < raw:
+                lo = mid + 1
+            else:
+                hi = mid
+        matches: Dict[str, None] = {}
+        while lo < stop and len(matches) < limit:
+            key, number = self._key(lo)
+            if not key.startswith(raw):
+                break
+            if number not in self._hidden:
+                matches[self._name(number)] = None
+            lo += 1
+
+        changed = self._overlay.search(prefix, category, limit)
+        if not changed:
+            return list(matches)
+        # Put the two lists back in key order, as Catalog.search returns them
+        def first_key(name):
+            return min(key for key in name_keys(name) if key.startswith(prefix)), name
+        return sorted(list(matches) + changed, key=first_key)[:limit]
+
+
+def load_catalog(path: str):
+    """Open the price book at ``path``, through its compiled copy when current
+
+    The compiled copy lives next to the CSV with a .bin extension. When it
+    is missing or older than the CSV, the CSV is parsed and compiled again
+    so that the next start-up can map it instead.
+    """
+    compiled = os.path.splitext(path)[0] + ".bin"
+    try:
+        if os.path.getmtime(compiled) >= os.path.getmtime(path):
+            return BinaryCatalog(compiled)
+    except (OSError, ValueError):
+        pass
+
+    catalog = Catalog.load(path)
+    try:
+        compile_catalog(catalog, compiled)
+    except Exception as e:
+        print(f"Error compiling catalog: {e}")
+    return catalog
+
+
+if __name__ == "__main__":
+    # Usage: python catalog_binary.py compile [catalog.csv] [catalog.bin]
+    if len(sys.argv) < 2 or sys.argv[1] != "compile":
+        print("Usage: python catalog_binary.py compile [catalog.csv] [catalog.bin]")
+        sys.exit(1)
+
+    source = sys.argv[2] if len(sys.argv) > 2 else "catalog.csv"
+    target = sys.argv[3] if len(sys.argv) > 3 else os.path.splitext(source)[0] + ".bin"
+    catalog = Catalog.load(source)
+    size = compile_catalog(catalog, target)
+    print(f"Compiled {len(catalog)} items from {source} into {target} ({size:,} bytes)")
@@ -0,0 +1,148 @@
+import heapq
+import threading
+from collections import Counter
+from typing import Callable, Dict, Iterable, List, Optional, Set
+
+from catalog import WORD, CatalogDiff
+
+# Names sharing the most trigrams with the query are scored in full
+CANDIDATES = 200
+# Lowest score offered as a suggestion: the mean, over the typed words,
+# of the best Dice coefficient against a word of the name
+MIN_SCORE = 0.45
+# Item pickers add fuzzy suggestions when prefix matching finds fewer names
+SUGGEST_BELOW = 10
+
+
+def trigrams(word: str) -> Set[str]:
+    """Return the trigrams of a word padded as "  word ", so starts count most"""
+    padded = f"  {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def name_words(name: str) -> List[str]:
+    """Return the lowercase words of a name, without emoji or punctuation"""
+    return WORD.findall(name.lower())
+
+
+def similarity(query: List[Set[str]], words: List[str]) -> float:
+    """Score a name's words against the trigram sets of the typed words"""
+    if not query or not words:
+        return 0.0
+    grams = [trigrams(word) for word in words]
+    total = 0.0
+    for typed in query:
+        total += max(2 * len(typed & word) / (len(typed) + len(word)) for word in grams)
+    return total / len(query)
+
+
+class FuzzyIndex:
+    """Trigram index over item names for misspelt and partial lookups.
+
+    Each name is split into words (dropping emoji such as "🍓 ") and every
+    trigram of every word maps to the names containing it. ``suggest``
+    counts shared trigrams over the posting lists of the typed text, then
+    scores only the best ``CANDIDATES`` names word by word, so "brocoli"
+    finds "🥦 Broccoli" and "pepr" finds "🫑 Bell Pepper". Removed names are
+    left in the posting lists and skipped when counted.
+    """
+
+    def __init__(self, names: Iterable[str] = ()):
+        self._ids: Dict[str, int] = {}
+        self._names: List[Optional[str]] = []
+        self._postings: Dict[str, List[int]] = {}
+        self._lock = threading.Lock()
+        # Set once the initial names are indexed; suggest returns nothing before
+        self.ready = threading.Event()
+        self.add_all(names)
+        self.ready.set()
+
+    @classmethod
+    def build_async(cls, names: Callable[[], Iterable[str]]) -> "FuzzyIndex":
+        """Return an empty index that indexes ``names()`` on a background thread
+
+        Indexing 100k names takes a couple of seconds, which the till does
+        not wait for at start-up.
+        """
+        index = cls()
+        index.ready.clear()
+        # Hold the lock from here, so an update cannot be applied before the build
+        index._lock.acquire()
+
+        def build():
+            try:
+                for name in names():
+                    index._add(name)
+            finally:
+                index._lock.release()
+                index.ready.set()
+
+        threading.Thread(target=build, name="fuzzy-index", daemon=True).start()
+        return index
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def add_all(self, names: Iterable[str]):
+        with self._lock:
+            for name in names:
+                self._add(name)
+
+    def _add(self, name: str):
+        if name in self._ids:
+            return
+        number = self._ids[name] = len(self._names)
+        self._names.append(name)
+        grams = set()
+        for word in name_words(name):
+            grams |= trigrams(word)
+        for gram in grams:
+            postings = self._postings.get(gram)
+            if postings is None:
+                self._postings[gram] = [number]
+            else:
+                postings.append(number)
+
+    def _remove(self, name: str):
+        number = self._ids.pop(name, None)
+        if number is not None:
+            self._names[number] = None
+
+    def apply(self, diff: CatalogDiff):
+        """Follow a price book update (see Catalog.apply)"""
+        with self._lock:
+            for item in diff.removed:
+                self._remove(item.name)
+            for old, new in diff.changed:
+                if old.name != new.name:
+                    self._remove(old.name)
+                    self._add(new.name)
+            for item in diff.added:
+                self._add(item.name)
+
+    def suggest(self, text: str, limit: int = 10,
+                accept: Optional[Callable[[str], bool]] = None) -> List[str]:
+        """Return up to ``limit`` names resembling ``text``, best first
+
+        ``accept`` can reject names, for example those outside a category.
+        """
+        query = [trigrams(word) for word in name_words(text)]
+        if not query or not self.ready.is_set():
+            return []
+        counts: Counter = Counter()
+        with self._lock:
+            for gram in set().union(*query):
+                counts.update(self._postings.get(gram, ()))
+            names = self._names
+            candidates = [names[number] for number, shared
+                          in heapq.nlargest(CANDIDATES, counts.items(), key=lambda entry: entry[1])]
+
+        scored = []
+        for name in candidates:
+            if name is None or (accept is not None and not accept(name)):
+                continue
+            score = similarity(query, name_words(name))
+            if score >= MIN_SCORE:
+                scored.append((-score, len(name), name))
+        scored.sort()
+        return [name for _, _, name in scored[:limit]]
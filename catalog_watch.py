@@ -0,0 +1,98 @@
+import hashlib
+import os
+import threading
+from typing import Callable, Dict, Optional, Tuple
+
+from catalog import CatalogDiff, CatalogItem, diff_items, read_items
+
+
+class CatalogWatcher:
+    """Picks up edits to the price book file while the till is running.
+
+    ``check`` only stats the file, so it can run on the UI thread every
+    ``interval_ms`` (``poll`` reschedules itself through ``schedule``, for
+    example ``root.after``). When the file's size or modification time
+    changes, a background thread reads it, ignores it if the contents hash
+    the same as last time, and diffs its items against the previous
+    version by SKU. The next ``check`` applies the diff with
+    ``catalog.apply`` and passes it to ``on_change``, so the catalog is only
+    ever modified on the thread that reads it.
+    """
+
+    def __init__(self, path: str, catalog, schedule: Optional[Callable[[int, Callable[[], None]], object]] = None,
+                 interval_ms: int = 2000):
+        self.path = path
+        self.catalog = catalog
+        self.schedule = schedule
+        self.interval_ms = interval_ms
+        self.on_change: Optional[Callable[[CatalogDiff], None]] = None
+        self.reloads = 0
+        self._stat = self._file_stat()
+        self._digest: Optional[str] = None
+        # The items last read from the file, by SKU; taken from the catalog
+        # the first time the file changes
+        self._items: Optional[Dict[str, CatalogItem]] = None
+        self._pending: Optional[CatalogDiff] = None
+        self._reading = False
+        self._lock = threading.Lock()
+
+    def _file_stat(self) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def poll(self):
+        """Check for changes now and again every ``interval_ms``"""
+        self.check()
+        if self.schedule is not None:
+            self.schedule(self.interval_ms, self.poll)
+
+    def check(self) -> Optional[CatalogDiff]:
+        """Apply a diff read since the last call and start reading a changed file
+
+        Returns the diff applied, if any.
+        """
+        with self._lock:
+            diff, self._pending = self._pending, None
+            stat = self._file_stat()
+            start = stat is not None and stat != self._stat and not self._reading
+            if start:
+                self._reading = True
+        if start:
+            threading.Thread(target=self._read, args=(stat,), name="catalog-watch",
+                             daemon=True).start()
+
+        if diff:
+            self.catalog.apply(diff)
+            self.reloads += 1
+            if self.on_change is not None:
+                self.on_change(diff)
+        return diff
+
+    def _read(self, stat: Tuple[int, int]):
+        try:
+            with open(self.path, 'rb') as f:
+                data = f.read()
+            if self._file_stat() != stat:
+                # Still being written; the next check sees the new stat and reads it again
+                return
+            digest = hashlib.sha256(data).hexdigest()
+            if digest != self._digest:
+                items = {item.sku: item
+                         for item in read_items(data.decode('utf-8').splitlines(keepends=True))}
+                if self._items is None:
+                    self._items = {item.sku: item for item in self.catalog.items()}
+                diff = diff_items(self._items, items)
+                with self._lock:
+                    self._pending = diff
+                self._items = items
+                self._digest = digest
+            self._stat = stat
+        except Exception as e:
+            print(f"Error reloading catalog: {e}")
+            self._stat = stat
+        finally:
+            with self._lock:
+                self._reading = False
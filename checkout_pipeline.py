@@ -0,0 +1,111 @@
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+Stage = Tuple[str, Callable[[Dict[str, Any]], Any]]
+
+
+class StageResult(NamedTuple):
+    receipt_id: str
+    stage: str
+    # What the stage returned, or None if it failed
+    result: Any
+    # Why the stage failed, or "" if it succeeded
+    error: str
+    seconds: float
+
+
+class CheckoutPipeline:
+    """Runs the slow steps that follow a sale on a background thread.
+
+    The till saves the sale with ``Checkout.complete`` and clears the
+    basket straight away; everything else that used to hold up the lane
+    (making the save durable, rendering the receipt, the PDF, printing)
+    goes to ``submit`` as named stages, each a callable taking the receipt
+    record. A worker thread runs the sales in order and their stages in
+    order; a failing stage is reported and the rest still run.
+
+    Outcomes are handed back like ``CatalogWatcher`` hands back diffs:
+    ``check`` runs on the UI thread (``poll`` reschedules itself through
+    ``schedule``, for example ``root.after``) and passes each StageResult
+    to ``on_result``, so widgets are only touched from the thread that
+    owns them.
+    """
+
+    def __init__(self, schedule: Optional[Callable[[int, Callable[[], None]], object]] = None,
+                 poll_ms: int = 100):
+        self.schedule = schedule
+        self.poll_ms = poll_ms
+        self.on_result: Optional[Callable[[StageResult], None]] = None
+        self.completed = 0
+        self.failed = 0
+        self._jobs: "queue.Queue[Optional[Tuple[Dict[str, Any], List[Stage]]]]" = queue.Queue()
+        self._results: "queue.Queue[StageResult]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = threading.Thread(
+            target=self._run, name="checkout-pipeline", daemon=True)
+        self._thread.start()
+
+    @property
+    def pending(self) -> int:
+        """Sales submitted whose stages have not all run yet"""
+        return self._jobs.unfinished_tasks
+
+    def submit(self, record: Dict[str, Any], stages: Iterable[Stage]):
+        """Queue the stages to run for one saved sale"""
+        stages = list(stages)
+        if stages:
+            self._jobs.put((record, stages))
+
+    def _run(self):
+        while True:
+            job = self._jobs.get()
+            try:
+                if job is None:
+                    return
+                record, stages = job
+                for name, stage in stages:
+                    start = time.perf_counter()
+                    try:
+                        result, error = stage(record), ""
+                    except Exception as e:
+                        result, error = None, str(e) or type(e).__name__
+                    self._results.put(StageResult(record.get("id", ""), name, result, error,
+                                                  time.perf_counter() - start))
+            finally:
+                self._jobs.task_done()
+
+    def poll(self):
+        """Report finished stages now and again every ``poll_ms``"""
+        self.check()
+        if self.schedule is not None:
+            self.schedule(self.poll_ms, self.poll)
+
+    def check(self) -> List[StageResult]:
+        """Pass the stages finished since the last call to ``on_result`` and return them"""
+        results = []
+        while True:
+            try:
+                result = self._results.get_nowait()
+            except queue.Empty:
+                break
+            if result.error:
+                self.failed += 1
+            else:
+                self.completed += 1
+            results.append(result)
+            if self.on_result is not None:
+                self.on_result(result)
+        return results
+
+    def wait(self):
+        """Block until every sale submitted so far has been through its stages"""
+        self._jobs.join()
+
+    def close(self):
+        """Finish the queued sales, stop the worker and report what is left"""
+        if self._thread is not None:
+            self._jobs.put(None)
+            self._thread.join()
+            self._thread = None
+        self.check()
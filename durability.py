@@ -0,0 +1,158 @@
+import os
+import threading
+import time
+from typing import Any, Dict
+
+DURABILITY_MODES = ("none", "fsync", "group")
+
+
+def fsync_path(path: str):
+    """Flush a file, or a directory entry list, to disk"""
+    if os.path.isdir(path):
+        if os.name == "nt":
+            # Windows cannot open directories for fsync; NTFS journals them
+            return
+        flags = os.O_RDONLY
+    else:
+        flags = os.O_RDWR
+    fd = os.open(path, flags)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class DurabilityPolicy:
+    """Decides when receipt writes are forced to disk.
+
+    Stores call ``written(target)`` after each sale, where ``target`` is a
+    path to fsync or a callable that makes the write durable (for example
+    a database commit).
+
+    - "none": nothing is forced; a power cut loses whatever the OS had not
+      yet written back (on most systems, up to about 30 seconds of sales).
+    - "fsync": every sale is synced before ``save`` returns; no completed
+      sale is lost.
+    - "group": a background thread syncs once ``group_size`` sales are
+      pending or ``group_delay_ms`` after the first of them, whichever is
+      sooner; a power cut loses at most that many sales / milliseconds.
+    """
+
+    def __init__(self, mode: str = "none", group_size: int = 32, group_delay_ms: int = 20):
+        if mode not in DURABILITY_MODES:
+            raise ValueError(f"Unknown durability mode: {mode}")
+        self.mode = mode
+        self.group_size = max(1, int(group_size))
+        self.group_delay = max(0, int(group_delay_ms)) / 1000.0
+
+        self.syncs = 0
+        self.batches = 0
+        self._pending: Dict[Any, None] = {}
+        self._pending_count = 0
+        self._first_pending = 0.0
+        self._written = 0
+        self._synced = 0
+        self._cond = threading.Condition()
+        self._closed = False
+        self._thread = None
+        if mode == "group":
+            self._thread = threading.Thread(target=self._run, name="group-commit", daemon=True)
+            self._thread.start()
+
+    def describe_loss(self) -> str:
+        """Explain what a power cut can lose under this policy"""
+        if self.mode == "fsync":
+            return "nothing that was acknowledged"
+        if self.mode == "group":
+            return (f"at most the last {self.group_size} sales or "
+                    f"{self.group_delay * 1000:.0f} ms of sales")
+        return "unflushed sales (typically up to ~30 s, OS dependent)"
+
+    def _sync(self, targets):
+        for target in targets:
+            if callable(target):
+                target()
+            else:
+                fsync_path(target)
+            self.syncs += 1
+
+    def written(self, *targets):
+        """Record a completed sale whose data lives in ``targets``"""
+        if self.mode == "none":
+            return
+        if self.mode == "fsync":
+            self._sync(targets)
+            return
+
+        with self._cond:
+            if not self._pending_count:
+                self._first_pending = time.monotonic()
+            for target in targets:
+                self._pending[target] = None
+            self._pending_count += 1
+            self._written += 1
+            if self._pending_count >= self.group_size:
+                self._cond.notify_all()
+
+    def _take_batch(self):
+        targets = list(self._pending)
+        upto = self._written
+        self._pending.clear()
+        self._pending_count = 0
+        return targets, upto
+
+    def _finish_batch(self, upto: int):
+        with self._cond:
+            self._synced = max(self._synced, upto)
+            self.batches += 1
+            self._cond.notify_all()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending_count and not self._closed:
+                    self._cond.wait()
+                if self._closed and not self._pending_count:
+                    return
+                # Wait for the batch to fill or for the delay to run out
+                while self._pending_count < self.group_size and not self._closed:
+                    remaining = self._first_pending + self.group_delay - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                targets, upto = self._take_batch()
+            try:
+                self._sync(targets)
+            except Exception as e:
+                print(f"Error syncing receipts: {e}")
+            self._finish_batch(upto)
+
+    def wait_durable(self, timeout: float = None) -> bool:
+        """Block until every sale recorded so far has been synced"""
+        if self.mode != "group":
+            return True
+        with self._cond:
+            target = self._written
+            if self._pending_count:
+                # Do not wait out the group delay
+                self._cond.notify_all()
+            return self._cond.wait_for(lambda: self._synced >= target, timeout)
+
+    def sync(self):
+        """Sync everything pending now"""
+        if self.mode != "group":
+            return
+        with self._cond:
+            targets, upto = self._take_batch()
+        self._sync(targets)
+        self._finish_batch(upto)
+
+    def close(self):
+        """Sync what is pending and stop the group commit thread"""
+        self.sync()
+        if self._thread is not None:
+            with self._cond:
+                self._closed = True
+                self._cond.notify_all()
+            self._thread.join()
+            self._thread = None
@@ -0,0 +1,91 @@
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+from typing import List, Optional
+
+from basket import Basket, Checkout
+from catalog_binary import load_catalog
+from promotions import PromotionRules, load_promotions
+from receipt_ids import ReceiptIdAllocator
+from receipt_search import SEARCH_INDEX_FILE, ReceiptSearchIndex
+from receipt_store import open_receipt_store
+from settings import load_settings
+from tax import TaxTable
+
+
+def run_sales(checkout: Checkout, catalog, sales: int, lines: int,
+              cashier: str = "headless", seed: int = 1,
+              promotions: Optional[PromotionRules] = None,
+              taxes: Optional[TaxTable] = None) -> List[float]:
+    """Ring up ``sales`` random baskets of up to ``lines`` lines
+
+    Every sale goes through Checkout.complete, as a sale at the till does.
+    Returns the milliseconds each checkout took.
+    """
+    rng = random.Random(seed)
+    names = catalog.names()
+    basket = Basket(taxes, promotions)
+    timings = []
+    for _ in range(sales):
+        for _ in range(rng.randint(1, lines)):
+            basket.add(catalog.get(rng.choice(names)), rng.randint(1, 3))
+        start = time.perf_counter()
+        checkout.complete(basket, cashier)
+        timings.append((time.perf_counter() - start) * 1000)
+        basket.clear()
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run the till without a display, pushing synthetic sales through "
+                    "the same checkout and receipt storage as the window")
+    parser.add_argument("--sales", type=int, default=5000)
+    parser.add_argument("--lines", type=int, default=8, help="most lines per basket")
+    parser.add_argument("--store", choices=("text", "sqlite", "journal"),
+                        help="receipt store (default: the receipt_store setting)")
+    parser.add_argument("--receipts-dir",
+                        help="where receipts go (default: a temporary folder, removed afterwards)")
+    args = parser.parse_args()
+
+    settings = load_settings()
+    if args.store:
+        settings["receipt_store"] = args.store
+    workdir = args.receipts_dir or tempfile.mkdtemp(prefix="till_headless_")
+    settings.update({"receipts_dir": workdir,
+                     "receipt_db": os.path.join(workdir, "receipts.db"),
+                     "journal_dir": os.path.join(workdir, "journal")})
+    os.makedirs(workdir, exist_ok=True)
+
+    try:
+        catalog = load_catalog(settings["catalog_file"])
+        promotions = load_promotions(settings["promotions_file"], catalog)
+        store = open_receipt_store(settings)
+        receipt_ids = ReceiptIdAllocator(os.path.join(workdir, "sequence.json"),
+                                         till_id=settings["till_id"],
+                                         block_size=settings["receipt_id_block"])
+        search_index = ReceiptSearchIndex(os.path.join(workdir, SEARCH_INDEX_FILE), store)
+        checkout = Checkout(store, receipt_ids, search_index)
+
+        start = time.perf_counter()
+        timings = run_sales(checkout, catalog, args.sales, args.lines, promotions=promotions,
+                            taxes=TaxTable(settings["vat_rates"]))
+        store.close()
+        elapsed = time.perf_counter() - start
+
+        timings.sort()
+        print(f"{args.sales} sales through the {settings['receipt_store']} store "
+              f"({settings['receipt_durability']} durability) in {elapsed:.2f}s: "
+              f"{args.sales / elapsed:,.0f} sales/s")
+        print(f"checkout p50 {timings[len(timings) // 2]:.3f} ms, "
+              f"p99 {timings[len(timings) * 99 // 100]:.3f} ms")
+    finally:
+        if not args.receipts_dir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+from decimal import Decimal, ROUND_HALF_UP
+from functools import total_ordering
+from typing import Dict, Tuple, Union
+
+# Money is held as integer pence from the catalog to the receipt. The only
+# roundings are below, both to the nearest penny with halves rounded up:
+#   - reading a pounds amount (a catalog price, a search like total>5.5)
+#   - taking the VAT out of a VAT-inclusive total
+# Splitting a discount across VAT rates (``apportion``) hands out whole
+# pence, so the parts always add up to the discount.
+
+
+def to_pence(amount) -> int:
+    """Convert a pounds amount (Decimal, str or float) to integer pence"""
+    return int((Decimal(str(amount)) * 100).quantize(Decimal('1'), rounding=ROUND_HALF_UP))
+
+
+def format_pence(pence: int) -> str:
+    """Format integer pence as a pounds string, e.g. 180 -> '1.80'"""
+    sign = "-" if pence < 0 else ""
+    return f"{sign}{abs(pence) // 100}.{abs(pence) % 100:02d}"
+
+
+def vat_pence_of(total_pence: int, vat_rate: Decimal) -> int:
+    """Return the VAT included in a total: total x rate / (1 + rate), to the nearest penny
+
+    Shelf prices include VAT, so a £1.80 sale at 20% is £1.50 plus £0.30 VAT.
+    Worked in integers from the rate's exact ratio, rounding as ``to_pence``.
+    """
+    return vat_pence_from_ratio(total_pence, vat_rate.as_integer_ratio())
+
+
+def vat_pence_from_ratio(total_pence: int, ratio: Tuple[int, int]) -> int:
+    """``vat_pence_of`` for a rate given as its (numerator, denominator)"""
+    numerator, denominator = ratio
+    vat, remainder = divmod(abs(total_pence) * numerator, denominator + numerator)
+    if 2 * remainder >= denominator + numerator:
+        vat += 1
+    return vat if total_pence >= 0 else -vat
+
+
+def apportion(pence: int, weights: Dict[str, int]) -> Dict[str, int]:
+    """Split ``pence`` across keys in proportion to their weights
+
+    Whole pence go to the largest remainders, so the parts add up exactly.
+    With no positive weight the whole amount goes to the first key.
+    """
+    if not weights:
+        return {}
+    total = sum(weight for weight in weights.values() if weight > 0)
+    if len(weights) == 1 or total <= 0:
+        return {next(iter(weights)): pence}
+    shares = {}
+    remainders = []
+    for key, weight in weights.items():
+        share, remainder = divmod(pence * max(weight, 0), total)
+        shares[key] = share
+        remainders.append((-remainder, key))
+    remainders.sort()
+    for _, key in remainders[:pence - sum(shares.values())]:
+        shares[key] += 1
+    return shares
+
+
+@total_ordering
+class Money:
+    """An amount of money in whole pence.
+
+    Adding, subtracting and multiplying by a quantity stay in integers, so
+    basket lines and totals never round; ``str`` gives pounds ("1.80") and
+    format specs apply to that string, so f"£{price:>7}" lines up.
+    """
+
+    __slots__ = ("pence",)
+
+    def __init__(self, pence: int = 0):
+        self.pence = pence
+
+    @classmethod
+    def parse(cls, amount: Union[str, Decimal, float]) -> "Money":
+        """Read a pounds amount such as "1.80" (see ``to_pence``)"""
+        return cls(to_pence(amount))
+
+    def vat(self, vat_rate: Decimal) -> "Money":
+        """Return the VAT included in this amount (see ``vat_pence_of``)"""
+        return Money(vat_pence_of(self.pence, vat_rate))
+
+    def __add__(self, other: "Money") -> "Money":
+        return Money(self.pence + other.pence)
+
+    def __radd__(self, other) -> "Money":
+        # Lets sum() start from 0
+        if other == 0:
+            return self
+        return NotImplemented
+
+    def __sub__(self, other: "Money") -> "Money":
+        return Money(self.pence - other.pence)
+
+    def __mul__(self, qty: int) -> "Money":
+        return Money(self.pence * qty)
+
+    __rmul__ = __mul__
+
+    def __neg__(self) -> "Money":
+        return Money(-self.pence)
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, Money):
+            return self.pence == other.pence
+        return NotImplemented
+
+    def __lt__(self, other: "Money") -> bool:
+        return self.pence < other.pence
+
+    def __hash__(self) -> int:
+        return hash(self.pence)
+
+    def __bool__(self) -> bool:
+        return self.pence != 0
+
+    def __str__(self) -> str:
+        return format_pence(self.pence)
+
+    def __format__(self, spec: str) -> str:
+        return format(str(self), spec)
+
+    def __repr__(self) -> str:
+        return f"Money('{self}')"
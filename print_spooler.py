@@ -0,0 +1,292 @@
+import itertools
+import os
+import queue
+import shutil
+import subprocess
+import sys
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, NamedTuple, Optional, Tuple
+
+from receipt_pdf import render_receipt_pdf
+
+
+class PrintBackend:
+    """Sends a finished PDF file to a printer.
+
+    ``print_file`` raises if the printer did not take the file; the
+    spooler retries it. ``keep_ms`` is how long the file must stay on disk
+    after ``print_file`` returns, for backends that read it later.
+    """
+
+    keep_ms = 0
+
+    def print_file(self, path: str):
+        raise NotImplementedError
+
+
+class LpBackend(PrintBackend):
+    """Prints through CUPS with the ``lp`` command (which copies the file)"""
+
+    def __init__(self, printer: str = "", command: str = "lp", timeout: float = 30):
+        self.printer = printer
+        self.command = command
+        self.timeout = timeout
+
+    def print_file(self, path: str):
+        args = [self.command] + (["-d", self.printer] if self.printer else []) + [path]
+        done = subprocess.run(args, capture_output=True, text=True, timeout=self.timeout)
+        if done.returncode != 0:
+            raise OSError(done.stderr.strip() or f"{self.command} exited with {done.returncode}")
+
+
+class DeviceBackend(PrintBackend):
+    """Writes the file's bytes to a printer device such as /dev/usb/lp0"""
+
+    def __init__(self, device: str):
+        self.device = device
+
+    def print_file(self, path: str):
+        with open(path, 'rb') as src, open(self.device, 'wb') as out:
+            shutil.copyfileobj(src, out)
+
+
+class DirectoryBackend(PrintBackend):
+    """Stands in for a printer by copying each file into a folder, for tests and benchmarks
+
+    Files appear whole (copied under a temporary name, then renamed).
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def print_file(self, path: str):
+        target = os.path.join(self.directory, os.path.basename(path))
+        shutil.copyfile(path, target + ".tmp")
+        os.replace(target + ".tmp", target)
+
+
+class WindowsBackend(PrintBackend):
+    """Prints with the PDF viewer Windows associates with printing (``os.startfile``)"""
+
+    # The viewer opens the file after startfile returns
+    keep_ms = 60000
+
+    def print_file(self, path: str):
+        os.startfile(path, 'print')
+
+
+def open_print_backend(settings: Dict[str, Any]) -> PrintBackend:
+    """Create the print backend selected by the 'print_backend' setting"""
+    backend = settings["print_backend"]
+    if backend == "auto":
+        backend = "windows" if sys.platform == "win32" else "lp"
+    if backend == "lp":
+        return LpBackend(settings["printer_name"])
+    if backend == "device":
+        return DeviceBackend(settings["print_device"])
+    if backend == "directory":
+        return DirectoryBackend(settings["print_dir"])
+    if backend == "windows":
+        return WindowsBackend()
+    raise ValueError(f"Unknown print backend: {backend}")
+
+
+class PrintJob(NamedTuple):
+    job_id: int
+    record: Dict[str, Any]
+    queued: float
+
+
+class PrintResult(NamedTuple):
+    job_id: int
+    receipt_id: str
+    # Why the job was given up on, or "" if it printed
+    error: str
+    attempts: int
+    # From submit until the printer took the job (or the last attempt failed)
+    seconds: float
+
+
+class PrintSpooler:
+    """Prints receipts on a background thread from a bounded queue.
+
+    ``submit`` only queues the receipt record, so it can be called from
+    the UI thread or a background one; when ``max_jobs`` are already
+    waiting it returns None rather than block. A worker thread renders
+    each job to its own file in ``spool_dir`` (named after the receipt
+    and the job number, so reprints never share a file), hands it to
+    ``backend`` and deletes it once the printer has it. A job that fails
+    is retried after ``backoff_ms``, doubling each time, up to ``retries``
+    more times.
+
+    Results are handed back like CheckoutPipeline's: ``check`` (or
+    ``poll``, rescheduling through ``schedule``) passes each PrintResult
+    to ``on_result`` on the calling thread. ``depth``, ``max_depth``,
+    ``printed``, ``failed``, ``retried`` and ``latencies`` (milliseconds
+    from submit to printed, for the last ``max_latencies`` jobs) show how
+    the queue is coping; ``stats`` sums them up.
+    """
+
+    def __init__(self, backend: PrintBackend, spool_dir: str, max_jobs: int = 32,
+                 retries: int = 3, backoff_ms: int = 500,
+                 render: Callable[[Dict[str, Any], str], None] = render_receipt_pdf,
+                 schedule: Optional[Callable[[int, Callable[[], None]], object]] = None,
+                 poll_ms: int = 200, max_latencies: int = 1000):
+        self.backend = backend
+        self.spool_dir = spool_dir
+        self.retries = retries
+        self.backoff_ms = backoff_ms
+        self.render = render
+        self.schedule = schedule
+        self.poll_ms = poll_ms
+        self.on_result: Optional[Callable[[PrintResult], None]] = None
+        self.printed = 0
+        self.failed = 0
+        self.retried = 0
+        self.max_depth = 0
+        self.latencies: Deque[float] = deque(maxlen=max_latencies)
+        os.makedirs(spool_dir, exist_ok=True)
+        # Jobs left over from a previous run are not printed again
+        for name in os.listdir(spool_dir):
+            if name.endswith(".pdf"):
+                self._remove(os.path.join(spool_dir, name))
+        self._jobs: "queue.Queue[Optional[PrintJob]]" = queue.Queue(max_jobs)
+        self._results: "queue.Queue[PrintResult]" = queue.Queue()
+        self._ids = itertools.count(1)
+        # Files a backend may still be reading: (delete after, path)
+        self._kept: List[Tuple[float, str]] = []
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = threading.Thread(
+            target=self._run, name="print-spooler", daemon=True)
+        self._thread.start()
+
+    @property
+    def depth(self) -> int:
+        """Jobs waiting or printing"""
+        return self._jobs.unfinished_tasks
+
+    def submit(self, record: Dict[str, Any]) -> Optional[int]:
+        """Queue a receipt for printing; return its job number, or None if the queue is full"""
+        job = PrintJob(next(self._ids), record, time.perf_counter())
+        try:
+            self._jobs.put_nowait(job)
+        except queue.Full:
+            return None
+        self.max_depth = max(self.max_depth, self.depth)
+        return job.job_id
+
+    def _run(self):
+        while True:
+            try:
+                job = self._jobs.get(timeout=1.0)
+            except queue.Empty:
+                self._delete_kept()
+                continue
+            try:
+                if job is None:
+                    return
+                self._print(job)
+            finally:
+                self._jobs.task_done()
+            self._delete_kept()
+
+    def _print(self, job: PrintJob):
+        receipt_id = job.record.get("id", "receipt")
+        path = os.path.join(self.spool_dir, f"{receipt_id}-{job.job_id}.pdf")
+        error, attempts, rendered = "", 0, False
+        while True:
+            attempts += 1
+            try:
+                if not rendered:
+                    self.render(job.record, path)
+                    rendered = True
+                self.backend.print_file(path)
+                error = ""
+                break
+            except Exception as e:
+                error = str(e) or type(e).__name__
+            if attempts > self.retries or self._stop.is_set():
+                break
+            self.retried += 1
+            self._stop.wait(self.backoff_ms * 2 ** (attempts - 1) / 1000)
+
+        seconds = time.perf_counter() - job.queued
+        if error:
+            self.failed += 1
+        else:
+            self.printed += 1
+            self.latencies.append(seconds * 1000)
+        if error or not self.backend.keep_ms:
+            self._remove(path)
+        else:
+            self._kept.append((time.monotonic() + self.backend.keep_ms / 1000, path))
+        self._results.put(PrintResult(job.job_id, receipt_id, error, attempts, seconds))
+
+    def _delete_kept(self):
+        now = time.monotonic()
+        keep = []
+        for deadline, path in self._kept:
+            if deadline <= now:
+                self._remove(path)
+            else:
+                keep.append((deadline, path))
+        self._kept = keep
+
+    @staticmethod
+    def _remove(path: str):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def poll(self):
+        """Report finished jobs now and again every ``poll_ms``"""
+        self.check()
+        if self.schedule is not None:
+            self.schedule(self.poll_ms, self.poll)
+
+    def check(self) -> List[PrintResult]:
+        """Pass the jobs finished since the last call to ``on_result`` and return them"""
+        results = []
+        while True:
+            try:
+                result = self._results.get_nowait()
+            except queue.Empty:
+                break
+            results.append(result)
+            if self.on_result is not None:
+                self.on_result(result)
+        return results
+
+    def wait(self):
+        """Block until every job submitted so far has printed or failed"""
+        self._jobs.join()
+
+    def stats(self) -> Dict[str, Any]:
+        ordered = sorted(self.latencies)
+
+        def at(fraction):
+            return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] if ordered else 0.0
+        return {"depth": self.depth, "max_depth": self.max_depth, "printed": self.printed,
+                "failed": self.failed, "retried": self.retried,
+                "p50_ms": at(0.5), "p99_ms": at(0.99)}
+
+    def close(self, timeout: Optional[float] = None):
+        """Print what is queued, giving up on retries after ``timeout`` seconds, and stop"""
+        if self._thread is None:
+            return
+        stopper = None
+        if timeout is not None:
+            stopper = threading.Timer(timeout, self._stop.set)
+            stopper.start()
+        self._jobs.put(None)
+        self._thread.join()
+        self._thread = None
+        if stopper is not None:
+            stopper.cancel()
+        # Files a backend may still be reading are left for the next start to delete
+        self._delete_kept()
+        self.check()
@@ -0,0 +1,407 @@
+import bisect
+import json
+import os
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from money import Money, apportion, to_pence
+from tax import STANDARD
+
+# Promotions are read from a JSON list of rules, each with an "id", a
+# "name" shown on receipts and a "type":
+#
+#   {"id": "fruit3", "name": "Any 3 fruit for £5", "type": "multibuy",
+#    "categories": ["Fruits"], "qty": 3, "price": "5.00"}
+#   {"id": "kiwi", "name": "Kiwi buy one get one free", "type": "bogof",
+#    "skus": ["1010"]}                       # optional "buy" and "free" counts
+#   {"id": "lunch", "name": "Meal deal £3", "type": "meal_deal", "price": "3.00",
+#    "components": [{"skus": ["1001", "1002"]}, {"categories": ["Vegetables"]}]}
+#   {"id": "spend20", "name": "£2 off £20", "type": "threshold",
+#    "spend": "20.00", "off": "2.00"}
+#
+# "skus" and "categories" say which items a rule covers; a multibuy or
+# BOGOF over a category is mix and match across it.
+
+# The (skus, categories) a rule or meal deal component covers
+Scope = Tuple[Tuple[str, ...], Tuple[str, ...]]
+
+
+class Units:
+    """The units of basket items a promotion covers, counted by price
+
+    Prices are kept sorted as they come and go, so a promotion can walk
+    them dearest first without sorting the basket again.
+    """
+    __slots__ = ("prices", "counts", "total")
+
+    def __init__(self):
+        self.prices: List[int] = []
+        self.counts: Dict[int, int] = {}
+        self.total = 0
+
+    def add(self, price_pence: int, units: int):
+        """Add (or with negative ``units``, take away) units at a price"""
+        count = self.counts.get(price_pence, 0) + units
+        if price_pence not in self.counts:
+            bisect.insort(self.prices, price_pence)
+        if count:
+            self.counts[price_pence] = count
+        else:
+            del self.counts[price_pence]
+            del self.prices[bisect.bisect_left(self.prices, price_pence)]
+        self.total += units
+
+    def descending(self) -> Iterator[Tuple[int, int]]:
+        """Yield (price, units), dearest first"""
+        counts = self.counts
+        for price in reversed(self.prices):
+            yield price, counts[price]
+
+
+class Promotion:
+    """A promotion on basket items, priced from the units it covers.
+
+    ``components`` is the number of ``Units`` that ``discount`` is given;
+    only meal deals have more than one.
+    """
+    components = 1
+
+    def __init__(self, rule_id: str, name: str, order: int):
+        self.id = rule_id
+        self.name = name
+        self.order = order
+
+    def discount(self, units: List[Units]) -> int:
+        raise NotImplementedError
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.id!r})"
+
+
+def _groups(units: Units, size: int) -> Iterator[Tuple[int, Tuple[int, ...]]]:
+    """Split units, dearest first, into groups of ``size``
+
+    Yields (number of groups, prices in the group, dearest first). Runs
+    of identical groups come out together, so the work depends on the
+    number of different prices rather than the number of units.
+    """
+    left = units.total // size
+    group: List[int] = []
+    for price, count in units.descending():
+        if not left:
+            return
+        if group:
+            # Finish the group the dearer prices started
+            take = min(count, size - len(group))
+            group.extend((price,) * take)
+            count -= take
+            if len(group) < size:
+                continue
+            yield 1, tuple(group)
+            left -= 1
+            group = []
+        runs = min(count // size, left)
+        if runs:
+            yield runs, (price,) * size
+            left -= runs
+            count -= runs * size
+        if left and count:
+            group = [price] * count
+
+
+class Multibuy(Promotion):
+    """Any ``qty`` covered items for ``price``, dearest items grouped first"""
+
+    def __init__(self, rule_id: str, name: str, order: int, qty: int, price_pence: int):
+        super().__init__(rule_id, name, order)
+        if qty < 2 or price_pence < 0:
+            raise ValueError("multibuy needs a qty of at least 2 and a price")
+        self.qty = qty
+        self.price_pence = price_pence
+
+    def discount(self, units: List[Units]) -> int:
+        discount = 0
+        for groups, prices in _groups(units[0], self.qty):
+            saving = sum(prices) - self.price_pence
+            if saving <= 0:
+                # Later groups are cheaper still
+                break
+            discount += groups * saving
+        return discount
+
+
+class BuyGetFree(Promotion):
+    """Buy ``buy`` covered items and get ``free`` more free, the cheapest of each group"""
+
+    def __init__(self, rule_id: str, name: str, order: int, buy: int = 1, free: int = 1):
+        super().__init__(rule_id, name, order)
+        if buy < 1 or free < 1:
+            raise ValueError("buy and free must be at least 1")
+        self.buy = buy
+        self.free = free
+
+    def discount(self, units: List[Units]) -> int:
+        return sum(groups * sum(prices[self.buy:])
+                   for groups, prices in _groups(units[0], self.buy + self.free))
+
+
+class MealDeal(Promotion):
+    """One item from each component for ``price``, dearest items paired first"""
+
+    def __init__(self, rule_id: str, name: str, order: int, components: int, price_pence: int):
+        super().__init__(rule_id, name, order)
+        if components < 2 or price_pence < 0:
+            raise ValueError("meal deal needs at least two components and a price")
+        self.components = components
+        self.price_pence = price_pence
+
+    def discount(self, units: List[Units]) -> int:
+        deals = min(component.total for component in units)
+        walks = [component.descending() for component in units]
+        current = [[0, 0] for _ in units]
+        discount = 0
+        while deals:
+            for walk, entry in zip(walks, current):
+                if not entry[1]:
+                    entry[:] = next(walk)
+            # As many deals as every component can fill at its current price
+            step = min(deals, min(count for _, count in current))
+            saving = sum(price for price, _ in current) - self.price_pence
+            if saving <= 0:
+                # Later deals are cheaper still
+                break
+            discount += step * saving
+            deals -= step
+            for entry in current:
+                entry[1] -= step
+        return discount
+
+
+class SpendThreshold:
+    """``off`` off the basket once it comes to ``spend`` after other promotions"""
+
+    def __init__(self, rule_id: str, name: str, order: int, spend_pence: int, off_pence: int):
+        if spend_pence <= 0 or not 0 < off_pence <= spend_pence:
+            raise ValueError("threshold needs a spend and an amount off no larger than it")
+        self.id = rule_id
+        self.name = name
+        self.order = order
+        self.spend_pence = spend_pence
+        self.off_pence = off_pence
+
+
+def _scope(rule: Dict[str, Any]) -> Scope:
+    skus = tuple(str(sku).strip() for sku in rule.get("skus", ()))
+    categories = tuple(str(category).strip() for category in rule.get("categories", ()))
+    if not skus and not categories:
+        raise ValueError("no skus or categories")
+    return skus, categories
+
+
+def read_rules(rules: Iterable[Dict[str, Any]]) -> "PromotionRules":
+    """Compile a list of rule dicts, skipping bad rules"""
+    promotions = []
+    for order, rule in enumerate(rules):
+        try:
+            rule_id = str(rule["id"])
+            name = str(rule.get("name") or rule_id)
+            kind = rule["type"]
+            if kind == "multibuy":
+                promotion = Multibuy(rule_id, name, order, int(rule["qty"]), to_pence(rule["price"]))
+                scopes = [_scope(rule)]
+            elif kind == "bogof":
+                promotion = BuyGetFree(rule_id, name, order, int(rule.get("buy", 1)),
+                                       int(rule.get("free", 1)))
+                scopes = [_scope(rule)]
+            elif kind == "meal_deal":
+                scopes = [_scope(component) for component in rule["components"]]
+                promotion = MealDeal(rule_id, name, order, len(scopes), to_pence(rule["price"]))
+            elif kind == "threshold":
+                promotion = SpendThreshold(rule_id, name, order, to_pence(rule["spend"]),
+                                           to_pence(rule["off"]))
+                scopes = []
+            else:
+                raise ValueError(f"unknown type {kind!r}")
+            promotions.append((promotion, scopes))
+        except Exception as e:
+            print(f"Skipping promotion {order + 1}: {e}")
+    return PromotionRules(promotions)
+
+
+class PromotionRules:
+    """Promotion rules compiled for lookup by SKU and by category.
+
+    An item gets at most one item promotion: the first rule in the file
+    that names its SKU or its category. ``by_sku`` and ``by_category``
+    hold that rule (and which meal deal component the item fills) for
+    every SKU and category a rule names, so finding the rule a basket
+    line belongs to is two dict lookups. Spend thresholds are kept apart,
+    as they depend only on the basket total.
+    """
+
+    def __init__(self, promotions: Iterable[Tuple[Any, List[Scope]]] = ()):
+        self.promotions: List[Promotion] = []
+        self.thresholds: List[SpendThreshold] = []
+        self.by_sku: Dict[str, Tuple[Promotion, int]] = {}
+        self.by_category: Dict[str, Tuple[Promotion, int]] = {}
+        for promotion, scopes in promotions:
+            if isinstance(promotion, SpendThreshold):
+                self.thresholds.append(promotion)
+                continue
+            self.promotions.append(promotion)
+            for component, (skus, categories) in enumerate(scopes):
+                for sku in skus:
+                    self.by_sku.setdefault(sku, (promotion, component))
+                for category in categories:
+                    self.by_category.setdefault(category, (promotion, component))
+
+    def __len__(self) -> int:
+        return len(self.promotions) + len(self.thresholds)
+
+    def match(self, sku: str, category: str) -> Optional[Tuple[Promotion, int]]:
+        """Return the promotion covering an item and the component it fills"""
+        by_sku = self.by_sku.get(sku)
+        by_category = self.by_category.get(category)
+        if by_sku is None or (by_category is not None and by_category[0].order < by_sku[0].order):
+            return by_category
+        return by_sku
+
+    def check(self, catalog) -> List[str]:
+        """Return a warning for every SKU or category no catalog item has"""
+        categories = set(catalog.categories)
+        warnings = [f"Promotion {promotion.id}: no item with SKU {sku}"
+                    for sku, (promotion, _) in self.by_sku.items() if catalog.get_sku(sku) is None]
+        warnings += [f"Promotion {promotion.id}: no category {category}"
+                     for category, (promotion, _) in self.by_category.items()
+                     if category not in categories]
+        return warnings
+
+    def evaluate(self, lines: Iterable[Tuple[str, str, int, int]]) -> int:
+        """Price (sku, category, price pence, qty) lines from scratch; return the discount
+
+        What ``PromotionState`` keeps up to date line by line, for checking it.
+        """
+        state = PromotionState(self)
+        total = 0
+        for sku, category, price_pence, qty in lines:
+            total += price_pence * qty
+            match = self.match(sku, category)
+            if match is not None:
+                promotion, component = match
+                if promotion not in state._units:
+                    state._units[promotion] = [Units() for _ in range(promotion.components)]
+                state._units[promotion][component].add(price_pence, qty)
+        for promotion, covered in state._units.items():
+            state._set(promotion, promotion.discount(covered))
+        return state.discount_pence(total)
+
+
+def load_promotions(path: str, catalog=None) -> PromotionRules:
+    """Read and compile the promotions file; no file means no promotions
+
+    With a catalog, rules naming SKUs or categories it lacks are reported.
+    """
+    if not os.path.exists(path):
+        return PromotionRules()
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            rules = read_rules(json.load(f))
+    except Exception as e:
+        print(f"Error loading promotions: {e}")
+        return PromotionRules()
+    if catalog is not None:
+        for warning in rules.check(catalog):
+            print(warning)
+    return rules
+
+
+class PromotionState:
+    """The discounts a basket's promotions give, kept up to date line by line.
+
+    ``change`` records units of an item entering or leaving the basket and
+    re-prices only the promotion covering that item, from its own price
+    buckets. The cost of a change grows with the number of different
+    prices that promotion covers in the basket, not with the basket: flat
+    for a SKU list, but a category-wide rule on a huge basket can cover
+    hundreds.
+    ``item_pence`` is the running sum of item promotion discounts; spend
+    thresholds are applied on top by ``discount_pence``.
+
+    For VAT, each promotion's discount is split across the tax classes of
+    the items it covers, in proportion to their value (``money.apportion``),
+    and kept summed by class in ``item_by_class``; a spend threshold is
+    split across the whole basket the same way.
+    """
+
+    def __init__(self, rules: PromotionRules):
+        self.rules = rules
+        self.item_pence = 0
+        self.item_by_class: Dict[str, int] = {}
+        self._units: Dict[Promotion, List[Units]] = {}
+        self._gross: Dict[Promotion, Dict[str, int]] = {}
+        self._discounts: Dict[Promotion, Dict[str, int]] = {}
+
+    def change(self, sku: str, category: str, price_pence: int, units: int,
+               tax_class: str = STANDARD) -> bool:
+        """Record units entering (or leaving) the basket; return whether a promotion covers them"""
+        match = self.rules.match(sku, category)
+        if match is None:
+            return False
+        promotion, component = match
+        covered = self._units.get(promotion)
+        if covered is None:
+            covered = self._units[promotion] = [Units() for _ in range(promotion.components)]
+            self._gross[promotion] = {}
+        covered[component].add(price_pence, units)
+        gross = self._gross[promotion]
+        gross[tax_class] = gross.get(tax_class, 0) + price_pence * units
+        if not gross[tax_class]:
+            del gross[tax_class]
+        self._set(promotion, promotion.discount(covered))
+        return True
+
+    def _set(self, promotion: Promotion, discount: int):
+        for tax_class, pence in self._discounts.pop(promotion, {}).items():
+            self.item_pence -= pence
+            self.item_by_class[tax_class] -= pence
+        if discount:
+            split = apportion(discount, self._gross.get(promotion) or {STANDARD: 1})
+            self._discounts[promotion] = split
+            for tax_class, pence in split.items():
+                self.item_pence += pence
+                self.item_by_class[tax_class] = self.item_by_class.get(tax_class, 0) + pence
+
+    def threshold(self, lines_pence: int) -> Optional[SpendThreshold]:
+        """Return the best spend threshold the basket reaches, if any"""
+        spend = lines_pence - self.item_pence
+        reached = [rule for rule in self.rules.thresholds if spend >= rule.spend_pence]
+        return max(reached, key=lambda rule: rule.off_pence, default=None)
+
+    def discount_pence(self, lines_pence: int) -> int:
+        threshold = self.threshold(lines_pence)
+        return self.item_pence + (threshold.off_pence if threshold else 0)
+
+    def discount_by_class(self, lines_by_class: Dict[str, int]) -> Dict[str, int]:
+        """Return the basket's whole discount split by tax class, given its lines by class"""
+        by_class = {code: pence for code, pence in self.item_by_class.items() if pence}
+        threshold = self.threshold(sum(lines_by_class.values()))
+        if threshold is not None:
+            spend = {code: gross - by_class.get(code, 0) for code, gross in lines_by_class.items()}
+            for code, pence in apportion(threshold.off_pence, spend).items():
+                by_class[code] = by_class.get(code, 0) + pence
+        return by_class
+
+    def discounts(self, lines_pence: int) -> List[Tuple[str, Money]]:
+        """Return the (name, amount off) discount lines, in promotions file order"""
+        applied = sorted(self._discounts.items(), key=lambda entry: entry[0].order)
+        lines = [(promotion.name, Money(sum(split.values()))) for promotion, split in applied]
+        threshold = self.threshold(lines_pence)
+        if threshold is not None:
+            lines.append((threshold.name, Money(threshold.off_pence)))
+        return lines
+
+    def clear(self):
+        self.item_pence = 0
+        self.item_by_class = {}
+        self._units = {}
+        self._gross = {}
+        self._discounts = {}
@@ -0,0 +1,195 @@
+import json
+import lzma
+import os
+import random
+import struct
+import sys
+import threading
+import time
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+
+from receipt_record import dumps_record, loads_record, record_summary
+from receipt_store import ReceiptStore, in_range
+
+ARCHIVE_SUFFIX = ".rca"
+MAGIC = b"RCA1"
+# Index offset and length, then the magic again to detect truncated files
+FOOTER = struct.Struct("<QI4s")
+# Receipts are compressed together in blocks of about this many bytes, so a
+# lookup decompresses one block rather than the whole archive
+BLOCK_BYTES = 64 * 1024
+
+CODECS = {
+    "zlib": (lambda data: zlib.compress(data, 9), zlib.decompress),
+    "lzma": (lzma.compress, lzma.decompress),
+}
+
+
+def write_archive(path: str, records: List[Dict[str, Any]], codec: str = "lzma",
+                  block_bytes: int = BLOCK_BYTES) -> int:
+    """Pack receipt records into a compressed archive and return its size
+
+    Layout: MAGIC, the codec name, compressed blocks of JSON lines, the
+    compressed index (summaries with block and line numbers), then FOOTER.
+    """
+    if codec not in CODECS:
+        raise ValueError(f"Unknown archive codec: {codec}")
+    compress = CODECS[codec][0]
+    entries, blocks, chunk = [], [], []
+    chunk_bytes = 0
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC + codec.encode('ascii'))
+
+        def write_block():
+            data = compress(b"\n".join(chunk))
+            blocks.append([f.tell(), len(data)])
+            f.write(data)
+
+        for record in sorted(records, key=lambda r: (r["timestamp"], r["id"])):
+            line = dumps_record(record).encode('utf-8')
+            entry = record_summary(record)
+            entry.update({"block": len(blocks), "line": len(chunk)})
+            entries.append(entry)
+            chunk.append(line)
+            chunk_bytes += len(line)
+            if chunk_bytes >= block_bytes:
+                write_block()
+                chunk, chunk_bytes = [], 0
+        if chunk:
+            write_block()
+
+        index = compress(json.dumps({"blocks": blocks, "entries": entries},
+                                    ensure_ascii=False).encode('utf-8'))
+        offset = f.tell()
+        f.write(index)
+        f.write(FOOTER.pack(offset, len(index), MAGIC))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return os.path.getsize(path)
+
+
+class ArchivedPartition(ReceiptStore):
+    """Read access to one archive written by ``write_archive``.
+
+    Only the index is decompressed on open; ``get_record`` decompresses the
+    one block holding the receipt, and keeps the last block for neighbouring
+    lookups. Deleting an archived receipt lists its id in a ``.deleted``
+    file next to the archive.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.deleted_path = path + ".deleted"
+        self._lock = threading.Lock()
+        self._block: Tuple[int, List[bytes]] = (-1, [])
+
+        with open(path, 'rb') as f:
+            header = f.read(len(MAGIC) + 4)
+            f.seek(-FOOTER.size, os.SEEK_END)
+            offset, length, magic = FOOTER.unpack(f.read(FOOTER.size))
+            if header[:len(MAGIC)] != MAGIC or magic != MAGIC:
+                raise ValueError(f"Not a receipt archive: {path}")
+            self.codec = header[len(MAGIC):].decode('ascii')
+            self._decompress = CODECS[self.codec][1]
+            f.seek(offset)
+            index = json.loads(self._decompress(f.read(length)).decode('utf-8'))
+
+        self.blocks = index["blocks"]
+        deleted = set()
+        if os.path.exists(self.deleted_path):
+            with open(self.deleted_path, 'r', encoding='utf-8') as f:
+                deleted = {line.strip() for line in f if line.strip()}
+        # Entries are stored oldest first
+        self._order = [entry for entry in index["entries"] if entry["id"] not in deleted]
+        self.entries = {entry["id"]: entry for entry in self._order}
+
+    def save(self, record: Dict[str, Any]) -> str:
+        raise ValueError(f"Receipt archive {self.path} is read-only")
+
+    def get(self, receipt_id: str) -> Optional[Dict[str, Any]]:
+        return self.entries.get(receipt_id)
+
+    def get_record(self, receipt_id: str) -> Optional[Dict[str, Any]]:
+        entry = self.entries.get(receipt_id)
+        if entry is None:
+            return None
+        with self._lock:
+            number, lines = self._block
+            if number != entry["block"]:
+                offset, length = self.blocks[entry["block"]]
+                with open(self.path, 'rb') as f:
+                    f.seek(offset)
+                    lines = self._decompress(f.read(length)).split(b"\n")
+                self._block = (entry["block"], lines)
+        return loads_record(lines[entry["line"]].decode('utf-8'))
+
+    def delete(self, receipt_id: str) -> bool:
+        with self._lock:
+            entry = self.entries.pop(receipt_id, None)
+            if entry is None:
+                return False
+            self._order.remove(entry)
+            with open(self.deleted_path, 'a', encoding='utf-8') as f:
+                f.write(receipt_id + "\n")
+        return True
+
+    def list_receipts(self, start=None, end=None, cashier=None):
+        return [entry for entry in reversed(self._order)
+                if in_range(entry["timestamp"], start, end)
+                and (cashier is None or entry["cashier"] == cashier)]
+
+    def count(self) -> int:
+        return len(self._order)
+
+    def list_page(self, offset: int, limit: int) -> List[Dict[str, Any]]:
+        stop = max(len(self._order) - offset, 0)
+        start = max(stop - limit, 0)
+        return list(reversed(self._order[start:stop]))
+
+
+def lookup_latency(store: ReceiptStore, receipt_ids: List[str],
+                   samples: int = 200) -> Tuple[float, float]:
+    """Return the p50 and p99 milliseconds to fetch a random receipt"""
+    timings = []
+    for receipt_id in random.sample(receipt_ids, min(samples, len(receipt_ids))):
+        start = time.perf_counter()
+        store.get_record(receipt_id)
+        timings.append((time.perf_counter() - start) * 1000)
+    if not timings:
+        return 0.0, 0.0
+    timings.sort()
+    return timings[len(timings) // 2], timings[min(len(timings) - 1, len(timings) * 99 // 100)]
+
+
+if __name__ == "__main__":
+    # Usage: python receipt_archive.py [days] [receipts_dir] [zlib|lzma]
+    from datetime import datetime, timedelta
+    from receipt_partitions import PartitionedReceiptStore
+    from settings import load_settings
+
+    settings = load_settings()
+    days = int(sys.argv[1]) if len(sys.argv) > 1 else settings["archive_after_days"]
+    receipts_dir = sys.argv[2] if len(sys.argv) > 2 else settings["receipts_dir"]
+    codec = sys.argv[3] if len(sys.argv) > 3 else settings["archive_codec"]
+    if days < 1:
+        print("Usage: python receipt_archive.py [days] [receipts_dir] [zlib|lzma]")
+        print("Only receipts at least one day old can be archived")
+        sys.exit(1)
+
+    store = PartitionedReceiptStore(receipts_dir)
+    cutoff = (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d")
+    report = store.archive(cutoff, codec)
+    ratio = report["bytes_before"] / report["bytes_after"] if report["bytes_after"] else 0
+    print(f"Archived {report['receipts']} receipts from {report['days']} days before {cutoff}: "
+          f"{report['files']} files, {report['bytes_before']:,} bytes -> "
+          f"{report['days']} archives, {report['bytes_after']:,} bytes ({ratio:.1f}x)")
+
+    # Time lookups as the history window sees them, from a freshly opened store
+    store = PartitionedReceiptStore(receipts_dir)
+    p50, p99 = lookup_latency(store, report["receipt_ids"])
+    print(f"Archived receipt lookup: p50 {p50:.2f} ms, p99 {p99:.2f} ms")
+    store.close()
@@ -0,0 +1,150 @@
+import tkinter as tk
+from ttkbootstrap import ttk
+
+
+class VirtualReceiptList:
+    """Receipt history list that only holds the rows currently on screen.
+
+    ``source`` is anything with ``count()`` and ``list_page(offset, limit)``
+    returning receipt summaries newest first, such as a ReceiptStore.
+    Scrolling moves a window over the source and fetches the visible rows
+    plus a prefetch margin, so the Treeview never grows with the history.
+    """
+
+    def __init__(self, parent, source, visible_rows=15, prefetch=50):
+        self.source = source
+        self.visible_rows = visible_rows
+        self.prefetch = prefetch
+        self.top = 0
+        self.total = 0
+        self._cache_start = 0
+        self._cache = []
+
+        # Create and configure the tree
+        self.tree = ttk.Treeview(parent,
+                                 columns=("date", "time", "cashier", "total"),
+                                 show="headings",
+                                 height=visible_rows,
+                                 selectmode="browse")
+
+        # Configure columns
+        self.tree.heading("date", text="Date", anchor="center")
+        self.tree.heading("time", text="Time", anchor="center")
+        self.tree.heading("cashier", text="Cashier", anchor="center")
+        self.tree.heading("total", text="Total", anchor="center")
+
+        self.tree.column("date", width=150, anchor="center")
+        self.tree.column("time", width=150, anchor="center")
+        self.tree.column("cashier", width=250, anchor="center")
+        self.tree.column("total", width=150, anchor="center")
+
+        # The scrollbar tracks the position in the whole history, not the tree
+        self.scrollbar = ttk.Scrollbar(parent, orient="vertical", command=self.on_scrollbar)
+
+        # Pack tree and scrollbar
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+
+        # Scrolling and keyboard navigation move the window, not the tree
+        self.tree.bind("<Configure>", self.on_resize)
+        self.tree.bind("<MouseWheel>", lambda e: self.scroll_by(-1 if e.delta > 0 else 1) or "break")
+        self.tree.bind("<Button-4>", lambda e: self.scroll_by(-1) or "break")
+        self.tree.bind("<Button-5>", lambda e: self.scroll_by(1) or "break")
+        self.tree.bind("<Up>", lambda e: self.move_selection(-1))
+        self.tree.bind("<Down>", lambda e: self.move_selection(1))
+        self.tree.bind("<Prior>", lambda e: self.move_selection(-self.visible_rows))
+        self.tree.bind("<Next>", lambda e: self.move_selection(self.visible_rows))
+        self.tree.bind("<Home>", lambda e: self.move_selection(-self.total))
+        self.tree.bind("<End>", lambda e: self.move_selection(self.total))
+
+        self.refresh()
+
+    def set_source(self, source):
+        """Show a different receipt source, starting from the top"""
+        self.source = source
+        self.top = 0
+        self.refresh()
+
+    def refresh(self):
+        """Re-read the row count and redraw, e.g. after a delete"""
+        self.total = self.source.count()
+        self._cache_start = 0
+        self._cache = []
+        self.scroll_to(self.top)
+
+    def selected_id(self):
+        """Return the receipt id of the selected row, or None"""
+        selected = self.tree.selection()
+        return selected[0] if selected else None
+
+    def _rows(self, start, stop):
+        """Return rows [start, stop), fetching a new page if not cached"""
+        cache_stop = self._cache_start + len(self._cache)
+        if start < self._cache_start or (stop > cache_stop and cache_stop < self.total):
+            self._cache_start = max(0, start - self.prefetch)
+            limit = (stop - self._cache_start) + self.prefetch
+            self._cache = self.source.list_page(self._cache_start, limit)
+        return self._cache[start - self._cache_start:stop - self._cache_start]
+
+    def scroll_to(self, top):
+        """Show rows starting at index ``top`` of the source"""
+        self.top = max(0, min(top, self.total - self.visible_rows))
+        selected = self.selected_id()
+        rows = self._rows(self.top, self.top + self.visible_rows)
+
+        # Only a screenful of rows is ever inserted
+        self.tree.delete(*self.tree.get_children())
+        for offset, entry in enumerate(rows):
+            date, time = entry["timestamp"].split(" ")
+            tag = 'evenrow' if (self.top + offset) % 2 == 0 else 'oddrow'
+            self.tree.insert("", "end", iid=entry["id"], tags=(tag,),
+                             values=(date, time, entry["cashier"], f"£{float(entry['total']):.2f}"))
+        if selected and self.tree.exists(selected):
+            self.tree.selection_set(selected)
+
+        if self.total:
+            self.scrollbar.set(self.top / self.total,
+                               min(1.0, (self.top + self.visible_rows) / self.total))
+        else:
+            self.scrollbar.set(0.0, 1.0)
+
+    def scroll_by(self, rows):
+        self.scroll_to(self.top + rows)
+
+    def on_scrollbar(self, *args):
+        """Translate scrollbar commands into a new window position"""
+        if args[0] == "moveto":
+            self.scroll_to(int(float(args[1]) * self.total))
+        elif args[0] == "scroll":
+            step = self.visible_rows if args[2] == "pages" else 1
+            self.scroll_by(int(args[1]) * step)
+
+    def on_resize(self, event):
+        """Match the window size to the number of rows that fit"""
+        row_height = int(ttk.Style().lookup("Treeview", "rowheight") or 20)
+        # One row's worth of space is taken by the headings
+        rows = max(1, event.height // row_height - 1)
+        if rows != self.visible_rows:
+            self.visible_rows = rows
+            self.scroll_to(self.top)
+
+    def move_selection(self, delta):
+        """Move the selection, scrolling the window when it leaves the screen"""
+        children = self.tree.get_children()
+        if not children:
+            return "break"
+        selected = self.selected_id()
+        current = self.top + (children.index(selected) if selected in children else 0)
+        target = max(0, min(current + delta, self.total - 1))
+
+        if target < self.top:
+            self.scroll_to(target)
+        elif target >= self.top + self.visible_rows:
+            self.scroll_to(target - self.visible_rows + 1)
+
+        children = self.tree.get_children()
+        row = children[target - self.top]
+        self.tree.selection_set(row)
+        self.tree.focus(row)
+        self.tree.see(row)
+        return "break"
@@ -0,0 +1,63 @@
+import json
+import os
+import threading
+
+from durability import fsync_path
+
+
+class ReceiptIdAllocator:
+    """Hands out monotonic receipt ids of the form <till>-<sequence>.
+
+    Sequence numbers are reserved in blocks: the upper bound of the current
+    block is written (and fsynced) to the state file before any id from it
+    is used. After a crash the allocator restarts from that bound, so ids
+    may skip but are never handed out twice.
+
+    Each till keeps its own state file beside ``state_path``
+    (``sequence.json`` gives ``sequence-T01.json``), so tills sharing a
+    receipt store never rewrite each other's bounds. ``state_path`` itself,
+    shared by all tills in older versions, is still read at start-up.
+    """
+
+    def __init__(self, state_path: str, till_id: str = "T01", block_size: int = 1000):
+        self.till_id = till_id
+        self.shared_state_path = state_path
+        root, ext = os.path.splitext(state_path)
+        self.state_path = f"{root}-{till_id}{ext}"
+        self.block_size = max(1, int(block_size))
+        self._lock = threading.Lock()
+        self._next = self._load_high_water_mark()
+        self._reserved = self._next
+
+    def _load_high_water_mark(self) -> int:
+        # A damaged state file is an error rather than a reset to 1, which
+        # would reissue ids that are already in use
+        high_water_mark = 1
+        for path in (self.shared_state_path, self.state_path):
+            if os.path.exists(path):
+                with open(path, 'r', encoding='utf-8') as f:
+                    high_water_mark = max(high_water_mark, int(json.load(f).get(self.till_id, 1)))
+        return high_water_mark
+
+    def _reserve_block(self):
+        """Persist a new upper bound before handing out ids below it"""
+        reserved = self._reserved + self.block_size
+        tmp_path = f"{self.state_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({self.till_id: reserved}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.state_path)
+        # The rename itself must reach disk before ids from the block are used
+        fsync_path(os.path.dirname(os.path.abspath(self.state_path)))
+        self._reserved = reserved
+
+    def next_id(self) -> str:
+        """Return the next unused receipt id for this till"""
+        with self._lock:
+            if self._next >= self._reserved:
+                self._reserve_block()
+            sequence = self._next
+            self._next += 1
+        # Zero padding keeps string order equal to allocation order
+        return f"{self.till_id}-{sequence:010d}"
@@ -0,0 +1,187 @@
+import bisect
+import json
+import os
+import sys
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from receipt_record import loads_record, record_from_text, record_summary
+
+
+def timestamp_from_filename(filename: str) -> Optional[str]:
+    """Return 'YYYY-MM-DD HH:MM:SS' for a receipt_YYYYMMDD_HHMMSS.txt name"""
+    try:
+        stamp = datetime.strptime(filename[8:23], "%Y%m%d_%H%M%S")
+        return stamp.strftime("%Y-%m-%d %H:%M:%S")
+    except ValueError:
+        return None
+
+
+class ReceiptIndex:
+    """Append-only index of receipt summaries kept next to the receipt files.
+
+    Each line of the index file is a JSON object describing one receipt
+    (id, timestamp, cashier, total, line count, file and byte offset).
+    Deletions are appended as tombstones and folded away by ``rebuild``.
+    """
+
+    INDEX_FILE = "index.jsonl"
+
+    def __init__(self, receipts_dir: str, autoload: bool = True):
+        self.receipts_dir = receipts_dir
+        self.index_path = os.path.join(receipts_dir, self.INDEX_FILE)
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        # (timestamp, id) keys in ascending order, built on first use
+        self._order: Optional[List[Tuple[str, str]]] = None
+        self._torn_tail = False
+        self._lock = threading.RLock()
+        if autoload:
+            self.load()
+
+    def load(self):
+        """Load the index, building it from the receipt files if missing"""
+        self.entries = {}
+        self._order = None
+        if not os.path.exists(self.index_path):
+            self.rebuild()
+            return
+
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    self._torn_tail = not line.endswith("\n")
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # A torn final line from a crash mid-append
+                        continue
+                    if entry.get("deleted"):
+                        self.entries.pop(entry["id"], None)
+                    else:
+                        self.entries[entry["id"]] = entry
+        except Exception as e:
+            print(f"Error loading receipt index: {e}")
+
+    def _append(self, record: Dict[str, Any], path: Optional[str] = None) -> bool:
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        try:
+            with self._lock, open(path or self.index_path, 'a', encoding='utf-8') as f:
+                if self._torn_tail:
+                    f.write("\n")
+                    self._torn_tail = False
+                f.write(line)
+            return True
+        except Exception as e:
+            print(f"Error updating receipt index: {e}")
+            return False
+
+    def _unlink(self, entry: Dict[str, Any]):
+        if self._order is not None:
+            key = (entry["timestamp"], entry["id"])
+            pos = bisect.bisect_left(self._order, key)
+            if pos < len(self._order) and self._order[pos] == key:
+                del self._order[pos]
+
+    def add(self, entry: Dict[str, Any]) -> bool:
+        """Record a newly saved receipt"""
+        with self._lock:
+            old = self.entries.get(entry["id"])
+            if old is not None:
+                self._unlink(old)
+            self.entries[entry["id"]] = entry
+            if self._order is not None:
+                bisect.insort(self._order, (entry["timestamp"], entry["id"]))
+            return self._append(entry)
+
+    def remove(self, receipt_id: str) -> bool:
+        """Record that a receipt has been deleted"""
+        with self._lock:
+            entry = self.entries.pop(receipt_id, None)
+            if entry is None:
+                return False
+            self._unlink(entry)
+            return self._append({"id": receipt_id, "deleted": True})
+
+    def get(self, receipt_id: str) -> Optional[Dict[str, Any]]:
+        return self.entries.get(receipt_id)
+
+    def _ordered_keys(self) -> List[Tuple[str, str]]:
+        if self._order is None:
+            self._order = sorted((e["timestamp"], e["id"]) for e in self.entries.values())
+        return self._order
+
+    def list_entries(self, newest_first: bool = True) -> List[Dict[str, Any]]:
+        """Return index entries ordered by timestamp"""
+        with self._lock:
+            keys = self._ordered_keys()
+            if newest_first:
+                keys = reversed(keys)
+            return [self.entries[receipt_id] for _, receipt_id in keys]
+
+    def page(self, offset: int, limit: int) -> List[Dict[str, Any]]:
+        """Return up to ``limit`` entries, newest first, starting at ``offset``"""
+        with self._lock:
+            keys = self._ordered_keys()
+            stop = max(len(keys) - offset, 0)
+            start = max(stop - limit, 0)
+            return [self.entries[receipt_id] for _, receipt_id in reversed(keys[start:stop])]
+
+    def entry_for_file(self, filename: str) -> Optional[Dict[str, Any]]:
+        """Build an index entry by reading one receipt file"""
+        filepath = os.path.join(self.receipts_dir, filename)
+        with open(filepath, 'r', encoding='utf-8') as f:
+            content = f.read()
+
+        receipt_id = filename[len("receipt_"):filename.rindex(".")]
+        if filename.endswith(".json"):
+            record = loads_record(content)
+        else:
+            # Older receipts are plain text named after their timestamp,
+            # which is what the history window used to show
+            record = record_from_text(receipt_id, content, timestamp_from_filename(filename))
+            if record["timestamp"] is None:
+                return None
+
+        entry = record_summary(record)
+        entry.update({"path": filename, "offset": 0, "size": os.path.getsize(filepath)})
+        return entry
+
+    def rebuild(self) -> int:
+        """Rescan the receipts folder and rewrite the index from scratch"""
+        entries = {}
+        for filename in os.listdir(self.receipts_dir):
+            if filename.startswith("receipt_") and filename.endswith((".json", ".txt")):
+                try:
+                    entry = self.entry_for_file(filename)
+                    if entry:
+                        entries[entry["id"]] = entry
+                except Exception as e:
+                    print(f"Error indexing receipt {filename}: {e}")
+
+        tmp_path = self.index_path + ".tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                for entry in sorted(entries.values(), key=lambda e: e["timestamp"]):
+                    f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            os.replace(tmp_path, self.index_path)
+        except Exception as e:
+            print(f"Error writing receipt index: {e}")
+
+        self.entries = entries
+        self._order = None
+        return len(entries)
+
+
+if __name__ == "__main__":
+    # Usage: python receipt_index.py rebuild [receipts_dir]
+    if len(sys.argv) < 2 or sys.argv[1] != "rebuild":
+        print("Usage: python receipt_index.py rebuild [receipts_dir]")
+        sys.exit(1)
+
+    receipts_dir = sys.argv[2] if len(sys.argv) > 2 else "receipts"
+    index = ReceiptIndex(receipts_dir, autoload=False)
+    print(f"Indexed {index.rebuild()} receipts in {receipts_dir}")
@@ -0,0 +1,325 @@
+import json
+import os
+import sys
+import threading
+from typing import Any, Dict, List, Optional
+
+from durability import DurabilityPolicy, fsync_path
+from receipt_index import ReceiptIndex
+from receipt_record import dumps_record, loads_record, record_summary
+from receipt_store import ReceiptStore, in_range
+from settings import load_settings
+
+
+class JournalIndex(ReceiptIndex):
+    """Receipt index kept as one offset index per journal segment.
+
+    ``segment_X.idx`` holds a summary line with the byte offset and size
+    of every receipt appended to ``segment_X.log``; deletions go to
+    ``tombstones.jsonl`` until ``JournalReceiptStore.compact`` drops them.
+    """
+
+    INDEX_FILE = "tombstones.jsonl"
+
+    def __init__(self, journal_dir: str):
+        super().__init__(journal_dir, autoload=False)
+        self.tombstones: Dict[str, str] = {}
+        self.load()
+
+    @staticmethod
+    def index_file(segment: str) -> str:
+        return segment[:-len(".log")] + ".idx"
+
+    def segments(self) -> List[str]:
+        """Return the segment file names in the journal, oldest first"""
+        return sorted(name for name in os.listdir(self.receipts_dir)
+                      if name.startswith("segment_") and name.endswith(".log"))
+
+    def _read_lines(self, path: str) -> List[Dict[str, Any]]:
+        records = []
+        with open(path, 'r', encoding='utf-8') as f:
+            content = f.read()
+        for line in content.split("\n"):
+            try:
+                if line.strip():
+                    records.append(json.loads(line))
+            except ValueError:
+                # A torn final line from a crash mid-append
+                continue
+        if content and not content.endswith("\n"):
+            with open(path, 'a', encoding='utf-8') as f:
+                f.write("\n")
+        return records
+
+    def load(self):
+        """Load every segment index, then apply the tombstones"""
+        self.entries = {}
+        self._order = None
+        self.tombstones = {}
+        for segment in self.segments():
+            idx_path = os.path.join(self.receipts_dir, self.index_file(segment))
+            if not os.path.exists(idx_path):
+                self.index_segment(segment)
+                continue
+            entries = self._read_lines(idx_path)
+            indexed = max((entry["offset"] + entry["size"] for entry in entries), default=0)
+            if indexed < os.path.getsize(os.path.join(self.receipts_dir, segment)):
+                # Receipts reached the segment but not its index before a
+                # crash; only the segment is synced, so rescan it
+                self.index_segment(segment)
+                continue
+            for entry in entries:
+                self.entries[entry["id"]] = entry
+
+        if os.path.exists(self.index_path):
+            for record in self._read_lines(self.index_path):
+                self.tombstones[record["id"]] = record.get("path", "")
+                self.entries.pop(record["id"], None)
+
+    def index_segment(self, segment: str) -> int:
+        """Rebuild one segment's offset index by scanning the segment"""
+        entries = []
+        offset = 0
+        with open(os.path.join(self.receipts_dir, segment), 'rb') as f:
+            for line in f:
+                try:
+                    record = loads_record(line.decode('utf-8'))
+                except ValueError:
+                    # Skip torn records; their bytes stay until compaction
+                    offset += len(line)
+                    continue
+                entry = record_summary(record)
+                entry.update({"path": segment, "offset": offset, "size": len(line)})
+                entries.append(entry)
+                offset += len(line)
+
+        idx_path = os.path.join(self.receipts_dir, self.index_file(segment))
+        tmp_path = idx_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for entry in entries:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        os.replace(tmp_path, idx_path)
+
+        for entry in entries:
+            if entry["id"] not in self.tombstones:
+                self.entries[entry["id"]] = entry
+        self._order = None
+        return len(entries)
+
+    def rebuild(self) -> int:
+        """Rescan every segment and rewrite the segment indexes"""
+        self.entries = {}
+        for segment in self.segments():
+            self.index_segment(segment)
+        return len(self.entries)
+
+    def _append(self, record: Dict[str, Any], path: Optional[str] = None) -> bool:
+        if record.get("deleted"):
+            return super()._append(record)
+        return super()._append(record, os.path.join(self.receipts_dir,
+                                                    self.index_file(record["path"])))
+
+    def remove(self, receipt_id: str) -> bool:
+        """Write a tombstone for a receipt"""
+        with self._lock:
+            entry = self.entries.pop(receipt_id, None)
+            if entry is None:
+                return False
+            self._unlink(entry)
+            self.tombstones[receipt_id] = entry["path"]
+            return self._append({"id": receipt_id, "path": entry["path"], "deleted": True})
+
+
+class JournalReceiptStore(ReceiptStore):
+    """Receipts appended to rotating segment files.
+
+    Each receipt record is one JSON line in the active segment, which is
+    rotated when it would grow past ``segment_bytes`` or when the day
+    changes. Reading a receipt is one seek and one read at the offset
+    held in the segment index. ``durability`` decides when the active
+    segment is fsynced; closed segments are always synced unless it is
+    "none". Segment indexes are never synced: a segment that outgrew its
+    index is rescanned on load.
+    """
+
+    def __init__(self, journal_dir: str, segment_bytes: int = 4 * 1024 * 1024,
+                 rotate_daily: bool = True, durability: Optional[DurabilityPolicy] = None):
+        self.journal_dir = journal_dir
+        self.segment_bytes = segment_bytes
+        self.rotate_daily = rotate_daily
+        self.durability = durability or DurabilityPolicy("none")
+        self._lock = threading.Lock()
+        self._active = None
+        self._active_name = None
+        self._active_day = None
+
+        if not os.path.exists(self.journal_dir):
+            os.makedirs(self.journal_dir)
+        self.index = JournalIndex(self.journal_dir)
+
+    def _day_segments(self, day: str) -> List[str]:
+        return [name for name in self.index.segments() if name.startswith(f"segment_{day}_")]
+
+    def _segment_name(self, day: str) -> str:
+        existing = self._day_segments(day)
+        number = int(existing[-1][-len("0000.log"):-len(".log")]) + 1 if existing else 1
+        return f"segment_{day}_{number:04d}.log"
+
+    def _close_active(self):
+        if self._active is not None:
+            self._active.flush()
+            if self.durability.mode != "none":
+                os.fsync(self._active.fileno())
+            self._active.close()
+            self._active = None
+
+    def _writer(self, size: int, day: str):
+        """Return the active segment, rotating it if needed"""
+        if self._active is not None:
+            full = self._active.tell() + size > self.segment_bytes
+            if full or (self.rotate_daily and day != self._active_day):
+                self._close_active()
+
+        if self._active is None:
+            # Continue the newest segment for today if it still has room
+            segments = self._day_segments(day)
+            name = segments[-1] if segments else None
+            if name is None or os.path.getsize(os.path.join(self.journal_dir, name)) + size > self.segment_bytes:
+                name = self._segment_name(day)
+            path = os.path.join(self.journal_dir, name)
+            created = not os.path.exists(path)
+            self._active = open(path, 'ab')
+            if created and self.durability.mode != "none":
+                # Make the new segment's directory entry durable too
+                fsync_path(self.journal_dir)
+            if self._active.tell() > 0:
+                with open(path, 'rb') as f:
+                    f.seek(-1, os.SEEK_END)
+                    if f.read(1) != b"\n":
+                        # Terminate a record torn by a crash mid-append
+                        self._active.write(b"\n")
+            self._active_name = name
+            self._active_day = day
+        return self._active
+
+    def save(self, record: Dict[str, Any]) -> str:
+        data = (dumps_record(record) + "\n").encode('utf-8')
+        day = record["timestamp"][:10].replace("-", "") if self.rotate_daily else "00000000"
+        with self._lock:
+            writer = self._writer(len(data), day)
+            offset = writer.tell()
+            writer.write(data)
+            writer.flush()
+            segment_path = writer.name
+
+            entry = record_summary(record)
+            entry.update({"path": self._active_name, "offset": offset, "size": len(data)})
+            self.index.add(entry)
+        self.durability.written(segment_path)
+        return record["id"]
+
+    def get(self, receipt_id: str) -> Optional[Dict[str, Any]]:
+        return self.index.get(receipt_id)
+
+    def get_record(self, receipt_id: str) -> Optional[Dict[str, Any]]:
+        entry = self.index.get(receipt_id)
+        if entry is None:
+            return None
+        with open(os.path.join(self.journal_dir, entry["path"]), 'rb') as f:
+            f.seek(entry["offset"])
+            return loads_record(f.read(entry["size"]).decode('utf-8'))
+
+    def delete(self, receipt_id: str) -> bool:
+        return self.index.remove(receipt_id)
+
+    def list_receipts(self, start=None, end=None, cashier=None):
+        return [entry for entry in self.index.list_entries(newest_first=True)
+                if in_range(entry["timestamp"], start, end)
+                and (cashier is None or entry["cashier"] == cashier)]
+
+    def count(self) -> int:
+        return len(self.index.entries)
+
+    def list_page(self, offset: int, limit: int) -> List[Dict[str, Any]]:
+        return self.index.page(offset, limit)
+
+    def flush(self):
+        with self._lock:
+            if self._active is not None:
+                self._active.flush()
+        self.durability.sync()
+
+    def close(self):
+        self.durability.close()
+        with self._lock:
+            self._close_active()
+
+    def compact(self) -> Dict[str, int]:
+        """Rewrite closed segments without their deleted receipts"""
+        dropped = bytes_freed = 0
+        with self._lock:
+            # Compact everything, including the segment being written
+            self._close_active()
+            by_segment: Dict[str, List[str]] = {}
+            for receipt_id, segment in self.index.tombstones.items():
+                by_segment.setdefault(segment, []).append(receipt_id)
+
+            for segment, receipt_ids in by_segment.items():
+                path = os.path.join(self.journal_dir, segment)
+                if not os.path.exists(path):
+                    continue
+                before = os.path.getsize(path)
+                live = [entry for entry in self.index.entries.values()
+                        if entry["path"] == segment]
+                live.sort(key=lambda entry: entry["offset"])
+
+                tmp_path = path + ".tmp"
+                with open(path, 'rb') as src, open(tmp_path, 'wb') as dst:
+                    for entry in live:
+                        src.seek(entry["offset"])
+                        data = src.read(entry["size"])
+                        entry["offset"] = dst.tell()
+                        dst.write(data)
+                    dst.flush()
+                    os.fsync(dst.fileno())
+
+                # Drop the offset index first: if we crash before the new
+                # one is written, loading re-indexes the segment by scanning it
+                idx_path = os.path.join(self.journal_dir, JournalIndex.index_file(segment))
+                if os.path.exists(idx_path):
+                    os.remove(idx_path)
+                if live:
+                    os.replace(tmp_path, path)
+                    with open(idx_path + ".tmp", 'w', encoding='utf-8') as f:
+                        for entry in live:
+                            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                    os.replace(idx_path + ".tmp", idx_path)
+                    bytes_freed += before - os.path.getsize(path)
+                else:
+                    os.remove(tmp_path)
+                    os.remove(path)
+                    bytes_freed += before
+                dropped += len(receipt_ids)
+
+            # Every tombstone has now been applied
+            self.index.tombstones = {}
+            if os.path.exists(self.index.index_path):
+                os.remove(self.index.index_path)
+        return {"dropped": dropped, "bytes_freed": bytes_freed}
+
+
+if __name__ == "__main__":
+    # Usage: python receipt_journal.py compact|reindex [journal_dir]
+    if len(sys.argv) < 2 or sys.argv[1] not in ("compact", "reindex"):
+        print("Usage: python receipt_journal.py compact|reindex [journal_dir]")
+        sys.exit(1)
+
+    settings = load_settings()
+    journal_dir = sys.argv[2] if len(sys.argv) > 2 else settings["journal_dir"]
+    store = JournalReceiptStore(journal_dir, durability=DurabilityPolicy("fsync"))
+    if sys.argv[1] == "compact":
+        result = store.compact()
+        print(f"Dropped {result['dropped']} deleted receipts, freed {result['bytes_freed']} bytes")
+    else:
+        print(f"Indexed {store.index.rebuild()} receipts in {journal_dir}")
+    store.close()
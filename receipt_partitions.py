@@ -0,0 +1,386 @@
+import json
+import os
+import re
+import shutil
+import sys
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from durability import DurabilityPolicy, fsync_path
+from receipt_archive import ARCHIVE_SUFFIX, ArchivedPartition, write_archive
+from receipt_index import ReceiptIndex
+from receipt_store import ReceiptStore, TextFileReceiptStore, in_range
+from settings import load_settings
+
+PARTITIONS_FILE = "partitions.jsonl"
+YEAR, MONTH_OR_DAY = re.compile(r"^\d{4}$"), re.compile(r"^\d{2}$")
+
+
+def partition_of(timestamp: str) -> str:
+    """Return the 'YYYY/MM/DD' partition for a receipt timestamp"""
+    return f"{timestamp[:4]}/{timestamp[5:7]}/{timestamp[8:10]}"
+
+
+def has_flat_layout(receipts_dir: str) -> bool:
+    """Check for receipts saved directly in the receipts folder"""
+    if os.path.exists(os.path.join(receipts_dir, ReceiptIndex.INDEX_FILE)):
+        return True
+    return any(name.startswith("receipt_") and name.endswith((".json", ".txt"))
+               for name in os.listdir(receipts_dir))
+
+
+class PartitionedReceiptStore(ReceiptStore):
+    """Receipts filed by day in receipts/YYYY/MM/DD/ folders.
+
+    Each day folder is a TextFileReceiptStore with its own index, and
+    ``partitions.jsonl`` records how many receipts each day holds and the
+    lowest and highest receipt id saved in it. Listing the newest receipts
+    or a date range only loads the days involved, so the cost of opening
+    today's receipts does not grow with the history; ids are handed out in
+    order, so looking a receipt up by id only loads the day (or few days)
+    whose id range covers it.
+    At most ``cached_partitions`` day indexes are kept in memory. Days
+    packed by ``archive`` are read from their YYYY/MM/DD.rca archive.
+    """
+
+    def __init__(self, receipts_dir: str, durability: Optional[DurabilityPolicy] = None,
+                 cached_partitions: int = 32):
+        self.receipts_dir = receipts_dir
+        self.durability = durability or DurabilityPolicy("none")
+        self.cached_partitions = max(1, cached_partitions)
+        self.manifest_path = os.path.join(receipts_dir, PARTITIONS_FILE)
+        self.counts: Dict[str, int] = {}
+        # Lowest and highest receipt id each day has held, for finding a receipt by id
+        self.id_ranges: Dict[str, Tuple[str, str]] = {}
+        self._stores: "OrderedDict[str, TextFileReceiptStore]" = OrderedDict()
+        self._manifest_lines = 0
+        self._lock = threading.RLock()
+
+        if not os.path.exists(self.receipts_dir):
+            os.makedirs(self.receipts_dir)
+        if has_flat_layout(self.receipts_dir):
+            print(f"Moving receipts in {receipts_dir} into daily folders...")
+            migrate_flat_layout(self.receipts_dir)
+        self.load_manifest()
+
+    def _dir(self, key: str) -> str:
+        return os.path.join(self.receipts_dir, *key.split("/"))
+
+    def _archive_path(self, key: str) -> str:
+        return self._dir(key) + ARCHIVE_SUFFIX
+
+    def _open(self, key: str) -> ReceiptStore:
+        # A complete archive wins over a day folder left by an interrupted job
+        if os.path.exists(self._archive_path(key)):
+            return ArchivedPartition(self._archive_path(key))
+        return TextFileReceiptStore(self._dir(key), self.durability)
+
+    def scan_partitions(self) -> List[str]:
+        """Return every YYYY/MM/DD key found on disk, oldest first"""
+        keys = []
+        for year in sorted(os.listdir(self.receipts_dir)):
+            year_dir = os.path.join(self.receipts_dir, year)
+            if not YEAR.match(year) or not os.path.isdir(year_dir):
+                continue
+            for month in sorted(os.listdir(year_dir)):
+                month_dir = os.path.join(year_dir, month)
+                if not MONTH_OR_DAY.match(month) or not os.path.isdir(month_dir):
+                    continue
+                days = set()
+                for name in os.listdir(month_dir):
+                    if name.endswith(ARCHIVE_SUFFIX):
+                        name = name[:-len(ARCHIVE_SUFFIX)]
+                    elif not os.path.isdir(os.path.join(month_dir, name)):
+                        continue
+                    if MONTH_OR_DAY.match(name):
+                        days.add(name)
+                keys.extend(f"{year}/{month}/{day}" for day in sorted(days))
+        return keys
+
+    def load_manifest(self):
+        """Load the per-day receipt counts, rebuilding them if missing"""
+        if not os.path.exists(self.manifest_path):
+            self.rebuild_manifest()
+            return
+
+        self.counts = {}
+        self.id_ranges = {}
+        self._manifest_lines = 0
+        with open(self.manifest_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # A torn final line from a crash mid-append
+                    continue
+                self.counts[record["partition"]] = record["count"]
+                # Manifests written before id ranges were kept have none
+                if "first_id" in record:
+                    self.id_ranges[record["partition"]] = (record["first_id"], record["last_id"])
+                self._manifest_lines += 1
+        if self._manifest_lines > 2 * len(self.counts) + 64:
+            self._write_manifest()
+
+    def rebuild_manifest(self) -> int:
+        """Count the receipts in every day folder and rewrite the manifest"""
+        with self._lock:
+            self._stores.clear()
+            self.counts, self.id_ranges = {}, {}
+            for key in self.scan_partitions():
+                store = self._open(key)
+                self.counts[key] = store.count()
+                ids = [entry["id"] for entry in store.list_receipts()]
+                if ids:
+                    self.id_ranges[key] = (min(ids), max(ids))
+            self._write_manifest()
+        return sum(self.counts.values())
+
+    def _write_manifest(self):
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for key in sorted(self.counts):
+                f.write(json.dumps(self._manifest_entry(key)) + "\n")
+        os.replace(tmp_path, self.manifest_path)
+        self._manifest_lines = len(self.counts)
+
+    def _manifest_entry(self, key: str) -> Dict[str, Any]:
+        entry = {"partition": key, "count": self.counts[key]}
+        if key in self.id_ranges:
+            entry["first_id"], entry["last_id"] = self.id_ranges[key]
+        return entry
+
+    def _record_count(self, key: str, count: int, ids: Iterable[str] = ()):
+        """Note a day's receipt count, widening its id range to take in ``ids``"""
+        # Not synced: a stale count is corrected when its day is next loaded.
+        # Ranges are never narrowed, so one that is too wide only costs a lookup
+        ids = list(ids)
+        id_range = self.id_ranges.get(key)
+        if ids:
+            low, high = min(ids), max(ids)
+            if id_range is not None:
+                low, high = min(low, id_range[0]), max(high, id_range[1])
+            id_range = (low, high)
+        if self.counts.get(key) != count or self.id_ranges.get(key) != id_range:
+            self.counts[key] = count
+            if id_range is not None:
+                self.id_ranges[key] = id_range
+            with open(self.manifest_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(self._manifest_entry(key)) + "\n")
+            self._manifest_lines += 1
+            if self._manifest_lines > 2 * len(self.counts) + 64:
+                self._write_manifest()
+
+    def _store(self, key: str, create: bool = False) -> Optional[ReceiptStore]:
+        """Return the store for one day, loading its index if needed"""
+        with self._lock:
+            store = self._stores.get(key)
+            if store is not None:
+                self._stores.move_to_end(key)
+                return store
+
+            day_dir = self._dir(key)
+            if os.path.exists(self._archive_path(key)):
+                if create:
+                    raise ValueError(f"Receipts for {key} have been archived")
+            elif not os.path.isdir(day_dir):
+                if not create:
+                    return None
+                os.makedirs(day_dir)
+                if self.durability.mode != "none":
+                    # Make the new year/month/day folders durable
+                    parent = day_dir
+                    while parent != self.receipts_dir:
+                        parent = os.path.dirname(parent)
+                        fsync_path(parent)
+
+            store = self._open(key)
+            ids = [] if key in self.id_ranges else [entry["id"] for entry in store.list_receipts()]
+            self._record_count(key, store.count(), ids)
+            self._stores[key] = store
+            while len(self._stores) > self.cached_partitions:
+                self._stores.popitem(last=False)
+            return store
+
+    def _keys_in_range(self, start: Optional[str], end: Optional[str]) -> List[str]:
+        """Return the days overlapping an inclusive prefix range, newest first"""
+        start, end = start and start[:10], end and end[:10]
+        return [key for key in sorted(self.counts, reverse=True)
+                if self.counts[key] and in_range(key.replace("/", "-"), start, end)]
+
+    def _find(self, receipt_id: str) -> Optional[str]:
+        """Return the day holding a receipt, trying loaded days first
+
+        Only days whose id range covers the id are loaded (and days whose
+        range is not known yet, from a manifest written before ranges).
+        """
+        with self._lock:
+            for key, store in list(self._stores.items()):
+                if store.get(receipt_id) is not None:
+                    return key
+            for key in self._keys_in_range(None, None):
+                id_range = self.id_ranges.get(key)
+                if key in self._stores or (id_range is not None
+                                            and not id_range[0] <= receipt_id <= id_range[1]):
+                    continue
+                store = self._store(key)
+                if store is not None and store.get(receipt_id) is not None:
+                    return key
+        return None
+
+    def save(self, record: Dict[str, Any]) -> str:
+        key = partition_of(record["timestamp"])
+        store = self._store(key, create=True)
+        store.save(record)
+        with self._lock:
+            self._record_count(key, store.count(), [record["id"]])
+        return record["id"]
+
+    def get(self, receipt_id: str) -> Optional[Dict[str, Any]]:
+        key = self._find(receipt_id)
+        return self._store(key).get(receipt_id) if key else None
+
+    def get_record(self, receipt_id: str) -> Optional[Dict[str, Any]]:
+        key = self._find(receipt_id)
+        return self._store(key).get_record(receipt_id) if key else None
+
+    def delete(self, receipt_id: str) -> bool:
+        key = self._find(receipt_id)
+        if key is None:
+            return False
+        store = self._store(key)
+        if not store.delete(receipt_id):
+            return False
+        with self._lock:
+            self._record_count(key, store.count())
+        return True
+
+    def list_receipts(self, start=None, end=None, cashier=None):
+        receipts = []
+        for key in self._keys_in_range(start, end):
+            store = self._store(key)
+            if store is not None:
+                receipts.extend(store.list_receipts(start, end, cashier))
+        return receipts
+
+    def count(self) -> int:
+        return sum(self.counts.values())
+
+    def list_page(self, offset: int, limit: int) -> List[Dict[str, Any]]:
+        page = []
+        for key in self._keys_in_range(None, None):
+            if len(page) >= limit:
+                break
+            count = self.counts[key]
+            if offset >= count:
+                # Whole days before the page are skipped without loading them
+                offset -= count
+                continue
+            store = self._store(key)
+            if store is not None:
+                page.extend(store.list_page(offset, limit - len(page)))
+            offset = 0
+        return page
+
+    def archive(self, before: str, codec: str = "lzma") -> Dict[str, Any]:
+        """Pack every day folder dated before ``before`` into an archive
+
+        Returns the number of days, receipts and files archived, their size
+        in bytes before and after, and the archived receipt ids.
+        """
+        report = {"days": 0, "receipts": 0, "files": 0, "bytes_before": 0, "bytes_after": 0,
+                  "receipt_ids": []}
+        for key in self.scan_partitions():
+            day_dir = self._dir(key)
+            if key.replace("/", "-") >= before or not os.path.isdir(day_dir):
+                continue
+            with self._lock:
+                self._stores.pop(key, None)
+                if os.path.exists(self._archive_path(key)):
+                    # Finish a job interrupted after writing the archive
+                    shutil.rmtree(day_dir)
+                    continue
+
+                folder = TextFileReceiptStore(day_dir)
+                records = [folder.get_record(entry["id"]) for entry in folder.list_receipts()]
+                records = [record for record in records if record]
+                names = os.listdir(day_dir)
+                size_before = sum(os.path.getsize(os.path.join(day_dir, name)) for name in names)
+                if records:
+                    size_after = write_archive(self._archive_path(key), records, codec)
+                    archived = ArchivedPartition(self._archive_path(key))
+                    if any(archived.get_record(record["id"]) != record for record in records):
+                        os.remove(self._archive_path(key))
+                        raise ValueError(f"Archive of {key} does not match its receipts")
+                else:
+                    size_after = 0
+                shutil.rmtree(day_dir)
+                self._record_count(key, len(records))
+
+            report["days"] += 1
+            report["receipts"] += len(records)
+            report["files"] += len(names)
+            report["bytes_before"] += size_before
+            report["bytes_after"] += size_after
+            report["receipt_ids"].extend(record["id"] for record in records)
+
+        # Print jobs from older versions were spooled into the receipts folder
+        stray_pdf = os.path.join(self.receipts_dir, "temp_print.pdf")
+        if os.path.exists(stray_pdf):
+            os.remove(stray_pdf)
+        return report
+
+    def flush(self):
+        self.durability.sync()
+
+    def close(self):
+        self.durability.close()
+
+
+def migrate_flat_layout(receipts_dir: str) -> int:
+    """Move receipts saved directly in ``receipts_dir`` into daily folders
+
+    Safe to re-run after a crash: each day's index is removed before files
+    are moved into it and is rebuilt from the files afterwards.
+    """
+    flat = TextFileReceiptStore(receipts_dir)
+    by_partition: Dict[str, List[Dict[str, Any]]] = {}
+    for entry in flat.index.list_entries(newest_first=False):
+        by_partition.setdefault(partition_of(entry["timestamp"]), []).append(entry)
+
+    moved = 0
+    for key, entries in sorted(by_partition.items()):
+        day_dir = os.path.join(receipts_dir, *key.split("/"))
+        os.makedirs(day_dir, exist_ok=True)
+        index_path = os.path.join(day_dir, ReceiptIndex.INDEX_FILE)
+        if os.path.exists(index_path):
+            os.remove(index_path)
+        for entry in entries:
+            source = os.path.join(receipts_dir, entry["path"])
+            if os.path.exists(source):
+                os.replace(source, os.path.join(day_dir, entry["path"]))
+                moved += 1
+        ReceiptIndex(day_dir)
+
+    os.remove(flat.index.index_path)
+    # Day counts have changed; the store rebuilds the manifest on open
+    manifest_path = os.path.join(receipts_dir, PARTITIONS_FILE)
+    if os.path.exists(manifest_path):
+        os.remove(manifest_path)
+    return moved
+
+
+if __name__ == "__main__":
+    # Usage: python receipt_partitions.py migrate|recount [receipts_dir]
+    if len(sys.argv) < 2 or sys.argv[1] not in ("migrate", "recount"):
+        print("Usage: python receipt_partitions.py migrate|recount [receipts_dir]")
+        sys.exit(1)
+
+    receipts_dir = sys.argv[2] if len(sys.argv) > 2 else load_settings()["receipts_dir"]
+    if sys.argv[1] == "migrate":
+        print(f"Moved {migrate_flat_layout(receipts_dir)} receipts into daily folders")
+        store = PartitionedReceiptStore(receipts_dir)
+    else:
+        store = PartitionedReceiptStore(receipts_dir)
+        store.rebuild_manifest()
+    print(f"{store.count()} receipts in {len(store.counts)} days")
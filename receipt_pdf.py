@@ -0,0 +1,227 @@
+import atexit
+import copy
+import io
+import os
+import shutil
+import tempfile
+import threading
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from fontTools import subset
+from fontTools.ttLib import TTFont
+from fpdf import FPDF
+
+from receipt_record import format_pence, vat_analysis, vat_label
+from tax import rate_label
+
+FONT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "arial.ttf")
+
+
+def receipt_table(record: Dict[str, Any]) -> Tuple[List[Tuple[str, str, str, str]],
+                                                  List[Tuple[str, str]],
+                                                  List[Tuple[str, str, str, str]]]:
+    """Return the item rows, summary rows and VAT analysis rows a PDF receipt shows
+
+    Every amount comes from the record as saved, the same as the text
+    receipt, so the two cannot disagree. Promotions lead the summary.
+    """
+    items = [(line["name"][:35], f"£{format_pence(line['price_pence'])}", str(line["qty"]),
+              f"£{format_pence(line['total_pence'])}") for line in record["items"]]
+    summary = [(saving["name"][:60], f"-£{format_pence(saving['pence'])}")
+               for saving in record.get("discounts", ())]
+    summary += [("Subtotal", f"£{format_pence(record['subtotal_pence'])}"),
+               (vat_label(record), f"£{format_pence(record['vat_pence'])}"),
+               ("Total", f"£{format_pence(record['total_pence'])}")]
+    vat = [(rate_label(rate), f"£{format_pence(net)}", f"£{format_pence(vat_pence)}",
+            f"£{format_pence(net + vat_pence)}") for rate, net, vat_pence in vat_analysis(record)]
+    return items, summary, vat
+
+
+def start_receipt_pdf(font_path: str = FONT_PATH) -> FPDF:
+    """Return a new receipt PDF with its font added and the page heading drawn"""
+    pdf = FPDF()
+    pdf.add_page()
+    pdf.add_font('Arial', '', font_path, uni=True)
+    pdf.set_margins(10, 10, 10)
+
+    # Store name and receipt type
+    pdf.set_font('Arial', size=24)
+    pdf.ln(10)
+    pdf.cell(0, 15, txt="Supermarket Receipt", ln=True, align='C')
+    pdf.set_font('Arial', size=18)
+    pdf.cell(0, 15, txt="Simple VAT Receipt", ln=True, align='C')
+    pdf.ln(5)
+    return pdf
+
+
+def finish_receipt_pdf(pdf: FPDF, record: Dict[str, Any], path: str,
+                       employee_id: Optional[str] = None):
+    """Draw a sale onto a PDF from ``start_receipt_pdf`` and write it to ``path``"""
+    items, summary, vat = receipt_table(record)
+
+    # Sale and cashier information
+    pdf.set_font('Arial', size=12)
+    date, _, time = record["timestamp"].partition(" ")
+    pdf.cell(0, 8, txt=f"Receipt: {record['id']}", ln=True)
+    pdf.cell(0, 8, txt=f"Date: {date}", ln=True)
+    pdf.cell(0, 8, txt=f"Time: {time}", ln=True)
+    pdf.ln(5)
+    pdf.cell(0, 8, txt="Cashier Information", ln=True)
+    pdf.cell(0, 8, txt=f"Employee: {record['cashier']}", ln=True)
+    if employee_id:
+        pdf.cell(0, 8, txt=f"Employee ID: {employee_id}", ln=True)
+    pdf.ln(5)
+
+    # Items table
+    col_widths = [90, 30, 30, 40]  # Item, Price, Qty, Total
+    row_height = 8
+    pdf.set_fill_color(240, 240, 240)
+    for width, heading in zip(col_widths, ("Item", "Price", "Qty", "Total")):
+        pdf.cell(width, row_height, heading, border=1, fill=True)
+    pdf.ln()
+    for row in items:
+        for width, text in zip(col_widths, row):
+            pdf.cell(width, row_height, text, border=1)
+        pdf.ln()
+
+    # Summary table, with the total highlighted
+    pdf.ln(5)
+    summary_width = 140
+    amount_width = 50
+    row_height = 10
+    pdf.cell(summary_width, row_height, "Summary", border=1, fill=True)
+    pdf.cell(amount_width, row_height, "Amount", border=1, fill=True)
+    pdf.ln()
+    for label, amount in summary[:-1]:
+        pdf.cell(summary_width, row_height, label, border=1)
+        pdf.cell(amount_width, row_height, amount, border=1)
+        pdf.ln()
+    label, amount = summary[-1]
+    pdf.set_fill_color(230, 230, 250)
+    pdf.set_font('Arial', size=12, style='B')
+    pdf.cell(summary_width, row_height, label, border=1, fill=True)
+    pdf.cell(amount_width, row_height, amount, border=1, fill=True)
+    pdf.ln()
+
+    # VAT analysis, one row per rate
+    pdf.ln(5)
+    pdf.set_font('Arial', size=12)
+    pdf.set_fill_color(240, 240, 240)
+    row_height = 8
+    col_widths = [40, 50, 50, 50]  # Rate, Net, VAT, Gross
+    for width, heading in zip(col_widths, ("VAT rate", "Net", "VAT", "Gross")):
+        pdf.cell(width, row_height, heading, border=1, fill=True)
+    pdf.ln()
+    for row in vat:
+        for width, text in zip(col_widths, row):
+            pdf.cell(width, row_height, text, border=1)
+        pdf.ln()
+
+    # Footer
+    pdf.ln(10)
+    pdf.set_font('Arial', size=12)
+    pdf.cell(0, 8, "Thank you for shopping with us", ln=True, align='C')
+    pdf.cell(0, 8, "We hope you have a great day", ln=True, align='C')
+
+    pdf.output(path)
+
+
+# Characters the cut-down font always has: printable ASCII and the pound sign
+RECEIPT_CHARS = frozenset(range(0x20, 0x7f)) | {ord("£")}
+
+
+class ReceiptPdfRenderer:
+    """Renders receipt PDFs with the font and the page heading prepared once.
+
+    Adding arial.ttf to a new FPDF parses the whole 1 MB font, and writing
+    the PDF cuts it down to the glyphs used, so both used to happen for
+    every receipt. Here the font is read once and cut down to printable
+    ASCII and the pound sign (widened, and the cut redone, the first time
+    a receipt needs another character the font has). The page
+    heading is drawn once onto a template PDF with that font, and each
+    receipt starts from a copy of the template, so per receipt only the
+    sale's own lines are laid out and only a small font is subset.
+    Safe to share between threads.
+    """
+
+    def __init__(self, font_path: str = FONT_PATH):
+        self.font_path = font_path
+        self.subsets = 0
+        self._lock = threading.Lock()
+        self._font_data: Optional[bytes] = None
+        self._font_chars: Set[int] = set()
+        self._chars: Set[int] = set()
+        self._subset_data = b""
+        self._template: Optional[FPDF] = None
+        self._dir: Optional[str] = None
+
+    def _needed(self, record: Dict[str, Any], employee_id: Optional[str]) -> Set[int]:
+        items, summary, vat = receipt_table(record)
+        text = [record["id"], record["timestamp"], record["cashier"], employee_id or ""]
+        text += [cell for rows in (items, summary, vat) for row in rows for cell in row]
+        return {ord(char) for cell in text for char in str(cell)} & self._font_chars
+
+    def _load(self):
+        with open(self.font_path, 'rb') as f:
+            self._font_data = f.read()
+        self._font_chars = set(TTFont(io.BytesIO(self._font_data), lazy=True).getBestCmap())
+        self._chars = RECEIPT_CHARS & self._font_chars
+        self._dir = tempfile.mkdtemp(prefix="till_fonts_")
+
+    def _cut(self, chars: Set[int]):
+        # Subsetting changes the font in place, so start from the file's bytes each time
+        font = TTFont(io.BytesIO(self._font_data), recalcTimestamp=False)
+        options = subset.Options(notdef_outline=True, recommended_glyphs=True,
+                                 glyph_names=True, name_IDs=["*"], layout_features=[])
+        # Tables FPDF leaves out of the PDF anyway
+        options.drop_tables += ["GDEF", "GPOS", "GSUB", "FFTM", "MATH", "hdmx", "meta", "kern"]
+        subsetter = subset.Subsetter(options)
+        subsetter.populate(unicodes=chars)
+        subsetter.subset(font)
+        out = io.BytesIO()
+        font.save(out)
+        self._chars = chars
+        self._subset_data = out.getvalue()
+        self.subsets += 1
+        # FPDF adds fonts from a file; each cut gets its own, as copies may still use the last
+        path = os.path.join(self._dir, f"receipt-{self.subsets}.ttf")
+        with open(path, 'wb') as f:
+            f.write(self._subset_data)
+        self._template = start_receipt_pdf(path)
+
+    def start(self, record: Dict[str, Any], employee_id: Optional[str] = None) -> FPDF:
+        """Return a copy of the template PDF, with a font covering the record's text"""
+        with self._lock:
+            if self._font_data is None:
+                self._load()
+            needed = self._needed(record, employee_id)
+            if self._template is None or not needed <= self._chars:
+                self._cut(self._chars | needed)
+            pdf = copy.deepcopy(self._template)
+            data = self._subset_data
+        # Copies share the parsed font, which writing a PDF cuts down to the
+        # glyphs it used, and its descriptor, which writing numbers as a PDF
+        # object, so each copy gets its own (a fast parse of the small cut)
+        for font in pdf.fonts.values():
+            font.ttfont = TTFont(io.BytesIO(data), recalcTimestamp=False, lazy=True)
+            font.desc = copy.copy(font.desc)
+        return pdf
+
+    def render(self, record: Dict[str, Any], path: str, employee_id: Optional[str] = None):
+        finish_receipt_pdf(self.start(record, employee_id), record, path, employee_id)
+
+    def close(self):
+        """Delete the font files; the next render prepares everything again"""
+        with self._lock:
+            if self._dir is not None:
+                shutil.rmtree(self._dir, ignore_errors=True)
+            self._font_data = self._template = self._dir = None
+
+
+_renderer = ReceiptPdfRenderer()
+atexit.register(_renderer.close)
+
+
+def render_receipt_pdf(record: Dict[str, Any], path: str, employee_id: Optional[str] = None):
+    """Write the PDF receipt for a record, for saving or printing (see ReceiptPdfRenderer)"""
+    _renderer.render(record, path, employee_id)
@@ -0,0 +1,237 @@
+import json
+import re
+from datetime import datetime
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Tuple
+
+from money import format_pence, to_pence
+from tax import rate_label, vat_heading
+
+
+# A receipt record is a plain dict holding everything needed to show,
+# reprint, report on or search a sale, with money as integer pence:
+#
+#   {"id": "T01-0000000042", "timestamp": "2025-01-29 12:45:48",
+#    "cashier": "Ali Hassan", "cashier_id": "ali",
+#    "items": [{"name": "🍊 Orange", "price_pence": 180, "qty": 1,
+#               "total_pence": 180}],
+#    "discounts": [],
+#    "vat": [{"rate": "0.20", "net_pence": 150, "vat_pence": 30}],
+#    "subtotal_pence": 150, "vat_pence": 30, "total_pence": 180}
+#
+# "cashier" is the name printed on receipts and "cashier_id" the login it
+# was made under; records saved before logins were kept have no
+# "cashier_id". "discounts" lists promotions as {"name": ..., "pence": amount off}; the
+# total is the item lines less the discounts. "vat" analyses the total by
+# VAT rate, lowest first. Records saved before promotions have no
+# "discounts" key, and those saved before VAT analysis have a single
+# "vat_rate" instead of "vat".
+
+
+def make_receipt_record(receipt_id: str, timestamp: datetime, cashier: str,
+                        items, vat: List[Tuple[Decimal, int, int]], discounts=(),
+                        cashier_id: str = "") -> Dict[str, Any]:
+    """Build a record from basket lines of (name, price, qty, line total, ...)
+
+    Prices and line totals are Money, as are the amounts of the
+    (name, amount off) ``discounts``. ``vat`` is the (rate, net pence,
+    VAT pence) analysis of the total (see ``TaxTable.analysis``).
+    """
+    lines = [{"name": name, "price_pence": price.pence, "qty": qty,
+              "total_pence": total.pence} for name, price, qty, total, *_ in items]
+    savings = [{"name": name, "pence": amount.pence} for name, amount in discounts]
+    total_pence = (sum(line["total_pence"] for line in lines)
+                   - sum(saving["pence"] for saving in savings))
+    analysis = [{"rate": str(rate), "net_pence": net, "vat_pence": vat_pence}
+                for rate, net, vat_pence in vat]
+    subtotal_pence = sum(row["net_pence"] for row in analysis)
+    vat_pence = sum(row["vat_pence"] for row in analysis)
+    if subtotal_pence + vat_pence != total_pence:
+        raise ValueError(f"VAT analysis comes to {subtotal_pence + vat_pence}, "
+                         f"not the total of {total_pence}")
+    return {
+        "id": receipt_id,
+        "timestamp": timestamp.strftime("%Y-%m-%d %H:%M:%S"),
+        "cashier": cashier,
+        "cashier_id": cashier_id,
+        "items": lines,
+        "discounts": savings,
+        "vat": analysis,
+        "subtotal_pence": subtotal_pence,
+        "vat_pence": vat_pence,
+        "total_pence": total_pence,
+    }
+
+
+def record_summary(record: Dict[str, Any]) -> Dict[str, Any]:
+    """Return the history-list fields of a record"""
+    return {"id": record["id"], "timestamp": record["timestamp"],
+            "cashier": record["cashier"], "total": format_pence(record["total_pence"]),
+            "lines": len(record["items"])}
+
+
+def dumps_record(record: Dict[str, Any]) -> str:
+    return json.dumps(record, ensure_ascii=False, separators=(",", ":"))
+
+
+def loads_record(data: str) -> Dict[str, Any]:
+    return json.loads(data)
+
+
+def vat_analysis(record: Dict[str, Any]) -> List[Tuple[Decimal, int, int]]:
+    """Return the (rate, net pence, VAT pence) rows of a record, old records included"""
+    if "vat" in record:
+        return [(Decimal(row["rate"]), row["net_pence"], row["vat_pence"]) for row in record["vat"]]
+    return [(Decimal(record["vat_rate"]), record["subtotal_pence"], record["vat_pence"])]
+
+
+def vat_label(record: Dict[str, Any]) -> str:
+    return vat_heading(rate for rate, _, _ in vat_analysis(record))
+
+
+def render_receipt_text(record: Dict[str, Any]) -> str:
+    """Render the customer-facing text receipt for a record"""
+    receipt = []
+    receipt.append("=" * 40)
+    receipt.append("Supermarket Till Receipt")
+    receipt.append("=" * 40)
+    receipt.append(f"Receipt: {record['id']}")
+    receipt.append(f"Date: {record['timestamp']}")
+    receipt.append(f"Employee: {record['cashier']}")
+    receipt.append("-" * 40)
+
+    # Add items
+    receipt.append("Items:")
+    receipt.append("-" * 40)
+    for line in record["items"]:
+        price = format_pence(line["price_pence"])
+        total = format_pence(line["total_pence"])
+        receipt.append(f"{line['name']:<30} {line['qty']:>3} x £{price:>6} = £{total:>7}")
+
+    receipt.append("-" * 40)
+
+    # Add promotions, the amount off lined up with the line totals
+    if record.get("discounts"):
+        receipt.append("Savings:")
+        for saving in record["discounts"]:
+            receipt.append(f"{saving['name'][:45]:<45} -£{format_pence(saving['pence']):>7}")
+        receipt.append("-" * 40)
+
+    # Add totals
+    receipt.append(f"{'Subtotal:':<20} £{format_pence(record['subtotal_pence']):>7}")
+    receipt.append(f"{vat_label(record) + ':':<20} £{format_pence(record['vat_pence']):>7}")
+    receipt.append(f"{'Total:':<20} £{format_pence(record['total_pence']):>7}")
+
+    # Add the VAT analysis, one row per rate
+    receipt.append("-" * 40)
+    receipt.append("VAT analysis:")
+    receipt.append(f"{'Rate':<8}{'Net':>10}{'VAT':>11}{'Gross':>11}")
+    for rate, net, vat in vat_analysis(record):
+        receipt.append(f"{rate_label(rate):<8}£{format_pence(net):>9} £{format_pence(vat):>9} "
+                       f"£{format_pence(net + vat):>9}")
+
+    receipt.append("=" * 40)
+    receipt.append("Thank you for shopping with us!")
+    receipt.append("=" * 40)
+
+    return "\n".join(receipt)
+
+
+def parse_receipt_text(content: str) -> Dict[str, Any]:
+    """Extract the date, cashier, total and line count from a text receipt"""
+    timestamp = None
+    cashier = "Unknown"
+    total = "0.00"
+    lines = 0
+    in_items = False
+
+    for line in content.split('\n'):
+        line = line.strip()
+        if not line:
+            continue
+
+        if line.startswith("Items:"):
+            in_items = True
+        elif line.startswith("Savings:") or line.startswith("Subtotal:"):
+            in_items = False
+        elif line.startswith("Date: "):
+            timestamp = line[len("Date: "):].strip()
+        elif "Employee: " in line:
+            cashier = line.split("Employee: ")[1].strip()
+        elif line.startswith("Total:"):
+            total = line.split("£")[-1].strip()
+        elif in_items and not line.startswith("-") and " = £" in line:
+            lines += 1
+
+    return {"timestamp": timestamp, "cashier": cashier, "total": total, "lines": lines}
+
+
+# "<name> <qty> x £<price> = £<total>" as written by render_receipt_text
+ITEM_LINE = re.compile(r"^(.*?)\s+(\d+) x £\s*(-?[\d.]+) = £\s*(-?[\d.]+)$")
+
+
+def parse_receipt_items(content: str) -> List[Tuple[str, str, int, str]]:
+    """Extract (name, price, qty, total) line items from a text receipt"""
+    items = []
+    for line in content.split('\n'):
+        match = ITEM_LINE.match(line.strip())
+        if match:
+            name, qty, price, total = match.groups()
+            items.append((name.strip(), price, int(qty), total))
+    return items
+
+
+# "<promotion name> -£<amount>" in the Savings section of render_receipt_text
+SAVING_LINE = re.compile(r"^(.*?)\s+-£\s*([\d.]+)$")
+# "<rate>% £<net> £<VAT> £<gross>" in its VAT analysis
+VAT_LINE = re.compile(r"^([\d.]+)%\s+£\s*(-?[\d.]+)\s+£\s*(-?[\d.]+)\s+£\s*(-?[\d.]+)$")
+
+
+def record_from_text(receipt_id: str, content: str,
+                     timestamp: Optional[str] = None) -> Dict[str, Any]:
+    """Convert a receipt saved as text by older versions into a record"""
+    summary = parse_receipt_text(content)
+    lines = [{"name": name, "price_pence": to_pence(price), "qty": qty,
+              "total_pence": to_pence(total)}
+             for name, price, qty, total in parse_receipt_items(content)]
+
+    subtotal_pence = vat_pence = 0
+    vat_rate = "0.20"
+    discounts = []
+    analysis = []
+    in_savings = False
+    for line in content.split('\n'):
+        line = line.strip()
+        saving = SAVING_LINE.match(line) if in_savings else None
+        vat_row = VAT_LINE.match(line)
+        if line.startswith("Savings:"):
+            in_savings = True
+        elif saving:
+            discounts.append({"name": saving.group(1), "pence": to_pence(saving.group(2))})
+        elif line.startswith("Subtotal:"):
+            in_savings = False
+            subtotal_pence = to_pence(line.split("£")[-1].strip())
+        elif vat_row:
+            rate, net, vat = vat_row.group(1, 2, 3)
+            analysis.append({"rate": str(Decimal(rate) / 100), "net_pence": to_pence(net),
+                             "vat_pence": to_pence(vat)})
+        elif line.startswith("VAT (") and "£" in line:
+            vat_pence = to_pence(line.split("£")[-1].strip())
+            vat_rate = str(Decimal(line[5:line.index("%")]) / 100)
+
+    record = {
+        "id": receipt_id,
+        "timestamp": timestamp or summary["timestamp"],
+        "cashier": summary["cashier"],
+        "items": lines,
+        "discounts": discounts,
+        "subtotal_pence": subtotal_pence,
+        "vat_pence": vat_pence,
+        "total_pence": to_pence(summary["total"]),
+    }
+    # Receipts from before the VAT analysis give a single rate
+    if analysis:
+        record["vat"] = analysis
+    else:
+        record["vat_rate"] = vat_rate
+    return record
@@ -0,0 +1,330 @@
+import bisect
+import json
+import os
+import re
+import sys
+import threading
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from receipt_record import format_pence, to_pence
+from receipt_store import ReceiptStore, open_receipt_store
+from settings import load_settings
+
+SEARCH_INDEX_FILE = "search_index.jsonl"
+
+# Sorts after any real term, to turn a prefix into a range upper bound
+HIGH = "\uffff"
+WORD = re.compile(r"[^\W_]+")
+# total>20, total<=5.50, date>=2025-01-01 ...
+COMPARISON = re.compile(r"^(total|date)(>=|<=|>|<|=)(.+)$")
+DATE = re.compile(r"^\d{4}-\d{2}(-\d{2})?$")
+AMOUNT = re.compile(r"^£?\d+(\.\d*)?$")
+
+
+def tokenize(text: str) -> List[str]:
+    """Split text into lowercase words, dropping emoji and punctuation"""
+    return WORD.findall(text.lower())
+
+
+class ReceiptSearchIndex:
+    """Inverted index over receipt history for the search bar.
+
+    Item names, the cashier, the date and the total of every receipt are
+    indexed as terms; totals and timestamps are also kept in sorted lists
+    for range filters. Changes are appended to a JSON Lines log that is
+    replayed at start-up, so searching never opens the receipts themselves.
+
+    Query syntax: plain words match item names or cashier by prefix, and a
+    bare amount matches totals by prefix; ``cashier:<name>`` limits to a cashier, by name or login id;
+    ``date:2025-01`` matches a date prefix; ``total>20``, ``total<=5``,
+    ``date>=2025-01-01`` filter ranges. All terms must match; a total
+    filter that is not an amount matches nothing.
+    """
+
+    def __init__(self, index_path: str, store: Optional[ReceiptStore] = None):
+        self.index_path = index_path
+        self.postings: Dict[str, Set[str]] = {}
+        self.docs: Dict[str, Dict[str, Any]] = {}
+        self._by_total: List[Tuple[int, str]] = []
+        self._by_time: List[Tuple[str, str]] = []
+        self._vocabulary: Optional[List[str]] = None
+        self._lock = threading.Lock()
+
+        if os.path.exists(index_path):
+            self.load()
+        elif store is not None:
+            self.rebuild(store)
+
+    def _terms(self, doc: Dict[str, Any]) -> Set[str]:
+        terms = set()
+        for name in doc["items"]:
+            terms.update(tokenize(name))
+        cashier_words = tokenize(doc["cashier"]) + tokenize(doc.get("cashier_id", ""))
+        terms.update(cashier_words)
+        terms.update(f"cashier:{word}" for word in cashier_words)
+        terms.add(doc["timestamp"][:10])
+        # Totals have their own namespace, so "20" does not match 2025 dates
+        terms.add(f"total:{doc['total_pence'] / 100:.2f}")
+        return terms
+
+    def _index(self, doc: Dict[str, Any], bulk: bool = False):
+        """Add one document; with ``bulk`` the sorted lists are left unsorted"""
+        receipt_id = doc["id"]
+        if receipt_id in self.docs:
+            self._unindex(receipt_id)
+        self.docs[receipt_id] = doc
+        for term in self._terms(doc):
+            postings = self.postings.get(term)
+            if postings is None:
+                self.postings[term] = postings = set()
+                self._vocabulary = None
+            postings.add(receipt_id)
+        if bulk:
+            self._by_total.append((doc["total_pence"], receipt_id))
+            self._by_time.append((doc["timestamp"], receipt_id))
+        else:
+            bisect.insort(self._by_total, (doc["total_pence"], receipt_id))
+            bisect.insort(self._by_time, (doc["timestamp"], receipt_id))
+
+    def _index_all(self, docs: List[Dict[str, Any]]):
+        """Replace the index contents with ``docs``"""
+        self.postings, self.docs = {}, {}
+        self._by_total, self._by_time = [], []
+        self._vocabulary = None
+        for doc in docs:
+            self._index(doc, bulk=True)
+        self._by_total.sort()
+        self._by_time.sort()
+
+    def _unindex(self, receipt_id: str) -> bool:
+        doc = self.docs.pop(receipt_id, None)
+        if doc is None:
+            return False
+        for term in self._terms(doc):
+            postings = self.postings.get(term)
+            if postings is not None:
+                postings.discard(receipt_id)
+                if not postings:
+                    del self.postings[term]
+                    self._vocabulary = None
+        for keys, key in ((self._by_total, (doc["total_pence"], receipt_id)),
+                          (self._by_time, (doc["timestamp"], receipt_id))):
+            pos = bisect.bisect_left(keys, key)
+            if pos < len(keys) and keys[pos] == key:
+                del keys[pos]
+        return True
+
+    def _append(self, record: Dict[str, Any]):
+        try:
+            with open(self.index_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        except Exception as e:
+            print(f"Error updating search index: {e}")
+
+    def load(self):
+        """Replay the index log"""
+        docs: Dict[str, Dict[str, Any]] = {}
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    if record.get("deleted"):
+                        docs.pop(record["id"], None)
+                    else:
+                        docs[record["id"]] = record
+        except Exception as e:
+            print(f"Error loading search index: {e}")
+        self._index_all(list(docs.values()))
+
+    def rebuild(self, store: ReceiptStore) -> int:
+        """Index every receipt in the store and rewrite the log compactly"""
+        with self._lock:
+            records = (store.get_record(entry["id"]) for entry in store.list_receipts())
+            self._index_all([self._doc(record) for record in records if record])
+
+            tmp_path = self.index_path + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                for doc in self.docs.values():
+                    f.write(json.dumps(doc, ensure_ascii=False) + "\n")
+            os.replace(tmp_path, self.index_path)
+        return len(self.docs)
+
+    def _doc(self, record: Dict[str, Any]) -> Dict[str, Any]:
+        return {"id": record["id"], "timestamp": record["timestamp"],
+                "cashier": record["cashier"], "cashier_id": record.get("cashier_id", ""),
+                "total_pence": record["total_pence"],
+                "items": [line["name"] for line in record["items"]]}
+
+    def add(self, record: Dict[str, Any]):
+        """Index a newly saved receipt record"""
+        doc = self._doc(record)
+        with self._lock:
+            self._index(doc)
+            self._append(doc)
+
+    def remove(self, receipt_id: str):
+        """Drop a deleted receipt from the index"""
+        with self._lock:
+            if self._unindex(receipt_id):
+                self._append({"id": receipt_id, "deleted": True})
+
+    def _prefix_matches(self, prefix: str) -> Set[str]:
+        """Union of the postings for every term starting with ``prefix``"""
+        if self._vocabulary is None:
+            self._vocabulary = sorted(self.postings)
+        matches = set()
+        pos = bisect.bisect_left(self._vocabulary, prefix)
+        while pos < len(self._vocabulary) and self._vocabulary[pos].startswith(prefix):
+            matches |= self.postings[self._vocabulary[pos]]
+            pos += 1
+        return matches
+
+    def _range(self, keys, field: str, op: str, value) -> "KeyRange":
+        if op == "=":
+            lo, hi = bisect.bisect_left(keys, (value,)), bisect.bisect_right(keys, (value, HIGH))
+        elif op in (">", ">="):
+            lo = (bisect.bisect_right(keys, (value, HIGH)) if op == ">"
+                  else bisect.bisect_left(keys, (value,)))
+            hi = len(keys)
+        else:
+            lo = 0
+            hi = (bisect.bisect_left(keys, (value,)) if op == "<"
+                  else bisect.bisect_right(keys, (value, HIGH)))
+        return KeyRange(keys, field, lo, hi)
+
+    def _date_prefix(self, prefix: str) -> "KeyRange":
+        lo = bisect.bisect_left(self._by_time, (prefix,))
+        hi = bisect.bisect_left(self._by_time, (prefix + HIGH,))
+        return KeyRange(self._by_time, "timestamp", lo, hi)
+
+    def _clause(self, token: str):
+        """Return the matches for one query term as a set or a KeyRange"""
+        comparison = COMPARISON.match(token)
+        if comparison:
+            field, op, value = comparison.groups()
+            if field == "total":
+                if not AMOUNT.match(value):
+                    return set()
+                return self._range(self._by_total, "total_pence", op, to_pence(value.lstrip("£")))
+            if op == "=":
+                return self._date_prefix(value)
+            if op in ("<=", ">"):
+                # Compare whole days, so date<=2025-01-31 includes that day
+                value += HIGH
+            return self._range(self._by_time, "timestamp", op, value)
+
+        if token.startswith("cashier:"):
+            results = None
+            for word in tokenize(token[len("cashier:"):]):
+                matches = self._prefix_matches(f"cashier:{word}")
+                results = matches if results is None else results & matches
+            return results or set()
+
+        if token.startswith("date:"):
+            return self._date_prefix(token[len("date:"):])
+
+        if DATE.match(token):
+            return self._date_prefix(token)
+
+        if AMOUNT.match(token):
+            return self._prefix_matches("total:" + token.lstrip("£"))
+
+        results = None
+        for word in tokenize(token):
+            matches = self._prefix_matches(word)
+            results = matches if results is None else results & matches
+        return results or set()
+
+    def search(self, query: str) -> List[str]:
+        """Return ids of receipts matching every term of ``query``, newest first"""
+        with self._lock:
+            tokens = query.lower().split()
+            if not tokens:
+                return [receipt_id for _, receipt_id in reversed(self._by_time)]
+
+            # Start from the most selective term; wide ranges are then
+            # checked per candidate instead of being expanded into sets
+            clauses = sorted((self._clause(token) for token in tokens), key=len)
+            first = clauses[0]
+            results = first.to_set() if isinstance(first, KeyRange) else first
+            for clause in clauses[1:]:
+                if not results:
+                    break
+                if isinstance(clause, KeyRange):
+                    results = {r for r in results if clause.contains(self.docs[r])}
+                else:
+                    results = results & clause
+
+            if len(results) > len(self._by_time) // 4:
+                return [r for _, r in reversed(self._by_time) if r in results]
+            return sorted(results, key=lambda r: (self.docs[r]["timestamp"], r), reverse=True)
+
+
+class KeyRange:
+    """A slice [lo, hi) of one of the index's sorted (value, id) lists"""
+
+    def __init__(self, keys: List[Tuple[Any, str]], field: str, lo: int, hi: int):
+        self.keys = keys
+        self.field = field
+        self.lo = lo
+        self.hi = max(lo, hi)
+
+    def __len__(self) -> int:
+        return self.hi - self.lo
+
+    def to_set(self) -> Set[str]:
+        return {receipt_id for _, receipt_id in self.keys[self.lo:self.hi]}
+
+    def contains(self, doc: Dict[str, Any]) -> bool:
+        key = (doc[self.field], doc["id"])
+        if self.lo > 0 and key < self.keys[self.lo]:
+            return False
+        if self.hi < len(self.keys) and key >= self.keys[self.hi]:
+            return False
+        return self.lo < self.hi
+
+
+class SearchResults:
+    """A page source over search hits, for use with VirtualReceiptList.
+
+    Rows are built from the search index, so paging through old hits does
+    not load the receipt store's older partitions.
+    """
+
+    def __init__(self, receipt_ids: List[str], index: ReceiptSearchIndex):
+        self.receipt_ids = receipt_ids
+        self.index = index
+
+    def count(self) -> int:
+        return len(self.receipt_ids)
+
+    def discard(self, receipt_id: str):
+        """Forget a hit that has since been deleted"""
+        if receipt_id in self.receipt_ids:
+            self.receipt_ids.remove(receipt_id)
+
+    def list_page(self, offset: int, limit: int) -> List[Dict[str, Any]]:
+        page = []
+        for receipt_id in self.receipt_ids[offset:offset + limit]:
+            doc = self.index.docs.get(receipt_id)
+            if doc:
+                page.append({"id": receipt_id, "timestamp": doc["timestamp"],
+                             "cashier": doc["cashier"], "total": format_pence(doc["total_pence"]),
+                             "lines": len(doc["items"])})
+        return page
+
+
+if __name__ == "__main__":
+    # Usage: python receipt_search.py rebuild
+    if len(sys.argv) < 2 or sys.argv[1] != "rebuild":
+        print("Usage: python receipt_search.py rebuild")
+        sys.exit(1)
+
+    settings = load_settings()
+    store = open_receipt_store(settings)
+    index = ReceiptSearchIndex(os.path.join(settings["receipts_dir"], SEARCH_INDEX_FILE))
+    print(f"Indexed {index.rebuild(store)} receipts for search")
+    store.close()
@@ -0,0 +1,369 @@
+import os
+import sqlite3
+import sys
+import threading
+from typing import Any, Dict, List, Optional
+
+from durability import DurabilityPolicy
+from receipt_index import ReceiptIndex
+from receipt_record import (dumps_record, format_pence, loads_record, record_from_text,
+                            record_summary, render_receipt_text)
+from settings import load_settings
+
+
+class ReceiptStore:
+    """Interface shared by the receipt storage backends.
+
+    ``save`` takes a receipt record (see receipt_record.py) and
+    ``get_record`` returns it unchanged. Summaries returned by ``get`` and
+    ``list_receipts`` carry the id, timestamp, cashier, total and line
+    count used by the history list.
+    """
+
+    def save(self, record: Dict[str, Any]) -> str:
+        raise NotImplementedError
+
+    def get(self, receipt_id: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def get_record(self, receipt_id: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def get_text(self, receipt_id: str) -> Optional[str]:
+        """Render a stored receipt as text"""
+        record = self.get_record(receipt_id)
+        return render_receipt_text(record) if record else None
+
+    def delete(self, receipt_id: str) -> bool:
+        raise NotImplementedError
+
+    def list_receipts(self, start: Optional[str] = None, end: Optional[str] = None,
+                      cashier: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Return summaries newest first, optionally limited to a date range
+
+        ``start`` and ``end`` are inclusive timestamp prefixes, so
+        ``start="2025-01-01", end="2025-01-31"`` selects all of January.
+        """
+        raise NotImplementedError
+
+    def count(self) -> int:
+        """Return the number of receipts in the store"""
+        return len(self.list_receipts())
+
+    def list_page(self, offset: int, limit: int) -> List[Dict[str, Any]]:
+        """Return one page of summaries, newest first"""
+        return self.list_receipts()[offset:offset + limit]
+
+    def flush(self):
+        """Make any batched writes durable"""
+
+    def close(self):
+        self.flush()
+
+
+def in_range(timestamp: str, start: Optional[str], end: Optional[str]) -> bool:
+    """Check a timestamp against inclusive start/end prefixes"""
+    if start and timestamp < start:
+        return False
+    if end and timestamp[:len(end)] > end:
+        return False
+    return True
+
+
+class TextFileReceiptStore(ReceiptStore):
+    """One file per receipt in a folder, listed through the receipt index.
+
+    New receipts are saved as JSON records (receipt_<id>.json); text
+    receipts written by older versions (receipt_<id>.txt) are still read.
+    Under a durability policy each sale syncs its file, the index and the
+    folder; group commit shares the index and folder syncs across a batch.
+    """
+
+    def __init__(self, receipts_dir: str, durability: Optional[DurabilityPolicy] = None):
+        self.receipts_dir = receipts_dir
+        self.durability = durability or DurabilityPolicy("none")
+        if not os.path.exists(self.receipts_dir):
+            os.makedirs(self.receipts_dir)
+        self.index = ReceiptIndex(self.receipts_dir)
+
+    def save(self, record: Dict[str, Any]) -> str:
+        filename = f"receipt_{record['id']}.json"
+        path = os.path.join(self.receipts_dir, filename)
+        data = dumps_record(record).encode('utf-8')
+        with open(path, 'wb') as f:
+            f.write(data)
+
+        # Record the receipt in the index so history never rescans the folder
+        entry = record_summary(record)
+        entry.update({"path": filename, "offset": 0, "size": len(data)})
+        self.index.add(entry)
+        self.durability.written(path, self.index.index_path, self.receipts_dir)
+        return record["id"]
+
+    def get(self, receipt_id: str) -> Optional[Dict[str, Any]]:
+        return self.index.get(receipt_id)
+
+    def get_record(self, receipt_id: str) -> Optional[Dict[str, Any]]:
+        entry = self.index.get(receipt_id)
+        if entry is None:
+            return None
+        try:
+            with open(os.path.join(self.receipts_dir, entry["path"]), 'r', encoding='utf-8') as f:
+                content = f.read()
+        except FileNotFoundError:
+            return None
+        if entry["path"].endswith(".txt"):
+            return record_from_text(receipt_id, content, entry["timestamp"])
+        return loads_record(content)
+
+    def delete(self, receipt_id: str) -> bool:
+        entry = self.index.get(receipt_id)
+        if entry is None:
+            return False
+        path = os.path.join(self.receipts_dir, entry["path"])
+        if os.path.exists(path):
+            os.remove(path)
+        return self.index.remove(receipt_id)
+
+    def list_receipts(self, start=None, end=None, cashier=None):
+        return [entry for entry in self.index.list_entries(newest_first=True)
+                if in_range(entry["timestamp"], start, end)
+                and (cashier is None or entry["cashier"] == cashier)]
+
+    def count(self) -> int:
+        return len(self.index.entries)
+
+    def list_page(self, offset: int, limit: int) -> List[Dict[str, Any]]:
+        return self.index.page(offset, limit)
+
+    def flush(self):
+        self.durability.sync()
+
+    def close(self):
+        self.durability.close()
+
+
+class SQLiteReceiptStore(ReceiptStore):
+    """Receipts held in a SQLite database running in WAL mode.
+
+    Headers and line items live in separate tables, with indexes on the
+    timestamp and on (cashier, timestamp) so history listings, lookups,
+    deletes and date-range queries never scan the whole store. The full
+    record is kept as JSON alongside them. Writes are committed every
+    ``batch_size`` receipts, or when ``flush`` is called. Under a "fsync"
+    or "group" durability policy the policy decides when to commit instead,
+    and commits are fsynced (synchronous=FULL).
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS receipts (
+            id TEXT PRIMARY KEY,
+            timestamp TEXT NOT NULL,
+            cashier TEXT NOT NULL,
+            total_pence INTEGER NOT NULL,
+            lines INTEGER NOT NULL,
+            record TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS receipt_items (
+            receipt_id TEXT NOT NULL REFERENCES receipts(id) ON DELETE CASCADE,
+            line_no INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            price_pence INTEGER NOT NULL,
+            qty INTEGER NOT NULL,
+            total_pence INTEGER NOT NULL,
+            PRIMARY KEY (receipt_id, line_no)
+        );
+        CREATE INDEX IF NOT EXISTS idx_receipts_timestamp ON receipts(timestamp);
+        CREATE INDEX IF NOT EXISTS idx_receipts_cashier ON receipts(cashier, timestamp);
+    """
+
+    INSERT_RECEIPT = ("INSERT OR REPLACE INTO receipts "
+                      "(id, timestamp, cashier, total_pence, lines, record) "
+                      "VALUES (?, ?, ?, ?, ?, ?)")
+    INSERT_ITEM = ("INSERT INTO receipt_items "
+                   "(receipt_id, line_no, name, price_pence, qty, total_pence) "
+                   "VALUES (?, ?, ?, ?, ?, ?)")
+    SUMMARY_COLUMNS = "id, timestamp, cashier, total_pence, lines"
+
+    def __init__(self, db_path: str, batch_size: int = 1,
+                 durability: Optional[DurabilityPolicy] = None):
+        self.db_path = db_path
+        self.batch_size = max(1, int(batch_size))
+        self.durability = durability or DurabilityPolicy("none")
+        self._pending = 0
+        self._lock = threading.Lock()
+
+        db_dir = os.path.dirname(db_path)
+        if db_dir and not os.path.exists(db_dir):
+            os.makedirs(db_dir)
+
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        synchronous = "NORMAL" if self.durability.mode == "none" else "FULL"
+        self.conn.execute(f"PRAGMA synchronous={synchronous}")
+        self.conn.execute("PRAGMA foreign_keys=ON")
+        self.conn.executescript(self.SCHEMA)
+        self._upgrade_schema()
+        self.conn.commit()
+
+    def _upgrade_schema(self):
+        """Add the record column to databases that only stored receipt text"""
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(receipts)")]
+        self._has_text_column = "text" in columns
+        if "record" not in columns:
+            self.conn.execute("ALTER TABLE receipts ADD COLUMN record TEXT")
+        if self._has_text_column:
+            self.INSERT_RECEIPT = ("INSERT OR REPLACE INTO receipts "
+                                   "(id, timestamp, cashier, total_pence, lines, record, text) "
+                                   "VALUES (?, ?, ?, ?, ?, ?, '')")
+
+    def _summary(self, row) -> Dict[str, Any]:
+        receipt_id, timestamp, cashier, total_pence, lines = row
+        return {"id": receipt_id, "timestamp": timestamp, "cashier": cashier,
+                "total": format_pence(total_pence), "lines": lines}
+
+    def save(self, record: Dict[str, Any]) -> str:
+        items = record["items"]
+        with self._lock:
+            self.conn.execute("DELETE FROM receipt_items WHERE receipt_id = ?",
+                              (record["id"],))
+            self.conn.execute(self.INSERT_RECEIPT, (
+                record["id"], record["timestamp"], record["cashier"],
+                record["total_pence"], len(items), dumps_record(record)))
+            self.conn.executemany(self.INSERT_ITEM, [
+                (record["id"], line_no, line["name"], line["price_pence"],
+                 line["qty"], line["total_pence"])
+                for line_no, line in enumerate(items)])
+
+            self._pending += 1
+            durable = self.durability.mode != "none"
+            if not durable and self._pending >= self.batch_size:
+                self.conn.commit()
+                self._pending = 0
+        if durable:
+            self.durability.written(self.flush)
+        return record["id"]
+
+    def get(self, receipt_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self.conn.execute(
+                f"SELECT {self.SUMMARY_COLUMNS} FROM receipts WHERE id = ?",
+                (receipt_id,)).fetchone()
+        return self._summary(row) if row else None
+
+    def get_record(self, receipt_id: str) -> Optional[Dict[str, Any]]:
+        columns = "record, text, timestamp" if self._has_text_column else "record"
+        with self._lock:
+            row = self.conn.execute(f"SELECT {columns} FROM receipts WHERE id = ?",
+                                    (receipt_id,)).fetchone()
+        if row is None:
+            return None
+        if row[0] is None:
+            # Saved as text before records were stored
+            return record_from_text(receipt_id, row[1], row[2])
+        return loads_record(row[0])
+
+    def delete(self, receipt_id: str) -> bool:
+        with self._lock:
+            cursor = self.conn.execute("DELETE FROM receipts WHERE id = ?", (receipt_id,))
+            self.conn.commit()
+            self._pending = 0
+        return cursor.rowcount > 0
+
+    def list_receipts(self, start=None, end=None, cashier=None):
+        clauses, params = [], []
+        if start:
+            clauses.append("timestamp >= ?")
+            params.append(start)
+        if end:
+            # Treat the end as an inclusive prefix ("2025-01" covers January)
+            clauses.append("timestamp < ?")
+            params.append(end + "\uffff")
+        if cashier is not None:
+            clauses.append("cashier = ?")
+            params.append(cashier)
+
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        with self._lock:
+            rows = self.conn.execute(
+                f"SELECT {self.SUMMARY_COLUMNS} FROM receipts {where} "
+                "ORDER BY timestamp DESC, id DESC", params).fetchall()
+        return [self._summary(row) for row in rows]
+
+    def count(self) -> int:
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM receipts").fetchone()[0]
+
+    def list_page(self, offset: int, limit: int) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self.conn.execute(
+                f"SELECT {self.SUMMARY_COLUMNS} FROM receipts "
+                "ORDER BY timestamp DESC, id DESC LIMIT ? OFFSET ?",
+                (limit, offset)).fetchall()
+        return [self._summary(row) for row in rows]
+
+    def flush(self):
+        with self._lock:
+            if self._pending:
+                self.conn.commit()
+                self._pending = 0
+
+    def close(self):
+        self.durability.close()
+        self.flush()
+        self.conn.close()
+
+
+def open_receipt_store(settings: Optional[Dict[str, Any]] = None) -> ReceiptStore:
+    """Create the receipt store selected by the 'receipt_store' setting"""
+    settings = settings or load_settings()
+    backend = settings["receipt_store"]
+    durability = DurabilityPolicy(settings["receipt_durability"],
+                                  group_size=settings["group_commit_size"],
+                                  group_delay_ms=settings["group_commit_ms"])
+    if backend == "sqlite":
+        return SQLiteReceiptStore(settings["receipt_db"],
+                                  batch_size=settings["sqlite_batch_size"],
+                                  durability=durability)
+    if backend == "text":
+        from receipt_partitions import PartitionedReceiptStore
+        return PartitionedReceiptStore(settings["receipts_dir"], durability=durability)
+    if backend == "journal":
+        from receipt_journal import JournalReceiptStore
+        return JournalReceiptStore(settings["journal_dir"],
+                                   segment_bytes=settings["journal_segment_bytes"],
+                                   rotate_daily=settings["journal_rotate_daily"],
+                                   durability=durability)
+    raise ValueError(f"Unknown receipt store: {backend}")
+
+
+def migrate_text_to_sqlite(receipts_dir: str, db_path: str, batch_size: int = 500) -> int:
+    """Import every receipt in a text receipts folder into a SQLite store"""
+    from receipt_partitions import PartitionedReceiptStore
+    source = PartitionedReceiptStore(receipts_dir)
+    target = SQLiteReceiptStore(db_path, batch_size=batch_size)
+    count = 0
+    try:
+        for entry in source.list_receipts():
+            record = source.get_record(entry["id"])
+            if record is None:
+                print(f"Skipping missing receipt {entry['id']}")
+                continue
+            target.save(record)
+            count += 1
+    finally:
+        target.close()
+    return count
+
+
+if __name__ == "__main__":
+    # Usage: python receipt_store.py migrate [receipts_dir] [db_path]
+    if len(sys.argv) < 2 or sys.argv[1] != "migrate":
+        print("Usage: python receipt_store.py migrate [receipts_dir] [db_path]")
+        sys.exit(1)
+
+    settings = load_settings()
+    receipts_dir = sys.argv[2] if len(sys.argv) > 2 else settings["receipts_dir"]
+    db_path = sys.argv[3] if len(sys.argv) > 3 else settings["receipt_db"]
+    count = migrate_text_to_sqlite(receipts_dir, db_path)
+    print(f"Imported {count} receipts from {receipts_dir} into {db_path}")
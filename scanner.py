@@ -0,0 +1,110 @@
+import threading
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, List, NamedTuple, Optional, Tuple
+
+from catalog import Catalog, CatalogItem, check_digit_ok, normalize_code
+
+
+class ScanError(NamedTuple):
+    code: str
+    reason: str
+    time: str
+
+
+class ScanBuffer:
+    """Collects scanned codes and adds them to the basket in batches.
+
+    ``push`` only queues a code. The first code of a burst schedules a
+    flush ``flush_ms`` later through ``schedule(delay_ms, callback)`` (for
+    example ``root.after``), and a full buffer flushes at once; either way
+    ``apply(lines)`` receives the burst as one list of (item, qty) lines,
+    repeated scans of an item merged into one line. Codes that do not
+    resolve go to ``errors`` instead of interrupting the cashier.
+
+    While ``apply`` runs, ``pushed_at`` holds the ``clock`` times the codes
+    of its batch were pushed, so the display can time scan to screen.
+    """
+
+    def __init__(self, catalog: Catalog, apply: Callable[[List[Tuple[CatalogItem, int]]], None],
+                 schedule: Optional[Callable[[int, Callable[[], None]], object]] = None,
+                 flush_ms: int = 60, max_batch: int = 64, max_errors: int = 50,
+                 clock: Callable[[], float] = time.perf_counter):
+        self.catalog = catalog
+        self.apply = apply
+        self.schedule = schedule
+        self.flush_ms = flush_ms
+        self.max_batch = max_batch
+        self.clock = clock
+        self.errors: Deque[ScanError] = deque(maxlen=max_errors)
+        self.on_error: Optional[Callable[[ScanError], None]] = None
+        self.scans = 0
+        self.batches = 0
+        self.pushed_at: List[float] = []
+        self._pending: List[str] = []
+        self._pushed: List[float] = []
+        self._scheduled = False
+        self._lock = threading.Lock()
+
+    def push(self, code: str):
+        """Queue one scanned code"""
+        with self._lock:
+            self._pending.append(code)
+            self._pushed.append(self.clock())
+            full = len(self._pending) >= self.max_batch
+            schedule = not full and not self._scheduled and self.schedule is not None
+            if schedule:
+                self._scheduled = True
+        if full:
+            self.flush()
+        elif schedule:
+            self.schedule(self.flush_ms, self.flush)
+
+    def resolve(self, code: str) -> Tuple[Optional[CatalogItem], str]:
+        """Return the item for a code, or None and the reason it failed"""
+        item = self.catalog.lookup_code(code)
+        if item is not None:
+            return item, ""
+        code = normalize_code(code)
+        if not code.isdigit():
+            return None, "not a barcode or PLU"
+        if len(code) > 5 and not check_digit_ok(code):
+            return None, "bad check digit, scan again"
+        return None, "not in the catalog"
+
+    def flush(self):
+        """Resolve the queued codes and apply them as one batch"""
+        with self._lock:
+            codes, self._pending = self._pending, []
+            pushed, self._pushed = self._pushed, []
+            self._scheduled = False
+        if not codes:
+            return
+
+        lines: Dict[str, List] = {}
+        for code in codes:
+            item, reason = self.resolve(code)
+            if item is None:
+                self._error(code, reason)
+            elif item.sku in lines:
+                lines[item.sku][1] += 1
+            else:
+                lines[item.sku] = [item, 1]
+
+        self.scans += len(codes)
+        self.batches += 1
+        if lines:
+            self.pushed_at = pushed
+            try:
+                self.apply([(item, qty) for item, qty in lines.values()])
+            finally:
+                self.pushed_at = []
+
+    def _error(self, code: str, reason: str):
+        error = ScanError(code, reason, time.strftime("%H:%M:%S"))
+        self.errors.appendleft(error)
+        if self.on_error is not None:
+            self.on_error(error)
+
+    def clear_errors(self):
+        self.errors.clear()
@@ -0,0 +1,79 @@
+import json
+import os
+import tempfile
+from typing import Any, Dict
+
+SETTINGS_FILE = "settings.json"
+
+# Values used when settings.json is missing or does not set a key
+DEFAULT_SETTINGS: Dict[str, Any] = {
+    # Receipt storage backend: "text" (one file per receipt), "sqlite"
+    # or "journal" (receipts appended to rotating segment files)
+    "receipt_store": "text",
+    # Prefix for receipt ids, unique per till in the store
+    "till_id": "T01",
+    # Receipt sequence numbers reserved per write of receipts/sequence-<till_id>.json
+    "receipt_id_block": 1000,
+    "receipts_dir": "receipts",
+    # Price book CSV with sku, name, category and price columns
+    "catalog_file": "catalog.csv",
+    # How often the till checks the price book for changes (0 = never)
+    "catalog_poll_ms": 2000,
+    # Promotion rules (multibuys, BOGOFs, meal deals, spend thresholds);
+    # see promotions.py for the format. No file means no promotions.
+    "promotions_file": "promotions.json",
+    # VAT rate of each tax class code in the price book's tax_class column;
+    # items without a known code are charged at the "S" (standard) rate
+    "vat_rates": {"S": "0.20", "R": "0.05", "Z": "0"},
+    # Scans arriving within this many milliseconds are added to the basket together
+    "scan_flush_ms": 60,
+    # After each sale, save its PDF receipt in this folder ("" = only when asked)
+    # and/or print it, in the background while the next sale starts
+    "receipt_pdf_dir": "",
+    "print_receipts": False,
+    # Where receipts are printed: "lp" (CUPS, optionally to printer_name),
+    # "device" (raw bytes to print_device), "directory" (copied into
+    # print_dir, a stand-in printer), "windows" or "auto" (windows or lp)
+    "print_backend": "auto",
+    "printer_name": "",
+    "print_device": "/dev/usb/lp0",
+    "print_dir": os.path.join("receipts", "printed"),
+    # Print jobs are rendered to their own files here and deleted once printed
+    "print_spool_dir": os.path.join(tempfile.gettempdir(), "till_print_spool"),
+    # Jobs waiting beyond this are refused; failed jobs are retried this many
+    # times, waiting print_retry_ms and then twice as long each time
+    "print_queue_size": 32,
+    "print_retries": 3,
+    "print_retry_ms": 500,
+    # Basket changes are drawn at most once per this many milliseconds (one frame)
+    "ui_frame_ms": 16,
+    "receipt_db": os.path.join("receipts", "receipts.db"),
+    # Number of sales per SQLite transaction (1 = commit every sale)
+    "sqlite_batch_size": 1,
+    "journal_dir": os.path.join("receipts", "journal"),
+    # Start a new segment when it would grow past this size, and every day
+    "journal_segment_bytes": 4 * 1024 * 1024,
+    "journal_rotate_daily": True,
+    # When saved receipts are forced to disk: "none" (left to the OS),
+    # "fsync" (every sale) or "group" (once per group_commit_size sales or
+    # group_commit_ms milliseconds, whichever comes first)
+    "receipt_durability": "group",
+    "group_commit_size": 32,
+    "group_commit_ms": 20,
+    # receipt_archive.py packs day folders older than this into compressed
+    # archives, using "lzma" (smaller) or "zlib" (faster)
+    "archive_after_days": 90,
+    "archive_codec": "lzma",
+}
+
+
+def load_settings(path: str = SETTINGS_FILE) -> Dict[str, Any]:
+    """Return the default settings overlaid with any values from settings.json"""
+    settings = dict(DEFAULT_SETTINGS)
+    try:
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                settings.update(json.load(f))
+    except Exception as e:
+        print(f"Error loading settings: {e}")
+    return settings
@@ -2,11 +2,27 @@ import tkinter as tk
 from ttkbootstrap import Style, ttk
 from ttkbootstrap.constants import *
 from tkinter import messagebox, filedialog
-from decimal import Decimal
-from datetime import datetime
-from fpdf import FPDF
 import os
 from users import UserManager
+from receipt_store import open_receipt_store
+from receipt_ids import ReceiptIdAllocator
+from receipt_history_view import VirtualReceiptList
+from receipt_search import ReceiptSearchIndex, SearchResults, SEARCH_INDEX_FILE
+from catalog import ALL_CATEGORIES
+from catalog_binary import load_catalog
+from catalog_watch import CatalogWatcher
+from catalog_fuzzy import FuzzyIndex, SUGGEST_BELOW
+from scanner import ScanBuffer
+from ui_updates import BasketDisplay
+from basket import Basket, Checkout
+from checkout_pipeline import CheckoutPipeline
+from print_spooler import PrintSpooler, open_print_backend
+from promotions import load_promotions
+from tax import TaxTable
+from money import format_pence
+from receipt_record import render_receipt_text
+from receipt_pdf import render_receipt_pdf
+from settings import load_settings
 from login_window import LoginWindow
 from profile_window import ProfileWindow
 
@@ -20,35 +36,47 @@ class SupermarketTill:
         self.current_user = None
         
         # Initialize receipt history
-        self.receipts_dir = "receipts"
+        self.settings = load_settings()
+        self.receipts_dir = self.settings["receipts_dir"]
         if not os.path.exists(self.receipts_dir):
             os.makedirs(self.receipts_dir)
-        
-        # Predefined items with prices and categories
-        self.predefined_items = {
-            # Fruits
-            "🍎 Apple": {"price": 2.50, "category": "Fruits"},
-            "🍊 Orange": {"price": 1.80, "category": "Fruits"},
-            "🍌 Banana": {"price": 1.20, "category": "Fruits"},
-            "🍇 Grapes": {"price": 3.50, "category": "Fruits"},
-            "🍓 Strawberries": {"price": 4.00, "category": "Fruits"},
-            "🥭 Mango": {"price": 3.00, "category": "Fruits"},
-            "🍍 Pineapple": {"price": 4.50, "category": "Fruits"},
-            "🍉 Watermelon": {"price": 6.00, "category": "Fruits"},
-            "🍑 Peach": {"price": 2.00, "category": "Fruits"},
-            "🥝 Kiwi": {"price": 1.50, "category": "Fruits"},
-            # Vegetables
-            "🍅 Tomato": {"price": 1.20, "category": "Vegetables"},
-            "🥒 Cucumber": {"price": 1.00, "category": "Vegetables"},
-            "🥕 Carrot": {"price": 1.50, "category": "Vegetables"},
-            "🥔 Potato": {"price": 2.00, "category": "Vegetables"},
-            "🧅 Onion": {"price": 1.00, "category": "Vegetables"},
-            "🥬 Lettuce": {"price": 2.50, "category": "Vegetables"},
-            "🥦 Broccoli": {"price": 3.00, "category": "Vegetables"},
-            "🥦 Cauliflower": {"price": 3.50, "category": "Vegetables"},
-            "🫑 Bell Pepper": {"price": 2.00, "category": "Vegetables"},
-            "🥬 Spinach": {"price": 2.50, "category": "Vegetables"}
-        }
+        self.receipt_store = open_receipt_store(self.settings)
+        self.receipt_ids = ReceiptIdAllocator(
+            os.path.join(self.receipts_dir, "sequence.json"),
+            till_id=self.settings["till_id"],
+            block_size=self.settings["receipt_id_block"])
+        self.search_index = ReceiptSearchIndex(
+            os.path.join(self.receipts_dir, SEARCH_INDEX_FILE), self.receipt_store)
+        self.checkout_core = Checkout(self.receipt_store, self.receipt_ids, self.search_index)
+        # PDFs and printing for finished sales run here, while the next sale is rung up
+        self.pipeline = CheckoutPipeline(self.root.after)
+        self.pipeline.on_result = self.show_stage_result
+        self.root.after(self.pipeline.poll_ms, self.pipeline.poll)
+        self.last_record = None
+        # Receipts are printed from a queue on their own thread, retried if the printer fails
+        self.spooler = PrintSpooler(open_print_backend(self.settings), self.settings["print_spool_dir"],
+                                    max_jobs=self.settings["print_queue_size"],
+                                    retries=self.settings["print_retries"],
+                                    backoff_ms=self.settings["print_retry_ms"],
+                                    schedule=self.root.after)
+        self.spooler.on_result = self.show_print_result
+        self.root.after(self.spooler.poll_ms, self.spooler.poll)
+        
+        # Price book, indexed by category and for type-ahead
+        self.catalog = load_catalog(self.settings["catalog_file"])
+        # Trigram index for misspelt names, built in the background
+        self.fuzzy_index = FuzzyIndex.build_async(self.catalog.names)
+        # Multibuys, meal deals and spend thresholds, compiled for lookup by SKU and category
+        self.promotions = load_promotions(self.settings["promotions_file"], self.catalog)
+        # VAT rate of each tax class in the price book
+        self.taxes = TaxTable(self.settings["vat_rates"])
+        
+        # Price changes pushed to the catalog file are applied while the till runs
+        self.catalog_watcher = CatalogWatcher(self.settings["catalog_file"], self.catalog,
+                                              self.root.after, self.settings["catalog_poll_ms"])
+        self.catalog_watcher.on_change = self.refresh_catalog
+        if self.settings["catalog_poll_ms"] > 0:
+            self.root.after(self.settings["catalog_poll_ms"], self.catalog_watcher.poll)
         
         # Start the application
         self.start_application()
@@ -63,6 +91,12 @@ class SupermarketTill:
             # Show main application
             if not self.show_main_window():
                 break
+        
+        # Finish the receipts still being saved or printed, and make any
+        # batched receipt writes durable, before exiting
+        self.pipeline.close()
+        self.spooler.close(timeout=10)
+        self.receipt_store.close()
     
     def show_login(self):
         """Show login window and return True if login successful"""
@@ -105,9 +139,7 @@ class SupermarketTill:
             self.root.geometry(f"{window_width}x{window_height}+{x}+{y}")
             
             # Initialize variables
-            self.items = []
-            self.total = Decimal('0.00')
-            self.vat_rate = Decimal('0.20')  # 20% VAT
+            self.basket = Basket(self.taxes, self.promotions)
             
             # Create GUI elements
             self.create_widgets()
@@ -185,8 +217,8 @@ class SupermarketTill:
         ttk.Label(entry_frame, text="Category:").grid(row=0, column=6, padx=5)
         self.category_var = tk.StringVar()
         self.category_combo = ttk.Combobox(entry_frame, width=15, textvariable=self.category_var)
-        self.category_combo['values'] = ["All", "Fruits", "Vegetables"]
-        self.category_combo.set("All")
+        self.category_combo['values'] = [ALL_CATEGORIES] + self.catalog.categories
+        self.category_combo.set(ALL_CATEGORIES)
         self.category_combo.grid(row=0, column=5, padx=5)
         
         # Item selection combobox
@@ -211,11 +243,39 @@ class SupermarketTill:
         ttk.Button(entry_frame, text="Add", 
                   command=self.add_item, style='primary.TButton').grid(row=1, column=1, columnspan=2, padx=5, pady=5)
         
+        # Scanner input: barcode scanners type the code and press Enter
+        ttk.Label(entry_frame, text="Scan:").grid(row=2, column=4, padx=5)
+        self.scan_entry = ttk.Entry(entry_frame, width=30)
+        self.scan_entry.grid(row=2, column=3, padx=5, pady=5)
+        self.scan_buffer = ScanBuffer(self.catalog, self.add_lines, self.root.after,
+                                      flush_ms=self.settings["scan_flush_ms"])
+        
+        # Unknown codes are listed here instead of in a dialog, so scanning can go on
+        self.scan_errors = tk.Listbox(entry_frame, height=3, width=45)
+        self.scan_errors.grid(row=2, column=0, columnspan=3, padx=5, pady=5, sticky="ew")
+        ttk.Button(entry_frame, text="Clear Errors", command=self.clear_scan_errors,
+                  style='secondary.TButton').grid(row=2, column=5, columnspan=2, padx=5)
+        
+        def scan_code(*args):
+            code = self.scan_entry.get().strip()
+            self.scan_entry.delete(0, tk.END)
+            if code:
+                self.scan_buffer.push(code)
+        
+        def show_scan_error(error):
+            self.scan_errors.insert(0, f"{error.time}  {error.code}: {error.reason}")
+            self.scan_errors.delete(self.scan_buffer.errors.maxlen, tk.END)
+            self.root.bell()
+        
+        self.scan_entry.bind('<Return>', scan_code)
+        self.scan_buffer.on_error = show_scan_error
+        self.scan_entry.focus_set()
+        
         # Bind combobox selections to update functions
         def update_price(*args):
-            selected_item = self.item_var.get()
-            if selected_item in self.predefined_items:
-                self.price_var.set(f"£{self.predefined_items[selected_item]['price']:.2f}")
+            item = self.catalog.get(self.item_var.get())
+            if item:
+                self.price_var.set(f"£{item.price}")
             else:
                 self.price_var.set("")
         
@@ -224,8 +284,15 @@ class SupermarketTill:
             self.item_var.set("")
             self.price_var.set("")
         
+        def filter_items(event):
+            # Narrow the choices to names with a word starting with the typed text
+            if event.keysym not in ("Up", "Down", "Return", "Escape", "Tab"):
+                self.update_items_list()
+                update_price()
+
         self.category_combo.bind('<<ComboboxSelected>>', update_items_by_category)
         self.item_combo.bind('<<ComboboxSelected>>', update_price)
+        self.item_combo.bind('<KeyRelease>', filter_items)
         
         # Items List
         list_frame = ttk.LabelFrame(main_container, text="Items", padding="10")
@@ -260,6 +327,7 @@ class SupermarketTill:
         self.tree.column("price", width=120, anchor="e")
         self.tree.column("qty", width=100, anchor="e")
         self.tree.column("total", width=120, anchor="e")
+        self.tree.tag_configure("promotion", foreground="#2E7D32")
         
         self.tree.grid(row=0, column=0, sticky="nsew", padx=5)
         
@@ -275,27 +343,43 @@ class SupermarketTill:
                   command=self.remove_item, 
                   style='danger.TButton',
                   padding=(20, 5)).pack(side=tk.RIGHT, padx=5)
+        ttk.Button(button_frame, text="Set Qty", 
+                  command=self.set_item_qty, 
+                  style='secondary.TButton',
+                  padding=(20, 5)).pack(side=tk.RIGHT, padx=5)
         
         # Total and Checkout Frame
         total_frame = ttk.LabelFrame(main_container, text="Summary", padding="10")
         total_frame.grid(row=3, column=0, padx=5, pady=5, sticky="ew")
         
         # Summary labels with better styling
-        self.subtotal_label = ttk.Label(total_frame, text="Subtotal: 0.00 SAR", 
+        self.subtotal_label = ttk.Label(total_frame, text="Subtotal: £0.00", 
                                       font=("Arial", 10))
         self.subtotal_label.grid(row=0, column=2, padx=10)
         
-        self.vat_label = ttk.Label(total_frame, text="VAT (20%): 0.00 SAR", 
+        self.vat_label = ttk.Label(total_frame, text="VAT: £0.00", 
                                   font=("Arial", 10))
         self.vat_label.grid(row=0, column=1, padx=10)
         
-        self.total_label = ttk.Label(total_frame, text="Total: 0.00 SAR", 
+        self.total_label = ttk.Label(total_frame, text="Total: £0.00", 
                                    font=("Arial", 12, "bold"))
         self.total_label.grid(row=0, column=0, padx=10)
         
+        self.savings_label = ttk.Label(total_frame, text="Savings: £0.00", 
+                                     font=("Arial", 10))
+        self.savings_label.grid(row=0, column=3, padx=10)
+        
+        # Basket changes are drawn once per frame, however many scans a burst brings
+        self.display = BasketDisplay(self.basket, self.tree,
+                                     {"savings": self.savings_label, "subtotal": self.subtotal_label,
+                                      "vat": self.vat_label, "total": self.total_label},
+                                     idle=self.root.after_idle, schedule=self.root.after,
+                                     frame_ms=self.settings["ui_frame_ms"])
+        self.display.refresh()
+        
         # Action buttons
         button_frame = ttk.Frame(total_frame)
-        button_frame.grid(row=1, column=0, columnspan=3, pady=10)
+        button_frame.grid(row=1, column=0, columnspan=4, pady=10)
         
         ttk.Button(button_frame, text="Clear All", 
                   command=self.clear_all, style='secondary.TButton').grid(row=0, column=4, padx=5)
@@ -303,6 +387,15 @@ class SupermarketTill:
                   command=self.view_receipt_history, style='info.TButton').grid(row=0, column=2, padx=5)
         ttk.Button(button_frame, text="Complete Sale", 
                   command=self.checkout, style='success.TButton').grid(row=0, column=0, padx=5)
+        ttk.Button(button_frame, text="Last Receipt", 
+                  command=self.view_last_receipt, style='info.TButton').grid(row=0, column=1, padx=5)
+        ttk.Button(button_frame, text="Save PDF", 
+                  command=lambda: self.save_receipt_pdf(self.last_record),
+                  style='info.TButton').grid(row=0, column=3, padx=5)
+        
+        # Progress of the last sales' receipts, instead of dialogs that hold up the lane
+        self.status_label = ttk.Label(total_frame, text="", font=("Arial", 9))
+        self.status_label.grid(row=2, column=0, columnspan=4, sticky="w", padx=10)
         
         # Configure grid weights
         self.root.grid_columnconfigure(0, weight=1)
@@ -312,20 +405,58 @@ class SupermarketTill:
         list_frame.grid_columnconfigure(0, weight=1)
         
     def update_items_list(self):
-        """Update items list based on selected category"""
+        """Update items list based on selected category and typed text"""
+        self.item_combo['values'] = self.suggest_items(self.item_var.get())
+    
+    def suggest_items(self, text):
+        """Return names matching typed text, with fuzzy matches for misspellings
+        
+        Names with a word starting with the text come first; when there are
+        only a few, names that merely resemble it follow, best first.
+        """
         category = self.category_var.get()
-        if category == "All":
-            items = sorted(self.predefined_items.keys())
-        else:
-            items = sorted([item for item, details in self.predefined_items.items() 
-                          if details['category'] == category])
-        self.item_combo['values'] = items
+        names = self.catalog.search(text, category)
+        if len(names) < SUGGEST_BELOW and text.strip():
+            def in_category(name):
+                item = self.catalog.get(name)
+                return item is not None and item.category == category
+            accept = None if category == ALL_CATEGORIES else in_category
+            names = names + [name for name in self.fuzzy_index.suggest(text, accept=accept)
+                             if name not in names]
+        return names
     
+    def refresh_catalog(self, diff):
+        """Show a price book update in the pickers without touching the basket
+        
+        Basket lines keep the price they were added at; only items added
+        from now on use the new prices.
+        """
+        self.fuzzy_index.apply(diff)
+        if not hasattr(self, 'item_combo') or not self.item_combo.winfo_exists():
+            return
+        self.category_combo['values'] = [ALL_CATEGORIES] + self.catalog.categories
+        self.update_items_list()
+        item = self.catalog.get(self.item_var.get())
+        self.price_var.set(f"£{item.price}" if item else "")
+        
     def add_item(self):
         name = self.item_var.get().strip()
         qty_str = self.item_qty.get().strip()
         
-        if not name or name not in self.predefined_items:
+        item = self.catalog.get(name)
+        if name and item is None:
+            # Accept typed text that starts a word of exactly one item; otherwise,
+            # misspellings included, offer the matches for the cashier to pick
+            matches = self.catalog.search(name, self.category_var.get(), limit=2)
+            if len(matches) == 1:
+                item = self.catalog.get(matches[0])
+            else:
+                suggestions = self.suggest_items(name)
+                if suggestions:
+                    self.item_combo['values'] = suggestions
+                    messagebox.showinfo("Did you mean", "\n".join(suggestions[:5]))
+                    return
+        if not name or item is None:
             messagebox.showerror("Error", "Please select an item from the list")
             return
             
@@ -335,217 +466,139 @@ class SupermarketTill:
                 messagebox.showerror("Error", "Quantity must be at least 1")
                 return
                 
-            price = Decimal(str(self.predefined_items[name]['price']))
-            item_total = price * qty
-            
-            self.items.append((name, price, qty, item_total))
-            self.update_totals()
-            
-            # Update display
-            self.tree.insert("", "end", values=(name, f"£{price:.2f}", qty, f"£{item_total:.2f}"))
+            self.add_lines([(item, qty)])
             
             # Clear selection
             self.item_var.set('')
             self.price_var.set('')
-            self.item_qty.delete(0, tk.END)
-            self.item_qty.insert(0, "1")
+            if self.item_qty.get() != "1":
+                self.item_qty.delete(0, tk.END)
+                self.item_qty.insert(0, "1")
             
         except ValueError:
             messagebox.showerror("Error", "Please enter a valid quantity (whole number)")
             return
         
+    def add_lines(self, lines):
+        """Add (catalog item, qty) lines to the basket; the screen catches up next frame"""
+        for line in self.basket.add_lines(lines):
+            self.display.show(line)
+        self.display.refresh(self.scan_buffer.pushed_at)
+        
+    def clear_scan_errors(self):
+        self.scan_buffer.clear_errors()
+        self.scan_errors.delete(0, tk.END)
+        
     def remove_item(self):
         selected_item = self.tree.selection()
         if not selected_item:
             messagebox.showinfo("Info", "Please select an item to remove")
             return
             
-        self.tree.delete(selected_item)
-        self.items.pop(self.tree.index(selected_item))
-        self.update_totals()
-        
-    def update_totals(self):
-        self.total = sum(item[3] for item in self.items)
-        vat = self.total * self.vat_rate
-        subtotal = self.total - vat
+        # Rows are identified by their basket line's key; promotion rows go with their items
+        keys = [key for key in selected_item if self.basket.get(key)]
+        self.basket.remove(keys)
+        self.display.remove(keys)
+        self.display.refresh()
         
-        self.subtotal_label.config(text=f"Subtotal: £{subtotal:.2f}")
-        self.vat_label.config(text=f"VAT (20%): £{vat:.2f}")
-        self.total_label.config(text=f"Total: £{self.total:.2f}")
+    def set_item_qty(self):
+        """Set the quantity of the selected lines to the Qty box"""
+        selected_item = self.tree.selection()
+        if not selected_item:
+            messagebox.showinfo("Info", "Please select an item to change")
+            return
+        try:
+            qty = int(self.item_qty.get().strip())
+            for key in selected_item:
+                if self.basket.get(key):
+                    self.display.show(self.basket.set_qty(key, qty))
+        except ValueError:
+            messagebox.showerror("Error", "Please enter a quantity of at least 1")
+            return
+        finally:
+            self.display.refresh()
         
     def clear_all(self):
-        self.tree.delete(*self.tree.get_children())
-        self.items = []
-        self.update_totals()
-        
-    def generate_receipt(self):
-        """Generate receipt text"""
-        receipt = []
-        receipt.append("=" * 40)
-        receipt.append("Supermarket Till Receipt")
-        receipt.append("=" * 40)
-        receipt.append(f"Date: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-        
-        # Add employee info
+        self.display.clear()
+        self.basket.clear()
+        self.display.refresh()
+        
+    def get_employee_name(self):
+        """Return the full name of the logged in cashier"""
         try:
             profile = self.user_manager.get_user_profile(self.current_user)
-            employee_name = profile['full_name'] if profile else self.current_user
+            return profile['full_name'] if profile else self.current_user
         except:
-            employee_name = self.current_user
-        receipt.append(f"Employee: {employee_name}")
-        receipt.append("-" * 40)
-        
-        # Add items
-        receipt.append("Items:")
-        receipt.append("-" * 40)
-        for name, price, qty, total in self.items:
-            receipt.append(f"{name:<30} {qty:>3} x £{price:>6.2f} = £{total:>7.2f}")
-        
-        receipt.append("-" * 40)
-        
-        # Add totals
-        vat = self.total * self.vat_rate
-        subtotal = self.total - vat
-        receipt.append(f"{'Subtotal:':<20} £{subtotal:>7.2f}")
-        receipt.append(f"{'VAT (20%):':<20} £{vat:>7.2f}")
-        receipt.append(f"{'Total:':<20} £{self.total:>7.2f}")  # Store total in a consistent format
-        
-        receipt.append("=" * 40)
-        receipt.append("Thank you for shopping with us!")
-        receipt.append("=" * 40)
-        
-        return "\n".join(receipt)
-        
-    def save_receipt_pdf(self):
-        if not self.items:
-            messagebox.showinfo("Warning", "No items to save")
+            return self.current_user
+        
+    def save_receipt_pdf(self, record):
+        """Save a completed sale's receipt as a PDF where the cashier chooses
+        
+        The PDF is built in the background; the status line says when it is saved.
+        """
+        if record is None:
+            self.set_status("No sale completed yet")
             return
-            
-        try:
-            filename = filedialog.asksaveasfilename(
-                defaultextension=".pdf",
-                filetypes=[(f"PDF Files (*.pdf)", "*.pdf")],
-                title="Save Receipt"
-            )
-            
-            if not filename:
-                return
-                
-            # Create PDF
-            pdf = FPDF()
-            pdf.add_page()
-            
-            # Add font
-            pdf.add_font('Arial', '', 'arial.ttf', uni=True)
-            
-            # Set page margins
-            pdf.set_margins(10, 10, 10)
-            
-            # Store name - Large font with better spacing
-            pdf.set_font('Arial', size=24)
-            pdf.ln(10)  # Add space at top
-            pdf.cell(0, 15, txt="Supermarket Receipt", ln=True, align='C')
-            
-            # Receipt type - Medium font with better spacing
-            pdf.set_font('Arial', size=18)
-            pdf.cell(0, 15, txt="Simple VAT Receipt", ln=True, align='C')
-            pdf.ln(5)  # Add space after header
-            
-            # Add receipt content
-            pdf.set_font('Arial', size=12)
-            
-            # Date and Time
-            now = datetime.now()
-            pdf.cell(0, 8, txt=f"Date: {now.strftime('%Y-%m-%d')}", ln=True)
-            pdf.cell(0, 8, txt=f"Time: {now.strftime('%H:%M:%S')}", ln=True)
-            
-            # Cashier information
-            cashier_profile = self.user_manager.get_user_profile(self.current_user)
-            pdf.ln(5)
-            pdf.cell(0, 8, txt="Cashier Information", ln=True)
-            pdf.cell(0, 8, txt=f"Employee: {cashier_profile['full_name']}", ln=True)
-            pdf.cell(0, 8, txt=f"Employee ID: {self.current_user}", ln=True)
-            pdf.ln(5)
-            
-            # Table settings
-            col_widths = [90, 30, 30, 40]  # Item, Price, Qty, Total
-            row_height = 8
-            
-            # Draw table header
-            pdf.set_fill_color(240, 240, 240)  # Light gray background
-            pdf.cell(col_widths[0], row_height, "Item", border=1, fill=True)
-            pdf.cell(col_widths[1], row_height, "Price", border=1, fill=True)
-            pdf.cell(col_widths[2], row_height, "Qty", border=1, fill=True)
-            pdf.cell(col_widths[3], row_height, "Total", border=1, fill=True)
-            pdf.ln()
-            
-            # Draw items
-            for name, price, qty, total in self.items:
-                pdf.cell(col_widths[0], row_height, name[:35], border=1)
-                pdf.cell(col_widths[1], row_height, f"£{price:.2f}", border=1)
-                pdf.cell(col_widths[2], row_height, str(qty), border=1)
-                pdf.cell(col_widths[3], row_height, f"£{total:.2f}", border=1)
-                pdf.ln()
-            
-            # Add totals with table format
-            pdf.ln(5)
-            subtotal = self.total / (1 + self.vat_rate)
-            vat = self.total - subtotal
-            
-            # Summary table
-            summary_width = 140
-            amount_width = 50
-            row_height = 10
-            
-            # Table header
-            pdf.set_fill_color(240, 240, 240)  # Light gray background
-            pdf.cell(summary_width, row_height, "Summary", border=1, fill=True)
-            pdf.cell(amount_width, row_height, "Amount", border=1, fill=True)
-            pdf.ln()
-            
-            # Subtotal and VAT rows
-            pdf.cell(summary_width, row_height, "Subtotal", border=1)
-            pdf.cell(amount_width, row_height, f"£{subtotal:.2f}", border=1)
-            pdf.ln()
-            
-            pdf.cell(summary_width, row_height, "VAT (20%)", border=1)
-            pdf.cell(amount_width, row_height, f"£{vat:.2f}", border=1)
-            pdf.ln()
-            
-            # Total row with color
-            pdf.set_fill_color(230, 230, 250)  # Light purple background
-            pdf.set_font('Arial', size=12, style='B')  # Bold font for total
-            pdf.cell(summary_width, row_height, "Total", border=1, fill=True)
-            pdf.cell(amount_width, row_height, f"£{self.total:.2f}", border=1, fill=True)
-            pdf.ln()
-            
-            # Add footer
-            pdf.ln(10)
-            pdf.set_font('Arial', size=12)
-            pdf.cell(0, 8, "Thank you for shopping with us", ln=True, align='C')
-            pdf.cell(0, 8, "We hope you have a great day", ln=True, align='C')
-            
-            # Save the PDF
-            pdf.output(filename, 'F')
-            messagebox.showinfo("Success", "Receipt saved successfully!")
-            
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to save receipt: {str(e)}")
+        filename = filedialog.asksaveasfilename(
+            defaultextension=".pdf",
+            filetypes=[(f"PDF Files (*.pdf)", "*.pdf")],
+            title="Save Receipt"
+        )
+        if not filename:
+            return
+        employee_id = self.current_user
+        self.pipeline.submit(record, [
+            ("pdf", lambda record: render_receipt_pdf(record, filename, employee_id=employee_id))])
+        
+    def view_last_receipt(self):
+        """Show the receipt of the sale just completed"""
+        if self.last_record is None:
+            self.set_status("No sale completed yet")
+            return
+        self.show_receipt_viewer(self.last_record)
         
-    def save_receipt_to_history(self, receipt_text):
-        """Save receipt to history with timestamp"""
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"receipt_{timestamp}.txt"
-        filepath = os.path.join(self.receipts_dir, filename)
+    def set_status(self, text, error=False):
+        """Show a line of progress under the summary, in red for a failure"""
+        if not hasattr(self, 'status_label') or not self.status_label.winfo_exists():
+            print(text)
+            return
+        self.status_label.config(text=text, foreground="#C62828" if error else "")
+        
+    def show_stage_result(self, result):
+        """Report a receipt stage finished in the background (see CheckoutPipeline)"""
+        if result.error:
+            self.set_status(f"Receipt {result.receipt_id}: {result.stage} failed: {result.error}",
+                            error=True)
+            self.root.bell()
+        elif result.stage == "pdf":
+            self.set_status(f"Receipt {result.receipt_id} saved as a PDF")
+        
+    def show_print_result(self, result):
+        """Report a print job finished by the spooler"""
+        if result.error:
+            self.set_status(f"Receipt {result.receipt_id} did not print after {result.attempts} "
+                            f"attempts: {result.error}", error=True)
+            self.root.bell()
+        else:
+            self.set_status(f"Receipt {result.receipt_id} printed")
+        
+    def sale_stages(self):
+        """The background stages that follow every sale, from the settings"""
+        # A receipt only leaves the till once its sale is on disk
+        stages = [("save", lambda record: self.receipt_store.flush())]
+        pdf_dir = self.settings["receipt_pdf_dir"]
+        if pdf_dir:
+            def save_pdf(record):
+                os.makedirs(pdf_dir, exist_ok=True)
+                render_receipt_pdf(record, os.path.join(pdf_dir, f"{record['id']}.pdf"))
+            stages.append(("pdf", save_pdf))
+        if self.settings["print_receipts"]:
+            def spool(record):
+                if self.spooler.submit(record) is None:
+                    raise RuntimeError("print queue is full")
+            stages.append(("print", spool))
+        return stages
         
-        try:
-            with open(filepath, 'w', encoding='utf-8') as f:
-                f.write(receipt_text)
-        except Exception as e:
-            print(f"Error saving receipt: {e}")
-            messagebox.showerror("Error", 
-                               "Failed to save receipt to history")
-
     def view_receipt_history(self):
         """Show receipt history window"""
         history_window = tk.Toplevel(self.root)
@@ -559,34 +612,41 @@ class SupermarketTill:
         main_frame = ttk.Frame(history_window)
         main_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
 
+        # Search bar, e.g. "Mango cashier:admin total>20 date:2025-01"
+        search_frame = ttk.Frame(main_frame)
+        search_frame.pack(fill=tk.X, pady=(0, 10))
+        search_var = tk.StringVar()
+        search_entry = ttk.Entry(search_frame, textvariable=search_var)
+        search_entry.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(0, 5))
+        result_label = ttk.Label(search_frame, text="", width=18)
+
         # Tree frame with fixed height
         tree_frame = ttk.Frame(main_frame)
         tree_frame.pack(fill=tk.BOTH, expand=True, pady=(0, 10))
 
-        # Create and configure the tree
-        tree = ttk.Treeview(tree_frame, 
-                           columns=("date", "time", "cashier", "total"), 
-                           show="headings",
-                           height=15)  # Fixed height
+        # Only the visible rows are fetched from the receipt store
+        history = VirtualReceiptList(tree_frame, self.receipt_store)
 
-        # Configure columns
-        tree.heading("date", text="Date", anchor="center")
-        tree.heading("time", text="Time", anchor="center")
-        tree.heading("cashier", text="Cashier", anchor="center")
-        tree.heading("total", text="Total", anchor="center")
-
-        tree.column("date", width=150, anchor="center")
-        tree.column("time", width=150, anchor="center")
-        tree.column("cashier", width=250, anchor="center")
-        tree.column("total", width=150, anchor="center")
+        def run_search(*args):
+            query = search_var.get().strip()
+            if not query:
+                clear_search()
+                return
+            matches = self.search_index.search(query)
+            history.set_source(SearchResults(matches, self.search_index))
+            result_label.config(text=f"{len(matches)} found")
 
-        # Add scrollbar
-        scrollbar = ttk.Scrollbar(tree_frame, orient="vertical", command=tree.yview)
-        tree.configure(yscrollcommand=scrollbar.set)
+        def clear_search(*args):
+            search_var.set("")
+            history.set_source(self.receipt_store)
+            result_label.config(text="")
 
-        # Pack tree and scrollbar
-        tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        ttk.Button(search_frame, text="Clear", style='secondary.TButton',
+                  command=clear_search, width=10).pack(side=tk.RIGHT, padx=5)
+        ttk.Button(search_frame, text="Search", style='primary.TButton',
+                  command=run_search, width=10).pack(side=tk.RIGHT, padx=5)
+        result_label.pack(side=tk.RIGHT, padx=5)
+        search_entry.bind('<Return>', run_search)
 
         # Button frame at the bottom
         btn_frame = ttk.Frame(main_frame)
@@ -597,95 +657,40 @@ class SupermarketTill:
                   command=lambda: self.close_history_window(history_window),
                   width=15).pack(side=tk.LEFT, padx=5)
         ttk.Button(btn_frame, text="Delete", style='danger.TButton',
-                  command=lambda: self.delete_receipt(tree),
+                  command=lambda: self.delete_receipt(history),
                   width=15).pack(side=tk.LEFT, padx=5)
         ttk.Button(btn_frame, text="Print", style='info.TButton',
-                  command=lambda: self.print_receipt(tree),
+                  command=lambda: self.print_receipt(history),
                   width=15).pack(side=tk.LEFT, padx=5)
         ttk.Button(btn_frame, text="View", style='info.TButton',
-                  command=lambda: self.view_selected_receipt(tree),
+                  command=lambda: self.view_selected_receipt(history),
                   width=15).pack(side=tk.LEFT, padx=5)
 
-        # Load receipts
-        self.load_receipts(tree)
-
         # Release grab when window is closed
         history_window.bind("<Destroy>", lambda e: history_window.grab_release())
 
-    def load_receipts(self, tree):
-        """Load receipts into treeview"""
-        for item in tree.get_children():
-            tree.delete(item)
-        
-        row_count = 0  # Counter for alternating row colors
-        for filename in sorted(os.listdir(self.receipts_dir), reverse=True):
-            if filename.startswith("receipt_") and filename.endswith(".txt"):
-                try:
-                    filepath = os.path.join(self.receipts_dir, filename)
-                    with open(filepath, 'r', encoding='utf-8') as f:
-                        content = f.read()
-                    
-                    # Extract date and time from filename
-                    date_str = filename[8:16]  # YYYYMMDD
-                    time_str = filename[17:23]  # HHMMSS
-                    
-                    # Format date and time
-                    date = f"{date_str[:4]}-{date_str[4:6]}-{date_str[6:]}"
-                    time = f"{time_str[:2]}:{time_str[2:4]}:{time_str[4:]}"
-                    
-                    # Extract receipt details
-                    cashier = "Unknown"
-                    total = 0.00
-                    
-                    for line in content.split('\n'):
-                        line = line.strip()
-                        if not line:
-                            continue
-                            
-                        if "Employee: " in line:
-                            cashier = line.split("Employee: ")[1].strip()
-                        elif "Total:" in line:
-                            try:
-                                total_str = line.split("£")[-1].strip()
-                                total = float(total_str)
-                            except:
-                                pass
-                    
-                    # Insert with alternating row colors
-                    tag = 'evenrow' if row_count % 2 == 0 else 'oddrow'
-                    tree.insert("", 0, values=(date, time, cashier, f"£{total:.2f}"), tags=(tag,))
-                    row_count += 1
-                    
-                except Exception as e:
-                    print(f"Error loading receipt {filename}: {e}")
-
     def close_history_window(self, window):
         """Close history window and release grab"""
         window.grab_release()
         window.destroy()
         
-    def view_selected_receipt(self, tree):
+    def view_selected_receipt(self, history):
         """View selected receipt"""
-        selected = tree.selection()
-        if not selected:
+        receipt_id = history.selected_id()
+        if not receipt_id:
             messagebox.showinfo("Warning", "Please select a receipt to view")
             return
         
-        item = tree.item(selected[0])
-        date = item['values'][0].replace('-', '')
-        time = item['values'][1].replace(':', '')
-        filename = f"receipt_{date}_{time}.txt"
-        filepath = os.path.join(self.receipts_dir, filename)
-        
         try:
-            with open(filepath, 'r', encoding='utf-8') as f:
-                content = f.read()
-            self.show_receipt_viewer(content)
+            record = self.receipt_store.get_record(receipt_id)
+            if record is None:
+                raise FileNotFoundError("Receipt not found")
+            self.show_receipt_viewer(record)
         except Exception as e:
             messagebox.showerror("Error", f"Failed to view receipt: {str(e)}")
 
-    def show_receipt_viewer(self, content):
-        """Show receipt content in a viewer window"""
+    def show_receipt_viewer(self, record):
+        """Show a receipt record in a viewer window"""
         viewer = tk.Toplevel(self.root)
         viewer.title("Receipt Viewer")
         
@@ -731,7 +736,7 @@ class SupermarketTill:
         scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
         
         # Insert content
-        text_widget.insert('1.0', content)
+        text_widget.insert('1.0', render_receipt_text(record))
         text_widget.configure(state='disabled')  # Make read-only
         
         # Button frame with improved styling
@@ -743,7 +748,7 @@ class SupermarketTill:
         
         # Print button
         ttk.Button(button_frame, text="Print", style='info.TButton',
-                  command=lambda: self.print_receipt_content(content),
+                  command=lambda: self.print_receipt_record(record),
                   **button_style).pack(side=tk.LEFT, padx=10)
         
         # Close button
@@ -754,199 +759,72 @@ class SupermarketTill:
         # Release grab when window is closed
         viewer.bind("<Destroy>", lambda e: viewer.grab_release())
 
-    def print_receipt(self, tree):
+    def print_receipt(self, history):
         """Print selected receipt"""
-        selected = tree.selection()
-        if not selected:
+        receipt_id = history.selected_id()
+        if not receipt_id:
             messagebox.showinfo("Warning", 
                               "Please select a receipt")
             return
         
-        item = tree.item(selected[0])
-        date = item['values'][0].replace('-', '')
-        time = item['values'][1].replace(':', '')
-        filename = f"receipt_{date}_{time}.txt"
-        filepath = os.path.join(self.receipts_dir, filename)
-        
         try:
-            with open(filepath, 'r', encoding='utf-8') as f:
-                content = f.read()
-            self.print_receipt_content(content)
+            record = self.receipt_store.get_record(receipt_id)
+            if record is None:
+                raise FileNotFoundError("Receipt not found")
+            self.print_receipt_record(record)
         except Exception as e:
             messagebox.showerror("Error", 
                                f"Failed to print receipt: {str(e)}")
 
-    def print_receipt_content(self, content):
-        """Print receipt content with improved table formatting"""
-        try:
-            # Create a temporary PDF
-            temp_pdf = os.path.join(self.receipts_dir, "temp_print.pdf")
-            
-            # Create PDF
-            pdf = FPDF()
-            pdf.add_page()
-            pdf.add_font('Arial', '', 'arial.ttf', uni=True)
-            
-            # Set margins
-            pdf.set_margins(10, 10, 10)
-            
-            # Header
-            pdf.set_font('Arial', size=16)
-            pdf.cell(0, 10, "Supermarket Receipt", ln=True, align='C')
-            pdf.ln(5)
-            
-            # Parse content sections
-            header_info = []
-            items = []
-            summary = []
-            
-            section = "header"
-            for line in content.split('\n'):
-                if "Items:" in line:
-                    section = "items"
-                    continue
-                elif "Subtotal:" in line:
-                    section = "summary"
-                
-                if section == "header" and line.strip() and not line.startswith("="):
-                    header_info.append(line)
-                elif section == "items" and line.strip() and not line.startswith("-"):
-                    if "x" in line:  # Only process item lines
-                        items.append(line)
-                elif section == "summary" and line.strip() and not line.startswith("="):
-                    if any(x in line for x in ["Subtotal:", "VAT", "Total:"]):
-                        summary.append(line)
-            
-            # Print header information
-            pdf.set_font('Arial', size=10)
-            for line in header_info:
-                pdf.cell(0, 6, line, ln=True)
-            pdf.ln(5)
-            
-            # Items table
-            pdf.set_font('Arial', size=10)
-            
-            # Table header
-            col_widths = [90, 30, 30, 40]  # Item, Price, Qty, Total
-            row_height = 8
-            
-            # Header style
-            pdf.set_fill_color(240, 240, 240)
-            pdf.cell(col_widths[0], row_height, "Item", border=1, fill=True)
-            pdf.cell(col_widths[1], row_height, "Price", border=1, fill=True)
-            pdf.cell(col_widths[2], row_height, "Qty", border=1, fill=True)
-            pdf.cell(col_widths[3], row_height, "Total", border=1, fill=True)
-            pdf.ln()
-            
-            # Items
-            for item in items:
-                parts = item.split('x')
-                if len(parts) == 2:
-                    name = parts[0].strip()
-                    qty_price = parts[1].strip()
-                    
-                    # Extract price and total
-                    try:
-                        price = qty_price.split('=')[0].strip().replace('£', '')
-                        total = qty_price.split('=')[1].strip().replace('£', '')
-                        qty = qty_price.split('£')[0].strip()
-                        
-                        # Print row
-                        pdf.cell(col_widths[0], row_height, name[:35], border=1)
-                        pdf.cell(col_widths[1], row_height, f"£{price}", border=1)
-                        pdf.cell(col_widths[2], row_height, qty, border=1)
-                        pdf.cell(col_widths[3], row_height, f"£{total}", border=1)
-                        pdf.ln()
-                    except:
-                        continue
-            
-            # Summary section
-            pdf.ln(5)
-            summary_width = 140
-            amount_width = 50
-            
-            # Summary header
-            pdf.set_fill_color(240, 240, 240)
-            pdf.cell(summary_width, row_height, "Summary", border=1, fill=True)
-            pdf.cell(amount_width, row_height, "Amount", border=1, fill=True)
-            pdf.ln()
-            
-            # Summary items
-            for line in summary:
-                if ":" in line:
-                    label, amount = line.split(":", 1)
-                    pdf.cell(summary_width, row_height, label.strip(), border=1)
-                    pdf.cell(amount_width, row_height, amount.strip(), border=1)
-                    pdf.ln()
-            
-            # Footer
-            pdf.ln(10)
-            pdf.cell(0, 8, "Thank you for shopping with us!", ln=True, align='C')
-            
-            # Save PDF
-            pdf.output(temp_pdf)
-            
-            # Print the PDF
-            os.startfile(temp_pdf, 'print')
-            
-            # Wait a bit before deleting the temporary file
-            self.root.after(5000, lambda: os.remove(temp_pdf) if os.path.exists(temp_pdf) else None)
-            
-            messagebox.showinfo("Success", "Receipt sent for printing")
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to print receipt: {str(e)}")
-            # Clean up temp file in case of error
-            if os.path.exists(temp_pdf):
-                try:
-                    os.remove(temp_pdf)
-                except:
-                    pass
+    def print_receipt_record(self, record):
+        """Queue a receipt for printing; the status line reports the outcome"""
+        if self.spooler.submit(record) is None:
+            self.set_status(f"Print queue is full ({self.spooler.depth} waiting); "
+                            f"receipt {record['id']} was not printed", error=True)
+            return
+        self.set_status(f"Printing receipt {record['id']} ({self.spooler.depth} in the queue)")
 
     def checkout(self):
-        if not self.items:
+        if not self.basket:
             messagebox.showinfo("Warning", 
                               "No items to complete sale")
             return
             
-        receipt = self.generate_receipt()
-        
-        # Save receipt to history
-        self.save_receipt_to_history(receipt)
-        
-        # Show receipt
-        messagebox.showinfo("Receipt", receipt)
-        
-        # Ask if user wants to save receipt as PDF
-        if messagebox.askyesno("Save Receipt", 
-                             "Do you want to save the receipt as a PDF?"):
-            self.save_receipt_pdf()
-        
-        # Ask if user wants to print receipt
-        if messagebox.askyesno("Print Receipt", 
-                             "Do you want to print the receipt?"):
-            self.print_receipt_content(receipt)
+        # Number the sale and save it to history
+        try:
+            record = self.checkout_core.complete(self.basket, self.get_employee_name(),
+                                                 cashier_id=self.current_user)
+        except Exception as e:
+            print(f"Error saving receipt: {e}")
+            messagebox.showerror("Error", 
+                               "Failed to save receipt to history")
+            return
         
+        # The lane is free for the next customer; the receipt follows in the background
         self.clear_all()
+        self.last_record = record
+        self.pipeline.submit(record, self.sale_stages())
+        self.set_status(f"Sale {record['id']} complete: £{format_pence(record['total_pence'])}"
+                        f" - \"Last Receipt\" to show it, \"Save PDF\" to keep a copy")
 
-    def delete_receipt(self, tree):
+    def delete_receipt(self, history):
         """Delete selected receipt"""
-        selected = tree.selection()
-        if not selected:
+        receipt_id = history.selected_id()
+        if not receipt_id:
             messagebox.showinfo("Warning", "Please select a receipt to delete")
             return
         
         if not messagebox.askyesno("Confirm Delete", "Are you sure you want to delete this receipt?"):
             return
             
-        item = tree.item(selected[0])
-        date = item['values'][0].replace('-', '')
-        time = item['values'][1].replace(':', '')
-        filename = f"receipt_{date}_{time}.txt"
-        filepath = os.path.join(self.receipts_dir, filename)
         
         try:
-            os.remove(filepath)
-            tree.delete(selected[0])
+            if not self.receipt_store.delete(receipt_id):
+                raise FileNotFoundError("Receipt not found")
+            self.search_index.remove(receipt_id)
+            if isinstance(history.source, SearchResults):
+                history.source.discard(receipt_id)
+            history.refresh()
             messagebox.showinfo("Success", "Receipt deleted successfully")
         except Exception as e:
             messagebox.showerror("Error", f"Failed to delete receipt: {str(e)}")
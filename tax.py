@@ -0,0 +1,72 @@
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from money import vat_pence_from_ratio
+
+# The VAT rate of each tax class, by the code in the price book's optional
+# tax_class column; items without one (or with an unknown code) are
+# standard rated. Overridden by the vat_rates setting.
+STANDARD = "S"
+DEFAULT_RATES: Dict[str, str] = {"S": "0.20", "R": "0.05", "Z": "0"}
+
+
+def rate_label(rate: Decimal) -> str:
+    """Format a rate as a percentage, e.g. 0.20 -> '20%', 0.175 -> '17.5%'"""
+    return f"{(rate * 100).normalize():f}%"
+
+
+def vat_heading(rates: Iterable[Decimal]) -> str:
+    """Label a VAT amount with the rates it covers, e.g. 'VAT (0%, 20%)'"""
+    labels = [rate_label(rate) for rate in sorted(set(rates))]
+    return f"VAT ({', '.join(labels)})" if labels else "VAT"
+
+
+class TaxTable:
+    """The VAT rate of every tax class, ready for integer VAT.
+
+    Each rate's exact (numerator, denominator) is worked out once here,
+    so taking VAT out of a basket's total for one class is a couple of
+    integer operations (see ``money.vat_pence_of``).
+    """
+
+    def __init__(self, rates: Optional[Dict[str, Any]] = None, standard: str = STANDARD):
+        rates = DEFAULT_RATES if rates is None else rates
+        self.rates: Dict[str, Decimal] = {code: Decimal(str(rate)) for code, rate in rates.items()}
+        if standard not in self.rates:
+            raise ValueError(f"No rate for the standard tax class {standard!r}")
+        self.standard = standard
+        # Each distinct rate once, lowest first, with its exact ratio, and
+        # the position in that list of every class's rate
+        self.rates_in_order = sorted(set(self.rates.values()))
+        self._ratios = [rate.as_integer_ratio() for rate in self.rates_in_order]
+        self._index = {code: self.rates_in_order.index(rate) for code, rate in self.rates.items()}
+
+    def tax_class(self, code: str) -> str:
+        """Return the class an item's tax class code is charged at"""
+        return code if code in self.rates else self.standard
+
+    def rate(self, code: str) -> Decimal:
+        return self.rates[self.tax_class(code)]
+
+    def rate_index(self, code: str) -> int:
+        """Return the position of a class's rate in ``rates_in_order``"""
+        return self._index[self.tax_class(code)]
+
+    def vat_at(self, index: int, gross_pence: int) -> int:
+        """Return the VAT included in ``gross_pence`` at the rate ``rate_index`` gave"""
+        return vat_pence_from_ratio(gross_pence, self._ratios[index])
+
+    def analysis(self, gross_by_class: Dict[str, int]) -> List[Tuple[Decimal, int, int]]:
+        """Return (rate, net, VAT) pence per rate for gross amounts by class, lowest rate first
+
+        Classes sharing a rate are added together before VAT is taken out.
+        """
+        by_index: Dict[int, int] = {}
+        for code, gross in gross_by_class.items():
+            index = self.rate_index(code)
+            by_index[index] = by_index.get(index, 0) + gross
+        rows = []
+        for index in sorted(by_index):
+            vat = self.vat_at(index, by_index[index])
+            rows.append((self.rates_in_order[index], by_index[index] - vat, vat))
+        return rows
@@ -0,0 +1,193 @@
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Iterable, List, Optional, Set, Tuple
+
+from basket import Basket, BasketLine
+from tax import vat_heading
+
+
+class UpdateScheduler:
+    """Coalesces basket changes and draws them at most once per frame.
+
+    The till reports changes as they happen: ``show`` for a line added or
+    re-counted, ``remove`` for a line taken out, ``refresh`` once the
+    totals may have moved. These only note what is out of date. The first
+    change after a draw schedules ``flush`` through ``idle(callback)`` (for
+    example ``root.after_idle``), or through ``schedule(delay_ms, callback)``
+    (``root.after``) for the rest of the frame when the last draw was less
+    than ``frame_ms`` ago, so a burst of changes is drawn once however many
+    lines it touches. With neither given, ``flush`` is left to the caller.
+
+    A flush calls ``delete_rows(keys)`` once with every row to remove,
+    ``draw_rows(lines)`` once with the latest state of every changed line
+    and ``new`` (the keys not drawn before), then ``summary()`` for the
+    values the summary shows by name, calling ``draw_summary(name, value)``
+    only for the values that differ from the last ones drawn.
+
+    ``flushes``, ``rows_drawn``, ``summary_drawn`` and ``summary_skipped``
+    count the work done; ``latencies`` keeps the milliseconds from each
+    input (passed as a ``clock`` time to ``refresh``) to the flush that
+    showed it, for the most recent ``max_latencies`` inputs.
+    """
+
+    def __init__(self, draw_rows: Callable[[List[BasketLine], Set[str]], None],
+                 delete_rows: Callable[[List[str]], None],
+                 summary: Callable[[], Dict[str, Any]],
+                 draw_summary: Callable[[str, Any], None],
+                 idle: Optional[Callable[[Callable[[], None]], object]] = None,
+                 schedule: Optional[Callable[[int, Callable[[], None]], object]] = None,
+                 frame_ms: int = 16, clock: Callable[[], float] = time.perf_counter,
+                 max_latencies: int = 1000):
+        self.draw_rows = draw_rows
+        self.delete_rows = delete_rows
+        self.summary = summary
+        self.draw_summary = draw_summary
+        self.idle = idle
+        self.schedule = schedule
+        self.frame_ms = frame_ms
+        self.clock = clock
+        self.flushes = 0
+        self.rows_drawn = 0
+        self.summary_drawn = 0
+        self.summary_skipped = 0
+        self.latencies: Deque[float] = deque(maxlen=max_latencies)
+        self._drawn: Set[str] = set()
+        self._shown: Dict[str, BasketLine] = {}
+        self._removed: Dict[str, None] = {}
+        self._dirty = False
+        self._inputs: List[float] = []
+        self._summary: Dict[str, Any] = {}
+        self._scheduled = False
+        self._last_flush: Optional[float] = None
+
+    def show(self, line: BasketLine):
+        """Note a line to draw: a new row, or new values for its row"""
+        self._removed.pop(line.key, None)
+        self._shown[line.key] = line
+        self._changed()
+
+    def remove(self, keys: Iterable[str]):
+        """Note rows to delete; rows never drawn are just forgotten"""
+        for key in keys:
+            self._shown.pop(key, None)
+            if key in self._drawn:
+                self._removed[key] = None
+        self._changed()
+
+    def clear(self):
+        """Note that every row goes, e.g. when the basket is cleared"""
+        self._shown = {}
+        self._removed = dict.fromkeys(self._drawn)
+        self._changed()
+
+    def refresh(self, inputs: Iterable[float] = ()):
+        """Note that the summary may have changed, for ``inputs`` made at these clock times"""
+        self._inputs.extend(inputs)
+        self._changed()
+
+    def _changed(self):
+        self._dirty = True
+        if self._scheduled:
+            return
+        if self.idle is None and self.schedule is None:
+            return
+        self._scheduled = True
+        wait = 0.0
+        if self._last_flush is not None:
+            wait = self.frame_ms - (self.clock() - self._last_flush) * 1000
+        if wait > 0 and self.schedule is not None:
+            self.schedule(int(wait + 0.999), self.flush)
+        elif self.idle is not None:
+            self.idle(self.flush)
+        else:
+            self.schedule(0, self.flush)
+
+    def flush(self):
+        """Draw everything changed since the last flush"""
+        self._scheduled = False
+        if not self._dirty:
+            return
+        self._dirty = False
+        removed, self._removed = list(self._removed), {}
+        shown, self._shown = list(self._shown.values()), {}
+        if removed:
+            self.delete_rows(removed)
+            self._drawn.difference_update(removed)
+        if shown:
+            new = {line.key for line in shown if line.key not in self._drawn}
+            self.draw_rows(shown, new)
+            self._drawn.update(new)
+            self.rows_drawn += len(shown)
+
+        for name, value in self.summary().items():
+            if name in self._summary and self._summary[name] == value:
+                self.summary_skipped += 1
+                continue
+            self.draw_summary(name, value)
+            self._summary[name] = value
+            self.summary_drawn += 1
+
+        now = self.clock()
+        self._last_flush = now
+        self.flushes += 1
+        self.latencies.extend((now - since) * 1000 for since in self._inputs)
+        self._inputs = []
+
+
+class BasketDisplay(UpdateScheduler):
+    """Draws a basket into the till's Treeview and summary labels, once per frame.
+
+    ``tree`` is a ttk.Treeview with name, price, qty and total columns whose
+    rows are keyed by ``BasketLine.key``; ``labels`` maps "savings",
+    "subtotal", "vat" and "total" to the labels showing them. The basket's
+    promotions are rows at the bottom of the tree tagged "promotion";
+    like the labels, only the ones that changed are redrawn. Holds no Tk import,
+    so benchmarks can drive it with stand-in widgets.
+    """
+
+    def __init__(self, basket: Basket, tree, labels: Dict[str, Any], **scheduling):
+        super().__init__(self.draw_rows, self.delete_rows, self.summary_values,
+                         self.draw_summary_value, **scheduling)
+        self.basket = basket
+        self.tree = tree
+        self.labels = labels
+        self.promotion_rows: List[str] = []
+        self._promotions: Tuple[Tuple[str, str], ...] = ()
+
+    def draw_rows(self, lines: List[BasketLine], new: Set[str]):
+        """Insert the new lines' rows above the promotion rows and update the rest in place"""
+        at = self.tree.index(self.promotion_rows[0]) if self.promotion_rows else "end"
+        for line in lines:
+            values = (line.name, f"£{line.price}", line.qty, f"£{line.total}")
+            if line.key in new:
+                self.tree.insert("", at, iid=line.key, values=values)
+                if at != "end":
+                    at += 1
+            else:
+                self.tree.item(line.key, values=values)
+
+    def delete_rows(self, keys: List[str]):
+        self.tree.delete(*keys)
+
+    def summary_values(self) -> Dict[str, Any]:
+        totals = self.basket.totals
+        return {"promotions": tuple((name, str(amount)) for name, amount in self.basket.discounts),
+                "savings": f"Savings: £{totals.discount}",
+                "subtotal": f"Subtotal: £{totals.subtotal}",
+                "vat": f"{vat_heading(totals.rates)}: £{totals.vat}",
+                "total": f"Total: £{totals.total}"}
+
+    def draw_summary_value(self, name: str, value: Any):
+        if name != "promotions":
+            self.labels[name].config(text=value)
+            return
+        for row, promotion, before in zip(self.promotion_rows, value, self._promotions):
+            if promotion != before:
+                self.tree.item(row, values=(promotion[0], "", "", f"-£{promotion[1]}"))
+        if len(value) < len(self.promotion_rows):
+            self.tree.delete(*self.promotion_rows[len(value):])
+            del self.promotion_rows[len(value):]
+        for promotion, amount in value[len(self.promotion_rows):]:
+            self.promotion_rows.append(self.tree.insert("", "end", values=(promotion, "", "", f"-£{amount}"),
+                                                        tags=("promotion",)))
+        self._promotions = value